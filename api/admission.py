@@ -0,0 +1,103 @@
+# api/admission.py
+"""
+推論エンドポイントの入場制御（同時実行数の上限 + 期限つき待ち行列）。
+上限に達したら FIFO で待たせるが、待ち行列が満杯なら 429、
+「前にいる件数 × 1件あたりの処理時間(EWMA) / 同時実行数」で見積もった待ち時間が期限を超えるなら 503 を即返す。
+待っている間に期限が来たものも 503。受け付けたリクエストの待ち時間は期限内に収まる。
+イベントループ上でだけ使う前提（ロック不要）。
+"""
+from __future__ import annotations
+import asyncio, math
+from collections import deque
+from typing import Deque, Optional
+
+
+class Overloaded(Exception):
+    """受け付けない（HTTP status / 理由 / Retry-After 秒）"""
+
+    def __init__(self, status: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status, self.reason = status, reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class AdmissionController:
+    def __init__(self, max_concurrency: int, max_queue: int = 64, default_deadline_ms: float = 1000.0,
+                 alpha: float = 0.2):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_queue = max(0, int(max_queue))
+        self.default_deadline = max(1.0, float(default_deadline_ms)) / 1000.0
+        self.alpha = float(alpha)
+        self.in_flight = 0
+        self.service_ewma = 0.0  # 1件あたりの処理時間（秒）。release ごとに更新
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def deadline_for(self, header: Optional[str]) -> float:
+        """X-Request-Deadline-Ms 相当の値（ミリ秒）→ 秒。無い・不正なら既定"""
+        if header:
+            try:
+                ms = float(header)
+                if ms > 0 and math.isfinite(ms):
+                    return ms / 1000.0
+            except ValueError:
+                pass
+        return self.default_deadline
+
+    def estimate_wait(self, position: int) -> float:
+        """待ち行列の position 番目（1始まり）が枠を得るまでの見積もり秒"""
+        return position * self.service_ewma / self.max_concurrency
+
+    async def acquire(self, deadline: float) -> float:
+        """枠を1つ取る。→ 待った秒数。受け付けられなければ Overloaded"""
+        if self.in_flight < self.max_concurrency and not self._waiters:
+            self.in_flight += 1
+            return 0.0
+        est = self.estimate_wait(len(self._waiters) + 1)
+        if len(self._waiters) >= self.max_queue:
+            raise Overloaded(429, "queue_full", est)
+        if est > deadline:
+            raise Overloaded(503, "deadline", est)
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._waiters.append(fut)
+        t0 = loop.time()
+        try:
+            await asyncio.wait_for(fut, deadline)
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                self._release_slot()  # 期限と同時に枠を受け取っていた。使わないので次へ渡す
+            else:
+                self._drop(fut)
+            raise Overloaded(503, "timeout", self.estimate_wait(len(self._waiters) + 1))
+        except BaseException:  # 切断などでキャンセルされた
+            if fut.done() and not fut.cancelled():
+                self._release_slot()  # 直前に枠を受け取っていたら返す
+            else:
+                self._drop(fut)
+            raise
+        return loop.time() - t0
+
+    def release(self, service_sec: float) -> None:
+        """処理を終えた枠を返し、待っている先頭へ渡す"""
+        a = self.alpha
+        self.service_ewma = service_sec if self.service_ewma == 0.0 else (1 - a) * self.service_ewma + a * service_sec
+        self._release_slot()
+
+    def _release_slot(self) -> None:
+        self.in_flight -= 1
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                self.in_flight += 1  # 枠はそのまま次の人へ
+                fut.set_result(None)
+                break
+
+    def _drop(self, fut: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(fut)
+        except ValueError:
+            pass
@@ -1,40 +1,140 @@
 # api/app.py
-from fastapi import FastAPI, Query, HTTPException
+from fastapi import FastAPI, Query, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from pydantic import BaseModel
-import joblib, pandas as pd, os, time, threading, logging, json, sys
-from datetime import datetime
-from typing import List, Set, Optional
-import boto3
-from botocore.exceptions import BotoCoreError, ClientError
+# joblib / pandas / sklearn / boto3 は使う関数の中で import する（起動を軽くし、/healthz をすぐ返せるように）
+import numpy as np, os, time, threading, json, sys, asyncio, itertools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, replace
+from typing import Any, Dict, FrozenSet, List, Set, Optional, Tuple
+from api.admission import AdmissionController, Overloaded
+from api.batching import MicroBatcher
+from api.cache import PredictionCache, row_key
+from api.fetcher import ModelFetcher, backend_for, link_into_place
+from api.registry import ModelRegistry, valid_name
+from api import streaming
+from api.logwriter import AccessLogSampler, AsyncLogWriter
+from api import metrics as M
+from api import codec
+from api import profiling
 
 MODEL_PATH = os.getenv("MODEL_PATH", "models/model_openml_adult.joblib")
 MODEL_S3_URI = os.getenv("MODEL_S3_URI")
+_MODEL_PATH_CONF = MODEL_PATH  # S3 から取得したモデルを置く場所（/reload?path= で MODEL_PATH が変わっても固定）
+# S3 互換エンドポイント（MinIO 等）/ 取得キャッシュ / 分割サイズと並列数
+MODEL_S3_ENDPOINT_URL = os.getenv("MODEL_S3_ENDPOINT_URL")
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "models/.cache")
+MODEL_FETCH_PART_MB = float(os.getenv("MODEL_FETCH_PART_MB", "8"))
+MODEL_FETCH_WORKERS = int(os.getenv("MODEL_FETCH_WORKERS", "4"))
+# 取得キャッシュに現行の版以外で残す過去の版の数（それより古い実体は新しい版の取得時に消す）
+MODEL_CACHE_KEEP = int(os.getenv("MODEL_CACHE_KEEP", "2"))
+# joblib.load(mmap_mode="r") で配列をファイル写像のまま使う（非圧縮ダンプのみ有効）。
+# ページキャッシュを複数 worker で共有でき、平坦化評価器も <モデル実体>.flat に書き出して同様に写像する
+MODEL_MMAP = os.getenv("MODEL_MMAP", "0") == "1"
+# モデル準備中に返す 503 の Retry-After（秒）
+LOADING_RETRY_AFTER = os.getenv("LOADING_RETRY_AFTER", "1")
+# /models/{name}/... で使う名前付きモデルの置き場（models/model_{name}.joblib）と常駐メモリ予算（0=無制限）
+MODELS_DIR = os.getenv("MODELS_DIR", os.path.dirname(MODEL_PATH) or "models")
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+# /predict_stream で一度にモデルへ通す行数（メモリ上に持つのはこの1チャンク分だけ）
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "1024"))
 LOG_DIR = "logs"
-LOG_FILE = os.path.join(LOG_DIR, f"api-{datetime.now().strftime('%Y%m%d')}.log")
+# アクセスログの間引き（エラーと LOG_SLOW_MS 以上は常に残す）。既定は全件
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1"))
+LOG_SAMPLE_HEALTH = float(os.getenv("LOG_SAMPLE_HEALTH", "1"))
+LOG_SLOW_MS = float(os.getenv("LOG_SLOW_MS", "0"))
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))
+LOG_FLUSH_MS = float(os.getenv("LOG_FLUSH_MS", "500"))
+# 単発 /predict のマイクロバッチ（既定OFF）。上限件数 or 待ち時間窓(ms)で1回の推論にまとめる
+BATCH_ENABLED = os.getenv("BATCH_ENABLED", "0") == "1"
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "32"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "2"))
+# 前処理をロード時に平坦なエンコーダへコンパイルして pandas を経由しない（0 で従来経路）
+FAST_ENCODER = os.getenv("FAST_ENCODER", "1") == "1"
+# HGB の木を配列へ平坦化したベクトル化評価器で predict_proba する（0 で sklearn の predict_proba）
+FLAT_EVAL = os.getenv("FLAT_EVAL", "1") == "1"
+# 推論の入場制御（既定OFF）。同時実行数の上限 / 待ち行列の上限 / 期限（X-Request-Deadline-Ms が無いときの既定 ms）
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "0"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+REQUEST_DEADLINE_MS = float(os.getenv("REQUEST_DEADLINE_MS", "1000"))
+DEADLINE_HEADER = "x-request-deadline-ms"
+# 推論結果キャッシュ（既定OFF）。件数上限 / 概算バイト上限(0=無制限) / TTL秒(0=無期限)
+PRED_CACHE_SIZE = int(os.getenv("PRED_CACHE_SIZE", "0"))
+PRED_CACHE_MAX_BYTES = int(os.getenv("PRED_CACHE_MAX_BYTES", "0"))
+PRED_CACHE_TTL_SEC = float(os.getenv("PRED_CACHE_TTL_SEC", "0"))
+# 差し替え前のウォームアップ入力（{"features": {...}} / {"rows": [...]} の JSON ファイル）。未指定なら全列欠損の1行
+WARMUP_PAYLOAD = os.getenv("WARMUP_PAYLOAD", "")
+# 推論リクエスト起点の自動ロードが失敗したあと、モデルファイル（mtime・サイズ）が変わらなければ再試行しない秒数
+AUTOLOAD_RETRY_SEC = float(os.getenv("AUTOLOAD_RETRY_SEC", "30"))
+# 起動時にモデルを待たない（ローカルにあってもロード・ウォームアップはバックグラウンド）。準備完了は /readyz で見る
+FAST_START = os.getenv("FAST_START", "0") == "1"
+# リクエスト単位のプロファイル（既定OFF。POST /debug/profile で実行中に有効化）。サンプル率 / 遅い順に残すトレース数
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "20"))
 
 app = FastAPI(title="mlops-sklearn-api")
 
-_model = None
-_lock = threading.Lock()
-_REQUIRED_COLS: List[str] = []
-_NUMERIC_COLS: Set[str] = set()
+# ── Prometheus メトリクス（記録はスレッド別シャードへの加算のみ。/metrics で合算）
+_REQ_LATENCY = M.Histogram("app_request_duration_seconds", "HTTP request latency by route template",
+                           ["route", "method", "status"])
+_IN_FLIGHT = M.Gauge("app_requests_in_flight", "Requests currently being processed")
+_INFER_ROWS = M.Histogram("app_inference_batch_rows", "Rows per model inference call", buckets=M.SIZE_BUCKETS)
+_STAGE = M.Histogram("app_inference_stage_seconds", "Inference time by stage (normalize/preprocess/classify)", ["stage"])
+_STAGE_NORMALIZE, _STAGE_PREPROCESS, _STAGE_CLASSIFY = (_STAGE.labels(stage=s) for s in ("normalize", "preprocess", "classify"))
+_MODEL_LOAD = M.Histogram("app_model_load_seconds", "Model load + compile + warm-up duration",
+                          buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60))
+M.Callback("process_resident_memory_bytes", "Resident set size", M.process_rss_bytes)
+M.Callback("process_proportional_memory_bytes", "Proportional set size (shared pages divided among sharers)",
+           M.process_pss_bytes)
+M.Callback("process_start_time_seconds", "Start time of the process since unix epoch", M.process_start_time)
+_PROCESS_START = M.process_start_time()
+_TIME_TO_READY = M.Gauge("app_time_to_ready_seconds", "Process start to first warm model snapshot")
+_TIME_TO_FIRST_PRED = M.Gauge("app_time_to_first_prediction_seconds", "Process start to first successful prediction")
+_first_pred_pending = True
+_SHED = M.Counter("app_admission_shed_total", "Inference requests rejected by admission control", ["reason"])
+_QUEUE_WAIT = M.Histogram("app_admission_queue_wait_seconds", "Time admitted requests waited for an inference slot")
+M.Callback("process_cpu_seconds_total", "User + system CPU time", M.process_cpu_seconds, kind="counter")
+
+
+@dataclass(frozen=True)
+class ModelSnapshot:
+    """推論に必要なものを一式で束ねた不変スナップショット。差し替えは _snap の参照1回の代入で行う"""
+    model: Any
+    path: str
+    model_id: str            # ロードごとに変わる識別子（推論キャッシュのキーに含める）
+    required_cols: Tuple[str, ...]
+    numeric_cols: FrozenSet[str]
+    encoder: Any = None      # compile_preprocessor の結果。対応外モデルなら None
+    flat: Any = None         # export_hgb の結果。HGB 以外なら None
+    loaded_at: float = 0.0
+    load_sec: float = 0.0
 
-# ── JSON 1行ロガー（アプリ側でアクセスログを整形してファイル出力）
-_logger = logging.getLogger("api.access")
-_logger.setLevel(logging.INFO)
-os.makedirs(LOG_DIR, exist_ok=True)
-if not _logger.handlers:
-    fh = logging.FileHandler(LOG_FILE, encoding="utf-8")
-    fh.setFormatter(logging.Formatter("%(message)s"))
-    _logger.addHandler(fh)
 
-    sh = logging.StreamHandler(sys.stdout)
-    sh.setFormatter(logging.Formatter("%(message)s"))
-    _logger.addHandler(sh)
+_snap: Optional[ModelSnapshot] = None
+_load_seq = itertools.count(1)  # model_id の通し番号（既定モデル・レジストリ共通）
+_cache = PredictionCache(PRED_CACHE_SIZE, PRED_CACHE_MAX_BYTES, PRED_CACHE_TTL_SEC) if PRED_CACHE_SIZE > 0 else None
+_lock = threading.Lock()  # ロード（構築〜差し替え）の直列化用。推論側は取らない
+# /reload はリクエスト経路の外（専用スレッド1本）で実行し、状態を /health に出す
+_reload_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reload")
+_reload_state = {"state": "idle", "target": None, "error": None, "started_at": None, "finished_at": None}
+_reload_submit_lock = threading.Lock()
+PREFORK_WORKER = False  # api/serve.py の worker なら True（/reload を受け付けない）
+_autoload = None  # 推論リクエスト起点のバックグラウンドロード（多重に投げない）
+_autoload_from = (None, 0.0)  # 投入時点のモデルファイルの (mtime_ns, size) と時刻（失敗後の再試行判定）
+_fetcher = None
+
+# ── JSON 1行ロガー（logs/api-YYYYMMDD.log と標準出力）。書き込みはバックグラウンドスレッドでまとめて行う
+os.makedirs(LOG_DIR, exist_ok=True)
+_log_writer = AsyncLogWriter(LOG_DIR, "api", sys.stdout, max_queue=LOG_QUEUE_MAX, flush_interval=LOG_FLUSH_MS / 1000)
+_profiler = profiling.Profiler(PROFILE_SAMPLE_RATE, PROFILE_TOP_N)
+_log_sampler = AccessLogSampler(LOG_SAMPLE_RATE, LOG_SAMPLE_HEALTH, LOG_SLOW_MS,
+                                health_paths=("/health", "/healthz", "/readyz"))
 
 def _json_log(**fields):
-    # ensure_ascii=False で日本語もそのまま、1行JSON
-    _logger.info(json.dumps(fields, ensure_ascii=False))
+    # キューに積むだけ（JSON 化とファイル出力はライタースレッド）。満杯なら捨てて drop を数える
+    _log_writer.submit(fields)
 
 def _extract_columns_from_model(model):
     try:
@@ -50,58 +150,186 @@ def _extract_columns_from_model(model):
     except Exception:
         return [], set()
 
+def _compile_encoder(model):
+    if not FAST_ENCODER:
+        return None
+    try:
+        steps = model.steps
+        if len(steps) != 2 or steps[0][0] != "pre":
+            return None
+        from api.encoder import compile_preprocessor  # sklearn ごと読むのでここで
+        enc = compile_preprocessor(steps[0][1])
+    except Exception as e:
+        _json_log(ts=time.time(), event="encoder_compile_failed", err=str(e))
+        return None
+    return enc
+
+def _export_flat(model, path: Optional[str] = None):
+    if not FLAT_EVAL or not hasattr(model, "steps"):
+        return None
+    if MODEL_MMAP and path:
+        cached = _load_flat_mmap(path)
+        if cached is not None:
+            return cached
+    try:
+        from api.flat_hgb import export_hgb
+        flat = export_hgb(model.steps[-1][1])
+    except Exception as e:
+        _json_log(ts=time.time(), event="flat_export_failed", err=str(e))
+        return None
+    if flat is not None and MODEL_MMAP and path:
+        return _store_flat_mmap(flat, path)
+    return flat
+
+def _flat_cache_path(path: str) -> str:
+    # S3 取得分はリンク先（内容アドレスの実体）の隣に置くので、同じ中身なら worker 間・再起動後も使い回せる
+    return os.path.realpath(path) + ".flat"
+
+def _load_flat_mmap(path: str):
+    cache = _flat_cache_path(path)
+    try:
+        if os.path.getmtime(cache) < os.path.getmtime(os.path.realpath(path)):
+            return None  # モデルの方が新しい（上書きされた）
+        import joblib
+        return joblib.load(cache, mmap_mode="r")
+    except (OSError, ValueError, EOFError):
+        return None
+
+def _store_flat_mmap(flat, path: str):
+    """非圧縮で書き出して読み直す（配列がファイル写像になる）。書けなければプロセス内の flat をそのまま使う"""
+    cache = _flat_cache_path(path)
+    tmp = f"{cache}.{os.getpid()}.tmp"
+    try:
+        import joblib
+        joblib.dump(flat, tmp)
+        os.replace(tmp, cache)  # 同時に書く worker がいても読み手は完成品しか見ない
+        return joblib.load(cache, mmap_mode="r")
+    except OSError as e:
+        _json_log(ts=time.time(), event="flat_mmap_failed", err=str(e))
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        return flat
+
+def _warmup_rows(snap: ModelSnapshot) -> List[dict]:
+    if WARMUP_PAYLOAD and os.path.exists(WARMUP_PAYLOAD):
+        with open(WARMUP_PAYLOAD, encoding="utf-8") as f:
+            payload = json.load(f)
+        if isinstance(payload, dict) and "rows" in payload:
+            return list(payload["rows"])
+        if isinstance(payload, dict) and "features" in payload:
+            return [payload["features"]]
+        return payload if isinstance(payload, list) else [payload]
+    # 既定は全列欠損の1行（Imputer を通って推論できるはず）。列情報の無いモデルは検証を省く
+    return [{}] if snap.required_cols else []
+
+def _build_snapshot(path: str, seq: int) -> ModelSnapshot:
+    """ロード → コンパイル → ウォームアップ推論で検証。失敗したら例外（現行スナップショットは無傷）"""
+    import joblib
+    t0 = time.perf_counter()
+    model = joblib.load(path, mmap_mode="r" if MODEL_MMAP else None)
+    required, numeric = _extract_columns_from_model(model)
+    snap = ModelSnapshot(
+        model=model, path=path, model_id=f"{os.path.basename(path)}#{seq}",
+        required_cols=tuple(required), numeric_cols=frozenset(numeric),
+        encoder=_compile_encoder(model), flat=_export_flat(model, path),
+    )
+    rows = _warmup_rows(snap)
+    if rows:
+        _key, out = _infer(rows, snap, record=False)  # ウォームアップは推論メトリクスに数えない
+        if len(out) != len(rows):
+            raise ValueError(f"warm-up returned {len(out)} predictions for {len(rows)} rows")
+        if out.dtype.kind == "f" and not np.isfinite(out).all():
+            raise ValueError("warm-up produced non-finite predictions")
+    el = time.perf_counter() - t0
+    _MODEL_LOAD.observe(el)
+    return replace(snap, loaded_at=time.time(), load_sec=el)
+
 def load_model(path: str):
-    global _model, _REQUIRED_COLS, _NUMERIC_COLS, MODEL_PATH
+    global _snap, MODEL_PATH
     with _lock:
-        _model = joblib.load(path)
+        snap = _build_snapshot(path, next(_load_seq))
+        _snap = snap  # 参照1回の差し替え。処理中のリクエストは旧スナップショットのまま完走する
         MODEL_PATH = path  # 実際に読んだものを現在値に
-        _REQUIRED_COLS, _NUMERIC_COLS = _extract_columns_from_model(_model)
-    return _model
+        if _cache is not None:
+            _cache.clear()  # キーに model_id を含むので旧結果は当たらないが、メモリを返す
+        first = _TIME_TO_READY.get() == 0.0
+        if first:
+            _TIME_TO_READY.set(time.time() - _PROCESS_START)
+    _json_log(ts=time.time(), event="model_loaded", model=os.path.basename(path), load_ms=int(snap.load_sec * 1000),
+              **({"since_start_ms": int(_TIME_TO_READY.get() * 1000)} if first else {}))
+    return snap.model
+
+def _after_fork_in_child():
+    # prefork（api/serve.py）の worker では親の boto3 クライアント（接続プール）を使い回さない
+    global _fetcher
+    _fetcher = None
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+def _get_fetcher():
+    global _fetcher
+    if _fetcher is None and MODEL_S3_URI:
+        _fetcher = ModelFetcher(backend_for(MODEL_S3_URI, MODEL_S3_ENDPOINT_URL), MODEL_CACHE_DIR,
+                                part_size=int(MODEL_FETCH_PART_MB * (1 << 20)), max_workers=MODEL_FETCH_WORKERS,
+                                keep=MODEL_CACHE_KEEP)
+    return _fetcher
 
 def _ensure_model_local():
-    """MODEL_PATH がローカルに無い場合、MODEL_S3_URI から取得を試みる。無ければ何もしない。"""
-    path = MODEL_PATH
-    if os.path.exists(path):
-        return path
-    if MODEL_S3_URI:
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        try:
-            s3 = boto3.client("s3")
-            # s3://<BUCKET>/key を分解
-            if not MODEL_S3_URI.startswith("s3://"):
-                return None
-            _, _, rest = MODEL_S3_URI.partition("s3://")
-            bucket, _, key = rest.partition("/")
-            s3.download_file(bucket, key, path)
-            return path if os.path.exists(path) else None
-        except (BotoCoreError, ClientError) as e:
-            _json_log(ts=time.time(), event="model_download_failed", s3=MODEL_S3_URI, err=str(e))
-            return None
-    return None
+    """MODEL_S3_URI があれば ETag 条件付きで取得してキャッシュ実体を配置先へリンク、無ければ MODEL_PATH。
+    ダウンロードを伴うので、バックグラウンドのロードスレッドからだけ呼ぶ。用意できなければ None"""
+    fetcher = _get_fetcher()
+    if fetcher is None:
+        return MODEL_PATH if os.path.exists(MODEL_PATH) else None
+    from botocore.exceptions import BotoCoreError, ClientError
+    path = _MODEL_PATH_CONF
+    try:
+        res = fetcher.fetch(MODEL_S3_URI)
+        link_into_place(res.path, path)
+    except (BotoCoreError, ClientError, OSError, ValueError) as e:
+        _json_log(ts=time.time(), event="model_download_failed", s3=MODEL_S3_URI, err=str(e))
+        return path if os.path.exists(path) else None
+    _json_log(ts=time.time(), event="model_fetched", s3=MODEL_S3_URI, sha256=res.sha256, downloaded=res.downloaded)
+    return path
 
-def _normalize_batch(rows: List[dict]) -> pd.DataFrame:
+def _normalize_batch(rows: List[dict], snap: Optional[ModelSnapshot] = None) -> "pd.DataFrame":
     # rows: [{col: val, ...}, ...]
-    if not _REQUIRED_COLS:
+    import pandas as pd  # 従来経路（コンパイル済みエンコーダが使えないモデル）だけで使う
+    snap = snap or _snap
+    required = list(snap.required_cols) if snap is not None else []
+    if not required:
         return pd.DataFrame(rows)
     df = pd.DataFrame(rows)
-    # 余計な列は捨て、足りない列は None を補完
-    for col in _REQUIRED_COLS:
+    # 余計な列は捨て、足りない列は NaN を補完
+    for col in required:
         if col not in df.columns:
-            df[col] = None
-    df = df[_REQUIRED_COLS]
+            df[col] = np.nan
+    df = df[required]
+    # None も NaN に揃える（pandas はバッチの中身次第で None を残すため、欠損扱いが揺れる）
+    df = df.where(df.notna(), np.nan)
     # 数値列は to_numeric で NaN 許容（Imputer が面倒を見る）
-    for col in _NUMERIC_COLS:
+    for col in snap.numeric_cols:
         if col in df.columns:
             df[col] = pd.to_numeric(df[col], errors="coerce")
+    # カテゴリ列がバッチ内で全欠損だと float 列になる。OrdinalEncoder は学習時の文字列カテゴリと比べられないので object に戻す
+    numeric = set(snap.numeric_cols)
+    for col in required:
+        if col not in numeric and df[col].dtype.kind in "biuf":
+            df[col] = df[col].astype(object)
     return df
 
 def _health_payload():
+    snap = _snap
     return {
         "status": "ok",
         "model": os.path.basename(MODEL_PATH),
         "ts": time.time(),
-        "cols": len(_REQUIRED_COLS) or None,
+        "cols": len(snap.required_cols) if snap is not None and snap.required_cols else None,
         "model_exists": os.path.exists(MODEL_PATH),
+        "model_id": snap.model_id if snap is not None else None,
+        "reload": dict(_reload_state),
+        "pid": os.getpid(),
     }
 
 class Row(BaseModel):
@@ -110,21 +338,67 @@ class Row(BaseModel):
 class Rows(BaseModel):
     rows: List[dict]
 
+class ColumnBatch(BaseModel):
+    columns: Dict[str, List[Any]]
+
+# 推論エンドポイントは本文を codec で直接デコードする（pydantic は OpenAPI の表示用）
+def _body_schema(*models) -> dict:
+    schema = models[0].model_json_schema() if len(models) == 1 else {"oneOf": [m.model_json_schema() for m in models]}
+    return {"requestBody": {"required": True, "content": {"application/json": {"schema": schema}}}}
+
+def _decode_features(body: bytes) -> dict:
+    try:
+        features = codec.decode_features(body)
+    except codec.PayloadError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    profiling.mark("decode")  # 本文の受信を含む
+    return features
+
+def _predict_batch_body(body: bytes, snap: "ModelSnapshot") -> bytes:
+    """本文 bytes → 列バッファ → 推論 → 応答 bytes（スレッドプールで実行）"""
+    profiling.mark("queue")  # 本文の受信 + スレッドプール待ち
+    try:
+        cols = codec.decode_batch(body, snap.required_cols, snap.numeric_cols)
+    except codec.PayloadError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    profiling.mark("decode")
+    if _cache is None:
+        key, out = _infer(cols, snap)
+    else:
+        key, out = _infer_cached(cols.to_rows(), snap)
+        out = np.asarray(out)
+    data = codec.encode_predictions(key, out)
+    profiling.mark("encode")
+    return data
+
 @app.on_event("startup")
 def _startup():
     # 起動時は“可能なら”モデルを用意。失敗してもアプリは起動継続。
-    local = _ensure_model_local()
-    if local:
+    # ローカルにあれば即ロード、無ければ S3 取得ごとバックグラウンドに回し、その間の推論は 503
+    if _snap is not None and _snap.path == MODEL_PATH:
+        pass  # api/serve.py の親プロセスでロード済み（fork で共有）。読み直すと共有が崩れる
+    elif FAST_START and (MODEL_S3_URI or os.path.exists(MODEL_PATH)):
+        # 待たずに起動完了。/healthz は即応答、/readyz はウォームアップ後に 200
+        with _reload_submit_lock:
+            _submit_autoload()  # 推論リクエストからの自動ロードと二重にしない
+    elif os.path.exists(MODEL_PATH):
         try:
-            load_model(local)
+            load_model(MODEL_PATH)
         except FileNotFoundError:
             pass
-    _json_log(ts=time.time(), event="startup", model=os.path.basename(MODEL_PATH), exists=os.path.exists(MODEL_PATH))
+    elif MODEL_S3_URI:
+        with _reload_submit_lock:
+            _submit_autoload()
+    _json_log(ts=time.time(), event="startup", model=os.path.basename(MODEL_PATH), exists=os.path.exists(MODEL_PATH),
+              since_start_ms=int((time.time() - _PROCESS_START) * 1000), fast_start=FAST_START)
 
 
 @app.middleware("http")
 async def access_log(request, call_next):
     t0 = time.time()
+    p0 = time.perf_counter()
+    _IN_FLIGHT.inc()
+    prof = _profiler.start() if _profiler.sample_rate else None
     try:
         resp = await call_next(request)
         status = resp.status_code
@@ -132,20 +406,41 @@ async def access_log(request, call_next):
         status = 500
         raise
     finally:
+        _IN_FLIGHT.dec()
         t1 = time.time()
-        _json_log(
-            ts=t1,
-            method=request.method,
-            path=request.url.path,
-            query=str(request.url.query),
-            status=status,
-            latency_ms=int((t1 - t0) * 1000),
-            client=getattr(request.client, "host", None),
-            ua=request.headers.get("user-agent"),
-            model=os.path.basename(MODEL_PATH),
-        )
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        _REQ_LATENCY.labels(route, request.method, status).observe(time.perf_counter() - p0)
+        if prof is not None:
+            _profiler.finish(prof, f"{request.method} {route}", status)
+        if _first_pred_pending and status < 300 and "predict" in route:
+            _record_first_prediction()
+        path = request.url.path
+        latency_ms = int((t1 - t0) * 1000)
+        rate = _log_sampler.rate_for(path, status, latency_ms)
+        if _log_sampler.keep(rate):
+            _json_log(
+                ts=t1,
+                method=request.method,
+                path=path,
+                query=str(request.url.query),
+                status=status,
+                latency_ms=latency_ms,
+                client=getattr(request.client, "host", None),
+                ua=request.headers.get("user-agent"),
+                model=os.path.basename(MODEL_PATH),
+                **({"sample_rate": rate} if rate < 1.0 else {}),
+            )
+        else:
+            _log_writer.sampled_out += 1
     return resp
 
+def _record_first_prediction():
+    global _first_pred_pending
+    _first_pred_pending = False
+    sec = time.time() - _PROCESS_START
+    _TIME_TO_FIRST_PRED.set(sec)
+    _json_log(ts=time.time(), event="first_prediction", since_start_ms=int(sec * 1000))
+
 @app.get("/health")
 def health():
     return _health_payload()
@@ -154,45 +449,307 @@ def health():
 def healthz():
     return _health_payload()
 
+@app.get("/readyz")
+def readyz():
+    # liveness（/healthz）とは別。ウォームアップ済みスナップショットが公開されるまで 503（ALB はこれで振り分ける）
+    snap = _snap
+    if snap is None:
+        return JSONResponse({"ready": False, "reload": dict(_reload_state)}, status_code=503)
+    return {"ready": True, "model_id": snap.model_id, "loaded_at": snap.loaded_at}
+
 @app.get("/schema")
 def schema():
-    return {"required_columns": _REQUIRED_COLS, "numeric_columns": sorted(_NUMERIC_COLS)}
-
-@app.post("/predict")
-def predict(item: Row):
-    if _model is None:
-        local = _ensure_model_local()
-        if not local:
-            raise HTTPException(status_code=503, detail="Model not available")
-        load_model(local)
-    X = _normalize_batch([item.features])
-    proba = getattr(_model, "predict_proba", None)
-    if proba:
-        return {"pred_proba": float(proba(X)[:, 1][0])}
-    return {"pred": _model.predict(X)[0]}
-
-@app.post("/predict_batch")
-def predict_batch(items: Rows):
-    if _model is None:
-        local = _ensure_model_local()
-        if not local:
-            raise HTTPException(status_code=503, detail="Model not available")
-        load_model(local)
-    X = _normalize_batch(items.rows)
-    proba = getattr(_model, "predict_proba", None)
-    if proba:
-        return {"pred_proba": [float(x) for x in proba(X)[:, 1].tolist()]}
-    return {"pred": _model.predict(X).tolist()}
+    snap = _snap
+    if snap is None:
+        return {"required_columns": [], "numeric_columns": []}
+    return {"required_columns": list(snap.required_cols), "numeric_columns": sorted(snap.numeric_cols)}
+
+def _require_model():
+    """モデル未ロードならバックグラウンドでロードを開始し、待たずに 503 を返す（ダウンロードで塞がない）"""
+    if _snap is not None:
+        return
+    if not MODEL_S3_URI and not os.path.exists(MODEL_PATH):
+        raise HTTPException(status_code=503, detail="Model not available")
+    with _reload_submit_lock:
+        fut = _autoload
+        if fut is not None and fut.done() and fut.exception() is not None:
+            # 壊れたモデルをリクエストの頻度で読み直さない。ファイルが変わるか AUTOLOAD_RETRY_SEC 経つまで待つ
+            sig, at = _autoload_from
+            if _model_file_sig() == sig and time.monotonic() - at < AUTOLOAD_RETRY_SEC:
+                raise HTTPException(status_code=503, detail="Model load failed",
+                                    headers={"Retry-After": str(int(AUTOLOAD_RETRY_SEC))})
+        if fut is None or fut.done():
+            _submit_autoload()
+    raise HTTPException(status_code=503, detail="Model loading", headers={"Retry-After": LOADING_RETRY_AFTER})
+
+def _model_file_sig():
+    try:
+        st = os.stat(MODEL_PATH)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _submit_autoload():
+    # _reload_submit_lock の中で呼ぶ
+    global _autoload, _autoload_from
+    _autoload_from = (_model_file_sig(), time.monotonic())
+    _autoload = _submit_reload(None)
+
+def _infer(rows: List[dict], snap: Optional[ModelSnapshot] = None, record: bool = True):
+    """rows → ("pred_proba", 陽性確率) or ("pred", 予測ラベル)。snap は呼び出し時点のものを1回だけ読む。
+    record=False（ウォームアップ）は行数・段ごとの時間を記録しない"""
+    snap = snap or _snap
+    model, encoder, flat = snap.model, snap.encoder, snap.flat
+    tr = profiling.current() if record else None  # サンプル中のリクエストだけ区間を記録（無効時は None）
+    if record:
+        _INFER_ROWS.observe(len(rows))
+    t0 = time.perf_counter()
+    if encoder is not None:  # 正規化も込みで1段。正規化の分はエンコーダが測って返す
+        X, norm = (encoder.transform_columns_timed(rows.data, rows.n) if isinstance(rows, codec.Columns)
+                   else encoder.transform_timed(rows))
+        if record:
+            _STAGE_NORMALIZE.observe(norm)
+        t0 += norm  # preprocess には正規化を含めない
+    else:
+        X = _normalize_batch(rows.data if isinstance(rows, codec.Columns) else rows, snap)
+        t1 = time.perf_counter()
+        if record:
+            _STAGE_NORMALIZE.observe(t1 - t0)
+        if tr is not None:
+            tr.mark("normalize")
+        t0 = t1
+        if hasattr(model, "steps"):
+            X = model[:-1].transform(X)
+    t1 = time.perf_counter()
+    if record:
+        _STAGE_PREPROCESS.observe(t1 - t0)
+    if tr is not None:
+        tr.mark("preprocess")
+    est = flat if flat is not None else (model.steps[-1][1] if hasattr(model, "steps") else model)
+    if hasattr(est, "predict_proba"):
+        out = ("pred_proba", est.predict_proba(X)[:, 1])
+    else:
+        out = ("pred", est.predict(X))
+    if record:
+        _STAGE_CLASSIFY.observe(time.perf_counter() - t1)
+    if tr is not None:
+        tr.mark("classify")
+    return out
+
+def _infer_cached(rows: List[dict], snap: Optional[ModelSnapshot] = None):
+    """_infer のキャッシュ付き版。→ (キー名, 行ごとの値 list)。キャッシュ無効なら素通し"""
+    snap = snap or _snap
+    if _cache is None:
+        key, out = _infer(rows, snap)
+        return key, out.tolist()
+    keys = [(snap.model_id, row_key(r, snap.required_cols, snap.numeric_cols)) for r in rows]
+    cached = _cache.get_many(keys)
+    profiling.mark("cache")
+    miss = [i for i, c in enumerate(cached) if c is None]
+    if rows and not miss:
+        return cached[0][0], [c[1] for c in cached]
+    key, out = _infer([rows[i] for i in miss] if len(miss) < len(rows) else rows, snap)
+    fresh = [(key, v) for v in out.tolist()]
+    _cache.put_many((keys[i], fv) for i, fv in zip(miss, fresh))
+    for i, fv in zip(miss, fresh):
+        cached[i] = fv
+    return key, [c[1] for c in cached]
+
+def _predict_rows(rows: List[dict], snap: Optional[ModelSnapshot] = None) -> List[dict]:
+    """rows をまとめて推論し、行ごとのレスポンス dict を返す（マイクロバッチからも呼ぶ）"""
+    profiling.mark("queue")  # スレッドプール待ち（マイクロバッチ経由ならトレース外）
+    key, out = _infer_cached(rows, snap)
+    return [{key: v} for v in out]
+
+_batcher = MicroBatcher(_predict_rows, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS) if BATCH_ENABLED else None
+
+_admission = (AdmissionController(ADMISSION_MAX_CONCURRENCY, ADMISSION_MAX_QUEUE, REQUEST_DEADLINE_MS)
+              if ADMISSION_MAX_CONCURRENCY > 0 else None)
+M.Callback("app_admission_in_flight", "Inference requests holding a slot",
+           lambda: _admission.in_flight if _admission is not None else 0)
+M.Callback("app_admission_queue_depth", "Inference requests waiting for a slot",
+           lambda: _admission.queue_depth if _admission is not None else 0)
+M.Callback("app_admission_service_seconds_ewma", "EWMA of slot hold time used to estimate queue wait",
+           lambda: _admission.service_ewma if _admission is not None else 0)
+
+@asynccontextmanager
+async def _admitted(request: Request):
+    """推論1件分の枠を取る。見積もり待ちが期限を超える・待ち行列が満杯なら即 503 / 429（Retry-After 付き）"""
+    adm = _admission
+    if adm is None:
+        yield
+        return
+    try:
+        waited = await adm.acquire(adm.deadline_for(request.headers.get(DEADLINE_HEADER)))
+    except Overloaded as e:
+        _SHED.labels(reason=e.reason).inc()
+        raise HTTPException(status_code=e.status, detail=f"Overloaded ({e.reason})",
+                            headers={"Retry-After": str(e.retry_after)})
+    _QUEUE_WAIT.observe(waited)
+    profiling.mark("admission")
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        adm.release(time.perf_counter() - t0)
+
+@app.on_event("startup")
+async def _start_batcher():
+    if _batcher is not None:
+        _batcher.start()
+
+@app.on_event("shutdown")
+async def _stop_batcher():
+    if _batcher is not None:
+        await _batcher.stop()
+
+@app.post("/predict", openapi_extra=_body_schema(Row))
+async def predict(request: Request):
+    if _snap is None:
+        _require_model()
+    features = _decode_features(await request.body())
+    async with _admitted(request):
+        if _batcher is not None:
+            res = await _batcher.submit(features)
+            profiling.mark("batch")  # キュー待ち + まとめた推論
+            return res
+        return (await run_in_threadpool(_predict_rows, [features]))[0]
+
+@app.post("/predict_batch", openapi_extra=_body_schema(Rows, ColumnBatch))
+async def predict_batch(request: Request):
+    _require_model()
+    body = await request.body()
+    async with _admitted(request):
+        return Response(await run_in_threadpool(_predict_batch_body, body, _snap), media_type="application/json")
+
+# ── 名前付きモデル（/models/{name}/...）。初回アクセスで遅延ロード、予算超過で LRU 追い出し
+def _resolve_model_name(name: str) -> Optional[str]:
+    path = os.path.join(MODELS_DIR, f"model_{name}.joblib")
+    return path if os.path.exists(path) else None
+
+def _available_model_names() -> List[str]:
+    try:
+        files = os.listdir(MODELS_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted(f[len("model_"):-len(".joblib")] for f in files
+                  if f.startswith("model_") and f.endswith(".joblib"))
+
+_registry = ModelRegistry(lambda path: _build_snapshot(path, next(_load_seq)), _resolve_model_name,
+                          memory_budget=int(MODEL_MEMORY_BUDGET_MB * (1 << 20)))
+
+def _get_named(name: str) -> ModelSnapshot:
+    if not valid_name(name):
+        raise HTTPException(status_code=404, detail=f"Unknown model: {name}")
+    try:
+        return _registry.get(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown model: {name}")
+
+@app.get("/models")
+def list_models():
+    st = _registry.stats()
+    names = sorted(set(_available_model_names()) | set(st["models"]))
+    return {
+        "models": [{"name": n, **st["models"].get(n, {"loaded": False})} for n in names],
+        "resident_bytes": st["resident_bytes"],
+        "memory_budget": st["memory_budget"],
+    }
+
+@app.get("/models/{name}/schema")
+def model_schema(name: str):
+    snap = _get_named(name)
+    return {"required_columns": list(snap.required_cols), "numeric_columns": sorted(snap.numeric_cols)}
+
+@app.post("/models/{name}/predict", openapi_extra=_body_schema(Row))
+async def model_predict(name: str, request: Request):
+    features = _decode_features(await request.body())
+    snap = await run_in_threadpool(_get_named, name)
+    async with _admitted(request):
+        return (await run_in_threadpool(_predict_rows, [features], snap))[0]
+
+@app.post("/models/{name}/predict_batch", openapi_extra=_body_schema(Rows, ColumnBatch))
+async def model_predict_batch(name: str, request: Request):
+    body = await request.body()
+    snap = await run_in_threadpool(_get_named, name)
+    async with _admitted(request):
+        return Response(await run_in_threadpool(_predict_batch_body, body, snap), media_type="application/json")
+
+_stream_stats = streaming.StreamStats()
+
+@app.post("/predict_stream")
+async def predict_stream(request: Request, model: Optional[str] = Query(None, description="名前付きモデル（省略時は既定モデル）")):
+    """NDJSON（1行1特徴量オブジェクト）か Arrow IPC stream を受け、チャンクごとに推論結果を流して返す"""
+    if model is not None:
+        snap = await run_in_threadpool(_get_named, model)
+    else:
+        _require_model()
+        snap = _snap
+    ctype = request.headers.get("content-type", streaming.NDJSON_TYPE).split(";")[0].strip()
+    infer = lambda rows: _infer(rows, snap)
+    if ctype == streaming.ARROW_TYPE:
+        if await run_in_threadpool(streaming.load_pyarrow) is None:  # 初回だけ import（起動時には読まない）
+            raise HTTPException(status_code=415, detail="Arrow input requires pyarrow (pip install .[arrow])")
+        gen = streaming.arrow_stream(request.stream(), infer, STREAM_CHUNK_ROWS, _stream_stats)
+        return streaming.DuplexStreamingResponse(gen, media_type=streaming.ARROW_TYPE)
+    gen = streaming.ndjson_stream(request.stream(), infer, STREAM_CHUNK_ROWS, _stream_stats)
+    return streaming.DuplexStreamingResponse(gen, media_type=streaming.NDJSON_TYPE)
+
+def _reload_job(target: Optional[str]):
+    # target 無し = S3 から（変更があれば）取得し直すか、現行 MODEL_PATH を読み直す
+    _reload_state.update(state="loading", target=target, error=None, started_at=time.time(), finished_at=None)
+    try:
+        target = target or _ensure_model_local()
+        if not target:
+            raise FileNotFoundError("Model not available")
+        _reload_state["target"] = target
+        load_model(target)
+    except Exception as e:
+        _reload_state.update(state="failed", error=str(e), finished_at=time.time())
+        _json_log(ts=time.time(), event="reload_failed", model=os.path.basename(target or MODEL_PATH), err=str(e))
+        raise
+    _reload_state.update(state="ok", finished_at=time.time())
+
+def _submit_reload(target: Optional[str]):
+    _reload_state.update(state="loading", target=target, error=None)  # 投入時点で loading にして多重投入を防ぐ
+    return _reload_executor.submit(_reload_job, target)
 
 @app.post("/reload")
-def reload_model(path: Optional[str] = Query(None, description="モデルファイルへのパス")):
-    # ?path=... があればそれを優先、無ければ現行 MODEL_PATH を再読込
-    target = path or _ensure_model_local() or MODEL_PATH
-    load_model(target)
-    return {"status": "reloaded", "model": os.path.basename(MODEL_PATH)}
+async def reload_model(path: Optional[str] = Query(None, description="モデルファイルへのパス"),
+                       wait: bool = Query(False, description="true なら差し替え完了まで待って結果を返す")):
+    # ?path=... があればそれを優先、無ければ現行 MODEL_PATH を再読込。
+    # ロード・ウォームアップは別スレッドで行い、推論は完了まで旧スナップショットで継続
+    if PREFORK_WORKER:
+        # 差し替わるのは受けた worker だけで、他の worker は旧モデルのまま残る。prefork では再起動で入れ替える
+        raise HTTPException(status_code=409, detail="reload is not supported in prefork mode; restart api.serve")
+    fut = _submit_reload(path)
+    if not wait:
+        return JSONResponse({"status": "accepted", "model": os.path.basename(path or MODEL_PATH)}, status_code=202)
+    try:
+        await asyncio.wrap_future(fut)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"reload failed: {e}")
+    return {"status": "reloaded", "model": os.path.basename(MODEL_PATH), "model_id": _snap.model_id}
 
 # api/app.py の末尾あたりに追加（既存コードは触らない）
 import time, os
+# ── プロファイル（ワーカープロセスごと。有効化すると集計をリセット）
+@app.get("/debug/profile")
+def debug_profile():
+    return _profiler.report()
+
+@app.post("/debug/profile")
+def debug_profile_start(sample_rate: float = Query(1.0, gt=0.0, le=1.0),
+                        top: int = Query(PROFILE_TOP_N, ge=0, le=1000)):
+    _profiler.configure(sample_rate, top)
+    return _profiler.report()
+
+@app.delete("/debug/profile")
+def debug_profile_stop():
+    report = _profiler.report()  # 止める直前の集計を返して破棄
+    _profiler.configure(0.0)
+    return report
+
 START_TS = time.time()
 VERSION = os.getenv("VERSION", "0.0.0-dev")
 GIT_SHA = os.getenv("GIT_SHA", "0000000")
@@ -203,6 +760,69 @@ def metrics():
         f'app_version_info{{version="{VERSION}",git_sha="{GIT_SHA}"}} 1',
         f'app_uptime_seconds {int(time.time() - START_TS)}',
         f'app_model_exists {1 if os.path.exists(MODEL_PATH) else 0}',
-        f'app_required_cols {len(_REQUIRED_COLS) or 0}',
+        f'app_required_cols {len(_snap.required_cols) if _snap is not None else 0}',
+    ]
+    if _batcher is not None:
+        lines += _batcher_metric_lines(_batcher.stats())
+    lines += _registry_metric_lines(_registry.stats())
+    lw = _log_writer.stats()
+    lines += [
+        f'app_log_records_total{{result="written"}} {lw["written"]}',
+        f'app_log_records_total{{result="dropped"}} {lw["dropped"]}',
+        f'app_log_records_total{{result="sampled_out"}} {lw["sampled_out"]}',
+        f'app_log_records_total{{result="failed"}} {lw["failed"]}',
+        f'app_log_records_total{{result="unserializable"}} {lw["unserializable"]}',
+        f'app_log_write_errors_total {lw["errors"]}',
+        f'app_log_queue_depth {lw["queue_depth"]}',
+    ]
+    ss = _stream_stats
+    lines += [
+        f'app_stream_requests_total {ss.requests}',
+        f'app_stream_rows_total {ss.rows}',
+        f'app_stream_row_errors_total {ss.errors}',
+        f'app_stream_seconds_total {ss.seconds:.6f}',
+    ]
+    if _cache is not None:
+        st = _cache.stats()
+        lines += [
+            f'app_pred_cache_hits_total {st["hits"]}',
+            f'app_pred_cache_misses_total {st["misses"]}',
+            f'app_pred_cache_evictions_total {st["evictions"]}',
+            f'app_pred_cache_expirations_total {st["expirations"]}',
+            f'app_pred_cache_entries {st["entries"]}',
+            f'app_pred_cache_bytes {st["bytes"]}',
+        ]
+    return PlainTextResponse(M.REGISTRY.render() + "\n".join(lines) + "\n", media_type=M.CONTENT_TYPE)
+
+def _batcher_metric_lines(st: dict) -> List[str]:
+    lines, cum = [], 0
+    for le, n in st["size_buckets"].items():
+        cum += n
+        lines.append(f'app_batch_size_bucket{{le="{le}"}} {cum}')
+    lines += [
+        f'app_batch_size_sum {st["rows"]}',
+        f'app_batch_size_count {st["flushes"]}',
+        f'app_batch_queue_wait_seconds_sum {st["queue_wait_sum"]:.6f}',
+        f'app_batch_queue_wait_seconds_count {st["rows"]}',
+        f'app_batch_queue_wait_seconds_max {st["queue_wait_max"]:.6f}',
+        f'app_batch_queue_depth {st["queue_depth"]}',
+    ]
+    return lines
+
+def _registry_metric_lines(st: dict) -> List[str]:
+    lines = [
+        f'app_registry_resident_bytes {st["resident_bytes"]}',
+        f'app_registry_memory_budget_bytes {st["memory_budget"]}',
+        f'app_registry_evictions_total {st["evictions"]}',
     ]
-    return FastAPI.responses.PlainTextResponse("\n".join(lines))
+    for name, m in st["models"].items():
+        lab = f'model="{name}"'
+        lines += [
+            f'app_registry_model_loaded{{{lab}}} {1 if m["loaded"] else 0}',
+            f'app_registry_model_resident_bytes{{{lab}}} {m["resident_bytes"]}',
+            f'app_registry_model_requests_total{{{lab},result="hit"}} {m["hits"]}',
+            f'app_registry_model_requests_total{{{lab},result="miss"}} {m["misses"]}',
+        ]
+        if m["load_sec"] is not None:
+            lines.append(f'app_registry_model_load_seconds{{{lab}}} {m["load_sec"]:.6f}')
+    return lines
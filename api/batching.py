@@ -0,0 +1,119 @@
+# api/batching.py
+"""
+単発 /predict を非同期キューに溜め、サイズ上限 or 待ち時間窓で 1 回の推論にまとめる。
+推論関数は rows(list) -> 結果(list) の同期関数。スレッドプールで実行する。
+"""
+from __future__ import annotations
+import asyncio, time
+from typing import Any, Callable, List, Optional, Sequence
+
+# バッチサイズ分布のバケット（Prometheus の le と同じ累積表現で出す）
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class MicroBatcher:
+    def __init__(self, predict_fn: Callable[[List[Any]], Sequence[Any]],
+                 max_batch: int = 32, max_wait_ms: float = 2.0):
+        self.predict_fn = predict_fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # カウンタ（イベントループ上でしか触らないのでロック不要）
+        self.flushes = 0
+        self.rows = 0
+        self.size_buckets = [0] * (len(BATCH_SIZE_BUCKETS) + 1)  # 末尾は +Inf
+        self.wait_sum = 0.0
+        self.wait_max = 0.0
+
+    # ── ライフサイクル（startup/shutdown から呼ぶ）
+    def start(self) -> None:
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, row: Any) -> Any:
+        if self._queue is None:
+            self.start()
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((row, fut, time.perf_counter()))
+        return await fut
+
+    # ── 集約ループ
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                # 既に溜まっている分は待たずに回収
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(batch)
+
+    async def _flush(self, batch) -> None:
+        now = time.perf_counter()
+        rows = [row for row, _fut, _t in batch]
+        self._record(len(batch), [now - t for _row, _fut, t in batch])
+        try:
+            results = await asyncio.to_thread(self.predict_fn, rows)
+        except Exception:
+            # 1件の不正入力でバッチ全体を落とさないよう、1件ずつやり直して失敗を局所化
+            for row, fut, _t in batch:
+                try:
+                    res = await asyncio.to_thread(self.predict_fn, [row])
+                    _set_result(fut, res[0])
+                except Exception as e:
+                    _set_exception(fut, e)
+            return
+        for (_row, fut, _t), res in zip(batch, results):
+            _set_result(fut, res)
+
+    def _record(self, size: int, waits: List[float]) -> None:
+        self.flushes += 1
+        self.rows += size
+        for i, le in enumerate(BATCH_SIZE_BUCKETS):
+            if size <= le:
+                self.size_buckets[i] += 1
+                break
+        else:
+            self.size_buckets[-1] += 1
+        self.wait_sum += sum(waits)
+        self.wait_max = max(self.wait_max, max(waits))
+
+    def stats(self) -> dict:
+        return {
+            "flushes": self.flushes,
+            "rows": self.rows,
+            "size_buckets": dict(zip(BATCH_SIZE_BUCKETS + ("+Inf",), self.size_buckets)),
+            "queue_wait_sum": self.wait_sum,
+            "queue_wait_max": self.wait_max,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+
+def _set_result(fut: asyncio.Future, value) -> None:
+    if not fut.done():  # 呼び出し側がキャンセル済みなら捨てる
+        fut.set_result(value)
+
+
+def _set_exception(fut: asyncio.Future, exc: BaseException) -> None:
+    if not fut.done():
+        fut.set_exception(exc)
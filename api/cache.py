@@ -0,0 +1,110 @@
+# api/cache.py
+"""
+推論結果のプロセス内キャッシュ（LRU + 任意の TTL）。
+キーは「正規化した特徴行の正準ハッシュ」と「ロード中モデルの識別子」の組。
+モデル差し替え時は load_model から clear() を呼んで全破棄する。
+"""
+from __future__ import annotations
+import hashlib, json, math, threading, time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+# 1 エントリあたりの概算オーバーヘッド（OrderedDict のノード + タプル + float 等）
+_ENTRY_OVERHEAD = 200
+
+
+def _canon(v: Any, numeric: bool) -> Any:
+    # _normalize_batch と同じ同値関係: キー欠落・None・NaN は同じ欠損、数値列は float 化
+    if numeric:
+        try:
+            f = float(v) if not (isinstance(v, str) and "_" in v) else math.nan
+        except (TypeError, ValueError):
+            f = math.nan
+        return None if f != f else f
+    if v is None or (isinstance(v, float) and v != v):
+        return None
+    return v
+
+
+def row_key(row: dict, columns: Sequence[str], numeric: Iterable[str]) -> bytes:
+    """必要列だけを列順に並べた正準 JSON の blake2b。余計なキーや順序の違いは同じキーになる"""
+    numeric = numeric if isinstance(numeric, (set, frozenset)) else set(numeric)
+    if columns:
+        vals = [_canon(row.get(c), c in numeric) for c in columns]
+    else:  # 列情報が無いモデルは行全体をそのまま使う
+        vals = sorted((str(k), _canon(v, False)) for k, v in row.items())
+    blob = json.dumps(vals, ensure_ascii=False, separators=(",", ":"), default=repr)
+    return hashlib.blake2b(blob.encode("utf-8"), digest_size=16).digest()
+
+
+class PredictionCache:
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 0, ttl_sec: float = 0.0):
+        self.max_entries = max(0, int(max_entries))
+        self.max_bytes = max(0, int(max_bytes))   # 0 = 無制限
+        self.ttl = max(0.0, float(ttl_sec))       # 0 = 期限なし
+        self._data: "OrderedDict[Hashable, Tuple[Any, float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get_many(self, keys: Sequence[Hashable]) -> List[Optional[Any]]:
+        """keys の順に値（無ければ None）を返す。ヒットしたものは LRU の末尾へ"""
+        now = time.monotonic()
+        out: List[Optional[Any]] = []
+        with self._lock:
+            for k in keys:
+                ent = self._data.get(k)
+                if ent is not None and self.ttl and ent[1] <= now:
+                    self._drop(k)
+                    self.expirations += 1
+                    ent = None
+                if ent is None:
+                    self.misses += 1
+                    out.append(None)
+                else:
+                    self._data.move_to_end(k)
+                    self.hits += 1
+                    out.append(ent[0])
+        return out
+
+    def put_many(self, items: Iterable[Tuple[Hashable, Any]]) -> None:
+        if not self.max_entries:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else math.inf
+        with self._lock:
+            for k, v in items:
+                if k in self._data:
+                    self._drop(k)
+                size = _ENTRY_OVERHEAD + len(k[-1] if isinstance(k, tuple) else k)
+                self._data[k] = (v, expires, size)
+                self.bytes += size
+            while self._data and (len(self._data) > self.max_entries
+                                  or (self.max_bytes and self.bytes > self.max_bytes)):
+                k, (_v, _e, size) = self._data.popitem(last=False)
+                self.bytes -= size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def _drop(self, k: Hashable) -> None:
+        _v, _e, size = self._data.pop(k)
+        self.bytes -= size
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "entries": len(self._data),
+            "bytes": self.bytes,
+        }
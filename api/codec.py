@@ -0,0 +1,126 @@
+# api/codec.py
+"""
+推論エンドポイント用の高速 JSON コーデック。
+- デコード: orjson（無ければ標準 json）で読み、列ごとのリストへ直接振り分ける（pydantic は通さない）
+- 入力形式: {"rows": [{...}, ...]}（従来）/ {"columns": {"col": [...], ...}}（列指向, 変換不要で最速）
+- 検証: 構造（オブジェクト・配列・列長）と、/schema の数値列にオブジェクト/配列が来ていないか
+- エンコード: 推論結果の ndarray を orjson の OPT_SERIALIZE_NUMPY でそのまま bytes 化（要素ごとの float() 変換なし）
+"""
+from __future__ import annotations
+import json
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 任意依存
+    orjson = None
+
+
+class PayloadError(ValueError):
+    """入力が構造的に不正（HTTP 422 にする）"""
+
+
+class Columns:
+    """列指向のバッチ。data: 列名 → 長さ n のリスト"""
+
+    __slots__ = ("data", "n")
+
+    def __init__(self, data: Dict[str, list], n: int):
+        self.data, self.n = data, n
+
+    def __len__(self) -> int:
+        return self.n
+
+    def to_rows(self) -> List[dict]:
+        names = list(self.data)
+        return [dict(zip(names, vals)) for vals in zip(*(self.data[c] for c in names))] if names else [{}] * self.n
+
+
+def loads(body: bytes) -> Any:
+    if orjson is not None:
+        try:
+            return orjson.loads(body)
+        except ValueError:  # orjson.JSONDecodeError も ValueError
+            pass  # NaN / Infinity は orjson が拒否するので、従来どおり標準 json で読み直す
+    try:
+        return json.loads(body)
+    except ValueError as e:
+        raise PayloadError(f"invalid JSON: {e}")
+
+
+def decode_features(body: bytes) -> dict:
+    """{"features": {...}} → dict"""
+    obj = loads(body)
+    feats = obj.get("features") if isinstance(obj, dict) else None
+    if not isinstance(feats, dict):
+        raise PayloadError('body must be {"features": {...}}')
+    return feats
+
+
+def decode_batch(body: bytes, columns: Sequence[str] = (), numeric: Iterable[str] = ()) -> Columns:
+    """{"rows": [...]} / {"columns": {...}} → Columns。columns を渡すとその列だけを取り出す（余計なキーは捨てる）"""
+    obj = loads(body)
+    if not isinstance(obj, dict):
+        raise PayloadError('body must be {"rows": [...]} or {"columns": {...}}')
+    if "columns" in obj:
+        cols = _from_columns(obj["columns"], columns)
+    elif "rows" in obj:
+        cols = _from_rows(obj["rows"], columns)
+    else:
+        raise PayloadError('body must be {"rows": [...]} or {"columns": {...}}')
+    validate(cols, numeric)
+    return cols
+
+
+def _from_rows(rows: Any, columns: Sequence[str]) -> Columns:
+    if not isinstance(rows, list):
+        raise PayloadError('"rows" must be an array of objects')
+    for i, r in enumerate(rows):
+        if not isinstance(r, dict):
+            raise PayloadError(f"rows[{i}] must be an object")
+    if not columns:  # スキーマが無いモデルは出てきたキーをすべて列にする
+        seen: Dict[str, None] = {}
+        for r in rows:
+            seen.update(dict.fromkeys(r))
+        columns = list(seen)
+    return Columns({c: [r.get(c) for r in rows] for c in columns}, len(rows))
+
+
+def _from_columns(data: Any, columns: Sequence[str]) -> Columns:
+    if not isinstance(data, dict) or not all(isinstance(v, list) for v in data.values()):
+        raise PayloadError('"columns" must be an object of arrays')
+    lengths = {len(v) for v in data.values()}
+    if len(lengths) > 1:
+        raise PayloadError(f'"columns" arrays must have the same length (got {sorted(lengths)})')
+    n = lengths.pop() if lengths else 0
+    if not columns:
+        return Columns(dict(data), n)
+    return Columns({c: data[c] if c in data else [None] * n for c in columns}, n)
+
+
+def validate(cols: Columns, numeric: Iterable[str]) -> None:
+    # 数値列に入れてよいのはスカラーだけ（文字列は従来どおり数値化を試み、無理なら欠損）
+    for c in numeric:
+        vals = cols.data.get(c)
+        if not vals:
+            continue
+        for i, v in enumerate(vals):
+            if isinstance(v, (dict, list)):
+                raise PayloadError(f"column {c!r} row {i}: expected a number, got {type(v).__name__}")
+
+
+def encode_predictions(key: str, values: np.ndarray) -> bytes:
+    """{key: [..]} を bytes で。ndarray を直接シリアライズする"""
+    if orjson is not None:
+        arr = np.ascontiguousarray(values)
+        if arr.dtype.kind in "fiub" and arr.dtype.itemsize in (1, 2, 4, 8) and arr.dtype != np.float16:
+            return orjson.dumps({key: arr}, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps({key: np.asarray(values).tolist()}).encode("utf-8")
+
+
+def dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj).encode("utf-8")
@@ -0,0 +1,296 @@
+# api/encoder.py
+"""
+学習済み ColumnTransformer("pre") を、pandas を介さない平坦なエンコーダにコンパイルする。
+Imputer の補完値・Scaler の mean/scale・OneHot のカテゴリ→列番号 dict・Ordinal のカテゴリ→コード dict を事前に取り出し、
+リクエストの dict 列を確保済み NumPy 行列へ直接書き込む。pre.transform と同一出力が前提。
+対応外の構成（sparse 出力, infrequent, add_indicator 等）は None を返して従来経路に任せる。
+"""
+from __future__ import annotations
+import math, time
+from itertools import chain
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from sklearn.compose import ColumnTransformer
+from sklearn.impute import SimpleImputer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder, StandardScaler
+
+
+# この型だけなら np.array(dtype=float64) に一括変換できる（None は NaN になる）
+_PLAIN_NUMBER_TYPES = frozenset({int, float, bool, type(None), np.float64, np.float32, np.int64, np.int32})
+
+
+def _to_float(v: Any) -> float:
+    # pd.to_numeric(errors="coerce") 相当: 数値化できなければ NaN
+    if v is None:
+        return math.nan
+    if isinstance(v, str) and "_" in v:  # float("1_000") は通るが pandas は NaN
+        return math.nan
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _is_missing(v: Any) -> bool:
+    # _normalize_batch と同じく None / NaN / キー欠落を欠損として扱う
+    return v is None or (isinstance(v, float) and v != v)
+
+
+def _lookup(table: dict, v: Any) -> int:
+    try:
+        return table.get(v, -1)
+    except TypeError:  # list/dict 等のハッシュ不可能値は未知カテゴリ扱い
+        return -1
+
+
+class _NumBlock:
+    def __init__(self, cols, start, fill, mean, scale):
+        self.cols, self.start = list(cols), start
+        self.stop = start + len(self.cols)
+        cols_ = self.cols
+        self.getter = itemgetter(*cols_) if len(cols_) > 1 else (lambda r: tuple(r[c] for c in cols_))
+        self.fill, self.mean, self.scale = fill, mean, scale
+
+
+class _CatColumn:
+    def __init__(self, col, offset, lookup, fill, strict):
+        self.col, self.offset, self.lookup = col, offset, lookup
+        # fill_idx: 欠損を Imputer が埋めた後のカテゴリ番号（Imputer 無しなら -1 = 全0）
+        self.fill_idx = lookup.get(fill, -1) if fill is not None else -1
+        self.strict = strict
+
+    def write(self, out, row_idx, vals):
+        _one_hot(out, row_idx, self, vals)
+
+
+class _OrdColumn:
+    def __init__(self, col, pos, lookup, missing_value, unknown_value, strict):
+        # pos: 出力の列番号（1 カテゴリ列 = 1 出力列）。欠損・未知は encoded_missing_value / unknown_value
+        self.col, self.pos, self.lookup = col, pos, lookup
+        self.missing_value, self.unknown_value, self.strict = missing_value, unknown_value, strict
+
+    def write(self, out, row_idx, vals):
+        _ordinal(out, self, vals)
+
+
+class CompiledEncoder:
+    """rows(list[dict]) -> 2次元 ndarray。pre.transform(_normalize_batch(rows)) と同じ値を返す"""
+
+    def __init__(self, columns: Sequence[str], n_features: int, dtype,
+                 num_blocks: List[_NumBlock], cat_columns: list):
+        self.columns = list(columns)
+        self.n_features = n_features
+        self.dtype = np.dtype(dtype)
+        self._num = num_blocks
+        self._cat = cat_columns
+
+    def transform(self, rows: Sequence[dict]) -> np.ndarray:
+        return self.transform_timed(rows)[0]
+
+    def transform_columns(self, cols: Dict[str, list], n: int) -> np.ndarray:
+        """列指向入力版（列名 → 長さ n のリスト。無い列は全欠損）。transform と同じ値を返す"""
+        return self.transform_columns_timed(cols, n)[0]
+
+    def transform_timed(self, rows: Sequence[dict]):
+        """→ (行列, 正規化の秒)。正規化 = dict から値を取り出して数値化するところ（補完・標準化・カテゴリ引きは含まない）"""
+        n = len(rows)
+        out = np.zeros((n, self.n_features), dtype=self.dtype)
+        norm = 0.0
+        for blk in self._num:
+            t = time.perf_counter()
+            try:  # 全列そろった行が大半なので itemgetter で一括取り出し
+                vals = list(chain.from_iterable(map(blk.getter, rows)))
+            except KeyError:
+                vals = [r.get(c) for r in rows for c in blk.cols]
+            if _PLAIN_NUMBER_TYPES.issuperset(map(type, vals)):
+                raw = np.array(vals, dtype=np.float64)
+            else:  # 文字列等が混ざるときだけ 1 要素ずつ変換
+                raw = np.array([_to_float(v) for v in vals], dtype=np.float64)
+            raw = raw.reshape(n, len(blk.cols))
+            norm += time.perf_counter() - t
+            _impute_scale(raw, blk)
+            out[:, blk.start:blk.stop] = raw
+        row_idx = np.arange(n)
+        for cc in self._cat:
+            t = time.perf_counter()
+            vals = [r.get(cc.col) for r in rows]
+            norm += time.perf_counter() - t
+            cc.write(out, row_idx, vals)
+        return out, norm
+
+    def transform_columns_timed(self, cols: Dict[str, list], n: int):
+        """transform_columns の (行列, 正規化の秒) 版"""
+        out = np.zeros((n, self.n_features), dtype=self.dtype)
+        missing = [None] * n
+        norm = 0.0
+        for blk in self._num:
+            t = time.perf_counter()
+            raw = np.empty((n, len(blk.cols)), dtype=np.float64)
+            for j, c in enumerate(blk.cols):
+                vals = cols.get(c, missing)
+                if _PLAIN_NUMBER_TYPES.issuperset(map(type, vals)):
+                    raw[:, j] = np.array(vals, dtype=np.float64)
+                else:
+                    raw[:, j] = [_to_float(v) for v in vals]
+            norm += time.perf_counter() - t
+            _impute_scale(raw, blk)
+            out[:, blk.start:blk.stop] = raw
+        row_idx = np.arange(n)
+        for cc in self._cat:
+            cc.write(out, row_idx, cols.get(cc.col, missing))
+        return out, norm
+
+
+def _one_hot(out: np.ndarray, row_idx: np.ndarray, cc: _CatColumn, vals: list) -> None:
+    try:
+        idx = np.array([cc.lookup.get(v, -1) for v in vals], dtype=np.intp)
+    except TypeError:
+        idx = np.array([_lookup(cc.lookup, v) for v in vals], dtype=np.intp)
+    for i in np.flatnonzero(idx < 0):
+        v = vals[i]
+        if _is_missing(v):
+            idx[i] = cc.fill_idx
+        elif cc.strict:
+            raise ValueError(f"Found unknown categories [{v!r}] in column {cc.col!r} during transform")
+    hit = idx >= 0
+    out[row_idx[hit], cc.offset + idx[hit]] = 1.0
+
+
+def _ordinal(out: np.ndarray, oc: _OrdColumn, vals: list) -> None:
+    try:
+        codes = np.array([oc.lookup.get(v, -1) for v in vals], dtype=np.float64)
+    except TypeError:
+        codes = np.array([_lookup(oc.lookup, v) for v in vals], dtype=np.float64)
+    for i in np.flatnonzero(codes < 0):
+        v = vals[i]
+        if _is_missing(v):
+            codes[i] = oc.missing_value
+        elif oc.strict:
+            raise ValueError(f"Found unknown categories [{v!r}] in column {oc.col!r} during transform")
+        else:
+            codes[i] = oc.unknown_value
+    out[:, oc.pos] = codes
+
+
+def _impute_scale(raw: np.ndarray, blk: _NumBlock) -> None:
+    # SimpleImputer → StandardScaler と同じ順・同じ dtype で演算（ビット一致させる）
+    if blk.fill is not None:
+        mask = np.isnan(raw)
+        if mask.any():
+            raw[mask] = np.broadcast_to(blk.fill, raw.shape)[mask]
+    if blk.mean is not None:
+        raw -= blk.mean
+    if blk.scale is not None:
+        raw /= blk.scale
+
+
+def _split_steps(trans) -> Optional[list]:
+    if isinstance(trans, Pipeline):
+        return [step for _name, step in trans.steps if step not in (None, "passthrough")]
+    return [trans]
+
+
+def _plain_imputer(step) -> bool:
+    return (isinstance(step, SimpleImputer) and not step.add_indicator
+            and isinstance(step.missing_values, float) and math.isnan(step.missing_values))
+
+
+def _compile_numeric(cols, steps, start):
+    imp = steps.pop(0) if steps and isinstance(steps[0], SimpleImputer) else None
+    sc = steps.pop(0) if steps and isinstance(steps[0], StandardScaler) else None
+    if steps or (imp is not None and not _plain_imputer(imp)):
+        return None
+    fill = None
+    if imp is not None:
+        stats = np.asarray(imp.statistics_, dtype=np.float64)
+        valid = ~np.isnan(stats)
+        if not valid.all():  # 学習時に全欠損だった列は Imputer が落とす
+            if getattr(imp, "keep_empty_features", False):
+                return None
+            cols = [c for c, ok in zip(cols, valid) if ok]
+            stats = stats[valid]
+        fill = stats
+    mean = sc.mean_ if sc is not None and sc.with_mean else None
+    scale = sc.scale_ if sc is not None and sc.with_std else None
+    return _NumBlock(cols, start, fill, mean, scale)
+
+
+def _compile_categorical(cols, steps, start):
+    imp = steps.pop(0) if steps and isinstance(steps[0], SimpleImputer) else None
+    oh = steps.pop(0) if steps and isinstance(steps[0], OneHotEncoder) else None
+    if steps or oh is None or (imp is not None and not _plain_imputer(imp)):
+        return None
+    if getattr(oh, "sparse_output", getattr(oh, "sparse", False)) or oh.drop is not None:
+        return None
+    if getattr(oh, "_infrequent_enabled", False):
+        return None
+    fills = list(imp.statistics_) if imp is not None else [None] * len(cols)
+    if len(fills) != len(cols) or len(oh.categories_) != len(cols):
+        return None
+    out, offset = [], start
+    for col, fill, cats in zip(cols, fills, oh.categories_):
+        lookup = {v: j for j, v in enumerate(cats.tolist())}
+        if len(lookup) != len(cats):
+            return None
+        out.append(_CatColumn(col, offset, lookup, fill, strict=(oh.handle_unknown == "error")))
+        offset += len(cats)
+    return out
+
+
+def _compile_ordinal(cols, steps, start):
+    # 前段の Imputer 無し・infrequent 無しの OrdinalEncoder だけ（train.build_preprocessor の native）
+    oe = steps[0] if len(steps) == 1 else None
+    if oe is None or getattr(oe, "_infrequent_enabled", False) or len(oe.categories_) != len(cols):
+        return None
+    out = []
+    for j, (col, cats) in enumerate(zip(cols, oe.categories_)):
+        # 学習時に欠損があると categories_ の末尾に NaN / None が入る（欠損は encoded_missing_value）
+        lookup = {v: k for k, v in enumerate(cats.tolist()) if not _is_missing(v)}
+        out.append(_OrdColumn(col, start + j, lookup, oe.encoded_missing_value,
+                              oe.unknown_value if oe.handle_unknown == "use_encoded_value" else None,
+                              strict=(oe.handle_unknown == "error")))
+    return out
+
+
+def compile_preprocessor(pre) -> Optional[CompiledEncoder]:
+    """fit 済み ColumnTransformer をコンパイル。対応外なら None"""
+    if not isinstance(pre, ColumnTransformer) or not hasattr(pre, "transformers_"):
+        return None
+    if getattr(pre, "sparse_output_", False):
+        return None
+    columns: List[str] = []
+    num_blocks: List[_NumBlock] = []
+    cat_columns: list = []  # _CatColumn（one-hot）/ _OrdColumn（ordinal）
+    dtypes = []
+    for name, trans, cols in pre.transformers_:
+        if trans == "drop" or not len(cols):  # 空列の transformer は fit されず出力も 0 列
+            continue
+        if trans == "passthrough" or not isinstance(cols, (list, tuple)):
+            return None
+        start = pre.output_indices_[name].start
+        steps = _split_steps(trans)
+        columns.extend(cols)
+        if steps and isinstance(steps[-1], OneHotEncoder):
+            dtypes.append(steps[-1].dtype)
+            compiled = _compile_categorical(list(cols), steps, start)
+            if compiled is None:
+                return None
+            cat_columns.extend(compiled)
+        elif steps and isinstance(steps[-1], OrdinalEncoder):
+            dtypes.append(steps[-1].dtype)
+            compiled = _compile_ordinal(list(cols), steps, start)
+            if compiled is None:
+                return None
+            cat_columns.extend(compiled)
+        else:
+            blk = _compile_numeric(list(cols), steps, start)
+            if blk is None:
+                return None
+            num_blocks.append(blk)
+            dtypes.append(np.float64)
+    n_features = sum(s.stop - s.start for s in pre.output_indices_.values())
+    dtype = np.result_type(*dtypes) if dtypes else np.float64
+    return CompiledEncoder(columns, n_features, dtype, num_blocks, cat_columns)
@@ -0,0 +1,216 @@
+# api/fetcher.py
+"""
+モデル成果物の取得。S3（またはローカルファイル）からの条件付き・並列ダウンロードと、
+SHA-256 をキーにした内容アドレス型のローカルキャッシュを提供する。
+
+- head で ETag を確認し、前回取得時と同じならダウンロードしない
+- 大きいファイルは Range GET を並列に投げ、確保済みファイルへ pwrite で書き込む
+- 完成したファイルは <cache_dir>/<sha256><拡張子> に置き、index.json に uri → etag/sha256 を記録
+- 新しい版を取得したら、index が指す現行の実体と直近 keep 個以外（と隣の .flat）を消す
+boto3 は S3Backend を使うときだけ import する。
+"""
+from __future__ import annotations
+import hashlib, json, os, tempfile, threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+_HASH_CHUNK = 1 << 20
+
+
+@dataclass(frozen=True)
+class ObjectMeta:
+    etag: str
+    size: int
+
+
+@dataclass(frozen=True)
+class FetchResult:
+    path: str       # キャッシュ内の実体パス
+    sha256: str
+    etag: str
+    downloaded: bool  # False = ETag 一致でスキップ
+
+
+class FileBackend:
+    """ローカルファイルを S3 に見立てるバックエンド（テスト・オフライン用）。uri は file:///… かパス"""
+
+    @staticmethod
+    def _path(uri: str) -> str:
+        return uri[len("file://"):] if uri.startswith("file://") else uri
+
+    def head(self, uri: str) -> ObjectMeta:
+        st = os.stat(self._path(uri))
+        return ObjectMeta(etag=f'"{st.st_mtime_ns:x}-{st.st_size:x}"', size=st.st_size)
+
+    def get_range(self, uri: str, start: int, end: int, etag: Optional[str] = None) -> bytes:
+        # end は Range ヘッダと同じく閉区間
+        with open(self._path(uri), "rb") as f:
+            f.seek(start)
+            return f.read(end - start + 1)
+
+
+def split_s3_uri(uri: str) -> Tuple[str, str]:
+    if not uri.startswith("s3://"):
+        raise ValueError(f"not an s3 uri: {uri}")
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    return bucket, key
+
+
+class S3Backend:
+    """boto3 クライアントは1つだけ作って使い回す（クライアントはスレッドセーフ）"""
+
+    def __init__(self, client=None, endpoint_url: Optional[str] = None):
+        self._client = client
+        self._endpoint_url = endpoint_url
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import boto3
+                    self._client = boto3.client("s3", endpoint_url=self._endpoint_url or None)
+        return self._client
+
+    def head(self, uri: str) -> ObjectMeta:
+        bucket, key = split_s3_uri(uri)
+        res = self.client.head_object(Bucket=bucket, Key=key)
+        return ObjectMeta(etag=res["ETag"], size=int(res["ContentLength"]))
+
+    def get_range(self, uri: str, start: int, end: int, etag: Optional[str] = None) -> bytes:
+        bucket, key = split_s3_uri(uri)
+        kw = {"IfMatch": etag} if etag else {}  # 分割取得の途中で上書きされたら失敗させる
+        res = self.client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}", **kw)
+        return res["Body"].read()
+
+
+def backend_for(uri: str, endpoint_url: Optional[str] = None):
+    return S3Backend(endpoint_url=endpoint_url) if uri.startswith("s3://") else FileBackend()
+
+
+def sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ModelFetcher:
+    def __init__(self, backend, cache_dir: str, part_size: int = 8 << 20, max_workers: int = 4, keep: int = 2):
+        self.backend = backend
+        self.cache_dir = cache_dir
+        self.part_size = max(1, int(part_size))
+        self.max_workers = max(1, int(max_workers))
+        self.keep = max(0, int(keep))  # 現行以外に残す過去の版の数（切り戻し用）
+        self._index_path = os.path.join(cache_dir, "index.json")
+        self._lock = threading.Lock()  # 同一プロセス内の同時 fetch を直列化
+
+    # ── index.json（uri → etag / sha256 / size / path）
+    def _load_index(self) -> dict:
+        try:
+            with open(self._index_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_index(self, index: dict) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix=".index-")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2, sort_keys=True)
+        os.replace(tmp, self._index_path)
+
+    def fetch(self, uri: str) -> FetchResult:
+        with self._lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            meta = self.backend.head(uri)
+            index = self._load_index()
+            ent = index.get(uri)
+            if ent and ent.get("etag") == meta.etag and os.path.exists(ent.get("path", "")):
+                return FetchResult(ent["path"], ent["sha256"], meta.etag, downloaded=False)
+
+            tmp = self._download(uri, meta)
+            try:
+                digest = sha256_file(tmp)
+                ext = os.path.splitext(uri.rstrip("/"))[1]
+                path = os.path.join(self.cache_dir, digest + ext)
+                if os.path.exists(path):  # 同じ内容は既にある（別 uri / 再アップロード）
+                    os.unlink(tmp)
+                    os.utime(path)  # 直近に使った版として数える
+                else:
+                    os.replace(tmp, path)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.unlink(tmp)
+                raise
+            index[uri] = {"etag": meta.etag, "sha256": digest, "size": meta.size, "path": path}
+            self._save_index(index)
+            self._prune(index)
+            return FetchResult(path, digest, meta.etag, downloaded=True)
+
+    def _prune(self, index: dict) -> list:
+        """index が指す実体（現行）は残し、それ以外は新しい順に keep 個だけ残す。→ 消したパス"""
+        current = {os.path.abspath(e["path"]) for e in index.values() if e.get("path")}
+        old = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.abspath(os.path.join(self.cache_dir, name))
+            # "." 始まりは作業中・index、.flat / .tmp は実体に付随するファイル
+            if name.startswith(".") or name == "index.json" or name.endswith((".flat", ".tmp")) or path in current:
+                continue
+            try:
+                old.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        old.sort(reverse=True)
+        removed = []
+        for _mtime, path in old[self.keep:]:
+            for p in (path, path + ".flat"):
+                try:
+                    os.unlink(p)
+                    removed.append(p)
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def _download(self, uri: str, meta: ObjectMeta) -> str:
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix=".part-")
+        try:
+            os.ftruncate(fd, meta.size)
+            ranges = [(s, min(s + self.part_size, meta.size) - 1) for s in range(0, meta.size, self.part_size)]
+
+            def _part(rng):
+                start, end = rng
+                data = self.backend.get_range(uri, start, end, meta.etag)
+                if len(data) != end - start + 1:
+                    raise IOError(f"short read {len(data)} for bytes={start}-{end} of {uri}")
+                os.pwrite(fd, data, start)
+
+            if len(ranges) <= 1:
+                for rng in ranges:
+                    _part(rng)
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(ranges))) as ex:
+                    list(ex.map(_part, ranges))
+        except BaseException:
+            os.close(fd)
+            os.unlink(tmp)
+            raise
+        os.close(fd)
+        return tmp
+
+
+def link_into_place(src: str, dst: str) -> None:
+    """dst を src へのシンボリックリンクに原子的に置き換える（不可ならコピー）"""
+    d = os.path.dirname(dst) or "."
+    os.makedirs(d, exist_ok=True)
+    if os.path.realpath(dst) == os.path.realpath(src):
+        return
+    tmp = os.path.join(d, f".{os.path.basename(dst)}.{os.getpid()}.tmp")
+    try:
+        os.symlink(os.path.abspath(src), tmp)
+    except OSError:
+        import shutil
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
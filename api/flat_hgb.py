@@ -0,0 +1,259 @@
+# api/flat_hgb.py
+"""
+HistGradientBoostingClassifier の木を連続した NumPy 配列に平坦化し、
+バッチ全体 × 全木を深さ方向に 1 段ずつ同時に辿るベクトル化評価器。
+sklearn の predict_proba と float 誤差の範囲で一致する（判定規則は _predictor.pyx と同じ）。
+
+export:  python -m api.flat_hgb models/model_openml_adult.joblib  → models/model_openml_adult.flat.npz
+"""
+from __future__ import annotations
+import sys
+from typing import Optional
+
+import numpy as np
+from scipy.special import expit, softmax
+
+# npz に保存する配列（load 時にこの順で読み戻す）
+_ARRAYS = (
+    "feature", "threshold", "children", "missing_left", "value", "is_categorical",
+    "bitset_row", "known_row", "left_cat_bitsets", "known_cat_bitsets",
+    "roots", "tree_class", "baseline", "classes",
+    "col_order", "cat_pos", "cat_values", "cat_offsets",
+)
+
+
+class FlatHGB:
+    """平坦化済み HGB。raw_predict / predict_proba / predict は sklearn と同じ意味"""
+
+    def __init__(self, *, feature, threshold, children, missing_left, value, is_categorical,
+                 bitset_row, known_row, left_cat_bitsets, known_cat_bitsets,
+                 roots, tree_class, baseline, classes, n_features: int, max_depth: int,
+                 col_order=None, cat_pos=None, cat_values=None, cat_offsets=None):
+        self.feature = feature                  # (N,) int32  葉は 0
+        self.threshold = threshold              # (N,) float64
+        self.children = children                # (N, 2) int32  [左, 右]。葉は自分自身を指す
+        self.missing_left = missing_left        # (N,) bool
+        self.value = value                      # (N,) float64  葉の値
+        self.is_categorical = is_categorical    # (N,) bool
+        self.bitset_row = bitset_row            # (N,) int32  left_cat_bitsets の行
+        self.known_row = known_row              # (N,) int32  known_cat_bitsets の行
+        self.left_cat_bitsets = left_cat_bitsets    # (B, 8) uint32
+        self.known_cat_bitsets = known_cat_bitsets  # (C, 8) uint32
+        self.roots = roots                      # (T,) int32
+        self.tree_class = tree_class            # (T,) int32  多クラス時の出力列
+        self.baseline = baseline                # (K,) float64
+        self.classes = classes
+        self.n_features = int(n_features)
+        self.max_depth = int(max_depth)
+        # HGB 内部の _preprocessor（カテゴリ列を先頭へ並べ替え + 値→コード化）の再現用。無ければ空
+        self.col_order = np.zeros(0, np.int32) if col_order is None else col_order
+        self.cat_pos = np.zeros(0, np.int32) if cat_pos is None else cat_pos
+        self.cat_values = np.zeros(0) if cat_values is None else cat_values
+        self.cat_offsets = np.zeros(1, np.int64) if cat_offsets is None else cat_offsets
+        self.has_categorical = bool(is_categorical.any())
+        # 欠損を左へ送るノードは -inf 化した列、右へ送るノードは NaN のままの列を読む。
+        # 比較を ~(x <= thr) の 1 回にできる（NaN は必ず右、-inf は必ず左）
+        self._feature2 = np.where(missing_left, feature, feature + self.n_features).astype(np.intp)
+        self._children_flat = children.astype(np.intp).ravel()
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def nbytes(self) -> int:
+        return int(sum(getattr(self, k).nbytes for k in _ARRAYS if isinstance(getattr(self, k), np.ndarray)))
+
+    # ── 評価
+    def raw_predict(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"X has {X.shape[-1]} features, but model expects {self.n_features}")
+        if len(self.col_order):
+            X = self._encode_categories(X)
+        n, T = X.shape[0], self.n_trees
+        X_lo = np.where(np.isnan(X), -np.inf, X)
+        Xcat = np.concatenate([X_lo, X], axis=1).ravel()
+        # (サンプル, 木) を 1 次元に潰し、np.take だけで辿る（2 次元 fancy index より速い）
+        row_off = np.repeat(np.arange(n, dtype=np.intp) * (2 * self.n_features), T)
+        node = np.tile(self.roots.astype(np.intp), n)
+        for _ in range(self.max_depth):
+            x = np.take(Xcat, row_off + np.take(self._feature2, node))
+            go_right = ~(x <= np.take(self.threshold, node))
+            if self.has_categorical:
+                self._categorical_split(node, x, go_right)
+            node = np.take(self._children_flat, 2 * node + go_right)
+        node = node.reshape(n, T)
+        leaf = self.value[node]
+        K = len(self.baseline)
+        if K == 1:
+            raw = leaf.sum(axis=1, keepdims=True)
+        else:
+            raw = np.zeros((n, K))
+            for k in range(K):
+                raw[:, k] = leaf[:, self.tree_class == k].sum(axis=1)
+        return raw + self.baseline
+
+    def _encode_categories(self, X: np.ndarray) -> np.ndarray:
+        # OrdinalEncoder(handle_unknown="use_encoded_value", unknown_value=nan) と同じ: 未知・欠損は NaN
+        X = X[:, self.col_order]
+        for i, pos in enumerate(self.cat_pos):
+            cats = self.cat_values[self.cat_offsets[i]:self.cat_offsets[i + 1]]
+            x = X[:, pos]
+            code = np.searchsorted(cats, x).clip(0, max(len(cats) - 1, 0))
+            hit = (cats[code] == x) if len(cats) else np.zeros(len(x), bool)
+            X[:, pos] = np.where(hit, code, np.nan)
+        return X
+
+    def _categorical_split(self, node, x, go_right) -> None:
+        mask = self.is_categorical[node]
+        if not mask.any():
+            return
+        nd, xc = node[mask], x[mask]
+        missing = ~(xc >= 0)  # NaN / -inf / 負値は欠損扱い
+        v = np.where(missing, 0, xc).astype(np.int64) & 0xFF  # Cython の <uint8> キャスト相当
+        word, bit = v >> 5, (v & 31).astype(np.uint32)
+        in_left = (self.left_cat_bitsets[self.bitset_row[nd], word] >> bit) & 1
+        known = (self.known_cat_bitsets[self.known_row[nd], word] >> bit) & 1
+        # 未知カテゴリは欠損と同じ向き
+        to_missing_dir = missing | ((in_left == 0) & (known == 0))
+        go_left = np.where(to_missing_dir, self.missing_left[nd], in_left == 1)
+        go_right[mask] = ~go_left
+
+    def predict_proba(self, X) -> np.ndarray:
+        raw = self.raw_predict(X)
+        if raw.shape[1] == 1:
+            p1 = expit(raw[:, 0])
+            return np.column_stack([1.0 - p1, p1])
+        return softmax(raw, axis=1)
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes[np.argmax(self.predict_proba(X), axis=1)]
+
+    # ── 保存 / 読込（export ステップ）
+    def save(self, path: str) -> None:
+        np.savez(path, n_features=self.n_features, max_depth=self.max_depth,
+                 **{k: getattr(self, k) for k in _ARRAYS})
+
+    @classmethod
+    def load(cls, path: str) -> "FlatHGB":
+        with np.load(path, allow_pickle=False) as z:
+            kw = {k: z[k] for k in _ARRAYS}
+            return cls(**kw, n_features=int(z["n_features"]), max_depth=int(z["max_depth"]))
+
+
+def export_hgb(clf) -> Optional[FlatHGB]:
+    """fit 済み HistGradientBoostingClassifier を平坦化。対応外（DataFrame の from_dtype カテゴリ等）は None"""
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    if not isinstance(clf, HistGradientBoostingClassifier) or not hasattr(clf, "_predictors"):
+        return None
+    spec = _preprocessor_spec(clf)
+    if spec is None:
+        return None
+    if not np.issubdtype(np.asarray(clf.classes_).dtype, np.number):
+        return None  # npz に object 配列は入れない
+
+    feats, thrs, kids, mleft, vals, iscat, brow, roots, tree_class = [], [], [], [], [], [], [], [], []
+    bitsets, offset, boffset, max_depth = [], 0, 0, 0
+    for predictors_of_iteration in clf._predictors:
+        for k, pred in enumerate(predictors_of_iteration):
+            nodes = pred.nodes
+            n = len(nodes)
+            leaf = nodes["is_leaf"].astype(bool)
+            idx = np.arange(n) + offset
+            left = np.where(leaf, idx, nodes["left"].astype(np.int64) + offset)
+            right = np.where(leaf, idx, nodes["right"].astype(np.int64) + offset)
+            feats.append(np.where(leaf, 0, nodes["feature_idx"]))
+            thrs.append(np.where(leaf, np.inf, nodes["num_threshold"]))
+            kids.append(np.column_stack([left, right]))
+            mleft.append(nodes["missing_go_to_left"].astype(bool))
+            vals.append(nodes["value"])
+            cat = nodes["is_categorical"].astype(bool) & ~leaf
+            iscat.append(cat)
+            brow.append(np.where(cat, nodes["bitset_idx"].astype(np.int64) + boffset, 0))
+            bitsets.append(pred.raw_left_cat_bitsets)
+            roots.append(offset)
+            tree_class.append(k)
+            max_depth = max(max_depth, int(nodes["depth"].max()))
+            offset += n
+            boffset += len(pred.raw_left_cat_bitsets)
+
+    feature = np.concatenate(feats).astype(np.int32)
+    is_categorical = np.concatenate(iscat)
+    known_cat_bitsets, f_idx_map = clf._bin_mapper.make_known_categories_bitsets()
+    known_row = np.asarray(f_idx_map, dtype=np.int32)[feature]
+    n_features = clf.n_features_in_
+    return FlatHGB(
+        feature=feature,
+        threshold=np.concatenate(thrs).astype(np.float64),
+        children=np.ascontiguousarray(np.concatenate(kids), dtype=np.int32),
+        missing_left=np.concatenate(mleft),
+        value=np.concatenate(vals).astype(np.float64),
+        is_categorical=is_categorical,
+        bitset_row=np.concatenate(brow).astype(np.int32),
+        known_row=np.where(is_categorical, known_row, 0).astype(np.int32),
+        left_cat_bitsets=np.ascontiguousarray(np.concatenate(bitsets) if bitsets else np.zeros((0, 8)), dtype=np.uint32),
+        known_cat_bitsets=np.ascontiguousarray(known_cat_bitsets, dtype=np.uint32),
+        roots=np.asarray(roots, dtype=np.int32),
+        tree_class=np.asarray(tree_class, dtype=np.int32),
+        baseline=np.asarray(clf._baseline_prediction, dtype=np.float64).ravel(),
+        classes=np.asarray(clf.classes_),
+        n_features=n_features,
+        max_depth=max_depth,
+        **spec,
+    )
+
+
+def _preprocessor_spec(clf) -> Optional[dict]:
+    """categorical_features 指定時に HGB が内部で挟む ColumnTransformer を配列で表す"""
+    from sklearn.preprocessing import OrdinalEncoder
+    pp = getattr(clf, "_preprocessor", None)
+    if pp is None:
+        return {}
+    n = clf.n_features_in_
+    col_order = np.full(n, -1, dtype=np.int32)
+    cat_pos, cat_values, cat_offsets = [], [], [0]
+    for name, trans, cols in pp.transformers_:
+        idx = np.flatnonzero(cols) if np.asarray(cols).dtype == bool else np.asarray(cols, dtype=int)
+        if not len(idx):
+            continue
+        if trans == "drop" or trans == "passthrough" and name == "remainder":
+            return None
+        out = pp.output_indices_[name]
+        col_order[out.start:out.stop] = idx
+        if isinstance(trans, OrdinalEncoder):
+            for j, cats in enumerate(trans.categories_):
+                if not np.issubdtype(cats.dtype, np.number):
+                    return None  # DataFrame の文字列カテゴリはここでは扱わない
+                cats = cats[~np.isnan(cats)].astype(np.float64)
+                cat_pos.append(out.start + j)
+                cat_values.append(cats)
+                cat_offsets.append(cat_offsets[-1] + len(cats))
+    if (col_order < 0).any():
+        return None
+    return {
+        "col_order": col_order,
+        "cat_pos": np.asarray(cat_pos, dtype=np.int32),
+        "cat_values": np.concatenate(cat_values) if cat_values else np.zeros(0),
+        "cat_offsets": np.asarray(cat_offsets, dtype=np.int64),
+    }
+
+
+def main(argv=None):
+    import joblib
+    args = argv if argv is not None else sys.argv[1:]
+    if not args:
+        raise SystemExit("usage: python -m api.flat_hgb MODEL.joblib [OUT.flat.npz]")
+    model = joblib.load(args[0])
+    clf = model.steps[-1][1] if hasattr(model, "steps") else model
+    flat = export_hgb(clf)
+    if flat is None:
+        raise SystemExit(f"unsupported estimator: {type(clf).__name__}")
+    out = args[1] if len(args) > 1 else args[0].rsplit(".joblib", 1)[0] + ".flat.npz"
+    flat.save(out)
+    print(f"[FLAT] trees={flat.n_trees} nodes={len(flat.value)} depth={flat.max_depth} "
+          f"bytes={flat.nbytes} -> {out}")
+
+
+if __name__ == "__main__":
+    main()
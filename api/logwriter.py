@@ -0,0 +1,166 @@
+# api/logwriter.py
+"""
+1行 JSON ログの非同期ライター。リクエスト側は dict を有界キューへ入れるだけ（満杯なら捨てて数える）。
+シリアライズ・ファイル/標準出力への書き込みはバックグラウンドスレッドがまとめて行う。
+出力ファイルは書き込み時点の日付で <dir>/<prefix>-YYYYMMDD.log を開き直すので、日付が変われば再起動なしで切り替わる。
+"""
+from __future__ import annotations
+import atexit, json, os, queue, random, sys, threading, time
+from datetime import datetime
+from typing import Iterable, Optional, TextIO
+
+_STOP = object()
+
+
+class AccessLogSampler:
+    """エラー（status>=400）と遅いリクエストは常に残し、それ以外はパスごとの確率で間引く"""
+
+    def __init__(self, rate: float = 1.0, health_rate: float = 1.0, slow_ms: float = 0.0,
+                 health_paths: Iterable[str] = ("/health", "/healthz")):
+        self.rate = min(max(float(rate), 0.0), 1.0)
+        self.health_rate = min(max(float(health_rate), 0.0), 1.0)
+        self.slow_ms = float(slow_ms)  # 0 = 遅延では判定しない
+        self.health_paths = frozenset(health_paths)
+
+    def rate_for(self, path: str, status: int, latency_ms: float) -> float:
+        """この記録を残す確率（1.0 = 必ず残す）"""
+        if status >= 400 or (self.slow_ms and latency_ms >= self.slow_ms):
+            return 1.0
+        return self.health_rate if path in self.health_paths else self.rate
+
+    @staticmethod
+    def keep(rate: float) -> bool:
+        return rate >= 1.0 or random.random() < rate
+
+
+class AsyncLogWriter:
+    def __init__(self, log_dir: str, prefix: str = "api", stdout: Optional[TextIO] = sys.stdout,
+                 max_queue: int = 10000, batch_max: int = 512, flush_interval: float = 0.5):
+        self.log_dir = log_dir
+        self.prefix = prefix
+        self.stdout = stdout
+        self.batch_max = max(1, int(batch_max))
+        self.flush_interval = max(0.0, float(flush_interval))
+        self._q: "queue.Queue" = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._file: Optional[TextIO] = None
+        self._file_day: Optional[str] = None
+        # カウンタ（written/failed/unserializable/errors はライタースレッドだけが更新）
+        self.written = 0         # ファイルまで書けた記録
+        self.dropped = 0
+        self.sampled_out = 0
+        self.failed = 0          # ファイルへの書き込みが失敗して失われた記録
+        self.unserializable = 0  # JSON にできなかった記録
+        self.errors = 0          # ファイルへの書き込みの失敗回数
+        os.register_at_fork(after_in_child=self._after_fork)
+        atexit.register(self.close)  # 1 回だけ（fork 後の再起動のたびに足さない。未起動なら close は何もしない）
+
+    # ── 生成側（イベントループ／任意スレッド）
+    def submit(self, record: dict) -> bool:
+        self._ensure_started()
+        try:
+            self._q.put_nowait(record)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def qsize(self) -> int:
+        return self._q.qsize()
+
+    def path_for(self, day: str) -> str:
+        return os.path.join(self.log_dir, f"{self.prefix}-{day}.log")
+
+    # ── ライフサイクル
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def close(self, timeout: float = 2.0) -> None:
+        """キューに残った分を書き切って止める"""
+        t = self._thread
+        if t is None or not t.is_alive():
+            return
+        self._q.put(_STOP)
+        t.join(timeout)
+
+    def _after_fork(self) -> None:
+        # 子プロセスにはスレッドが引き継がれない。キュー・ファイルを作り直し、次の submit で再起動
+        self._q = queue.Queue(maxsize=self._q.maxsize)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._file, self._file_day = None, None
+
+    # ── ライタースレッド
+    def _run(self) -> None:
+        while True:
+            try:
+                first = self._q.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_max and batch[-1] is not _STOP:
+                try:  # 溜まっている分はそのまま、無ければ flush_interval までは待ってまとめる
+                    batch.append(self._q.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            stop = batch[-1] is _STOP
+            self._write([r for r in batch if r is not _STOP])
+            if stop:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                return
+
+    def _write(self, records) -> None:
+        if not records:
+            return
+        lines = []
+        for r in records:
+            try:  # ensure_ascii=False で日本語もそのまま、1行JSON
+                lines.append(json.dumps(r, ensure_ascii=False, default=str))
+            except (TypeError, ValueError):
+                self.unserializable += 1
+        if not lines:
+            return
+        text = "\n".join(lines) + "\n"
+        try:
+            self._current_file().write(text)
+            self._file.flush()
+            self.written += len(lines)
+        except OSError:
+            self.errors += 1
+            self.failed += len(lines)
+        if self.stdout is not None:
+            try:
+                self.stdout.write(text)
+                self.stdout.flush()
+            except (OSError, ValueError):
+                pass
+
+    def _current_file(self) -> TextIO:
+        day = datetime.now().strftime("%Y%m%d")
+        if self._file is None or day != self._file_day:
+            if self._file is not None:
+                self._file.close()
+            os.makedirs(self.log_dir, exist_ok=True)
+            self._file = open(self.path_for(day), "a", encoding="utf-8")
+            self._file_day = day
+        return self._file
+
+    def stats(self) -> dict:
+        return {
+            "written": self.written,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+            "failed": self.failed,
+            "unserializable": self.unserializable,
+            "errors": self.errors,
+            "queue_depth": self.qsize(),
+        }
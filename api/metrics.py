@@ -0,0 +1,294 @@
+# api/metrics.py
+"""
+Prometheus テキスト形式のメトリクス（外部依存なし）。
+記録はスレッドごとのシャードに書くだけでロックを取らない（各シャードの書き手は1スレッドのみ）。
+スクレイプ時に全シャードを合算する。ラベル付き子メトリクスの生成時だけロックを使う。
+"""
+from __future__ import annotations
+import math, os, threading, time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 秒単位のレイテンシ向け既定バケット（0.5ms〜10s）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384)
+
+
+class _Shards:
+    """thread ident → シャード。setdefault は GIL 下で原子的なので登録もロック不要"""
+
+    __slots__ = ("_factory", "_by_thread")
+
+    def __init__(self, factory: Callable[[], list]):
+        self._factory = factory
+        self._by_thread: Dict[int, list] = {}
+
+    def local(self) -> list:
+        tid = threading.get_ident()
+        s = self._by_thread.get(tid)
+        if s is None:
+            s = self._by_thread.setdefault(tid, self._factory())
+        return s
+
+    def all(self) -> List[list]:
+        return list(self._by_thread.values())
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _num(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return repr(int(v)) if float(v).is_integer() and abs(v) < 1e15 else repr(float(v))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (), registry: Optional["Registry"] = None):
+        self.name, self.doc, self.labelnames = name, doc, tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values, **kv):
+        key = tuple(str(kv[n]) for n in self.labelnames) if kv else tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+
+class _CounterChild:
+    __slots__ = ("_shards",)
+
+    def __init__(self):
+        self._shards = _Shards(lambda: [0.0])
+
+    def inc(self, v: float = 1.0) -> None:
+        self._shards.local()[0] += v
+
+    def get(self) -> float:
+        return sum(s[0] for s in self._shards.all())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, v: float = 1.0) -> None:
+        self._children[()].inc(v)
+
+    def samples(self):
+        for key, c in list(self._children.items()):
+            yield f"{self.name}{_fmt_labels(self.labelnames, key)} {_num(c.get())}"
+
+
+class _GaugeChild:
+    """値は1つ（set / inc / dec）。イベントループ上など単一スレッドから更新する前提"""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, v: float) -> None:
+        self.value = v
+
+    def inc(self, v: float = 1.0) -> None:
+        self.value += v
+
+    def dec(self, v: float = 1.0) -> None:
+        self.value -= v
+
+    def get(self) -> float:
+        return self.value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, v: float) -> None:
+        self._children[()].set(v)
+
+    def inc(self, v: float = 1.0) -> None:
+        self._children[()].inc(v)
+
+    def dec(self, v: float = 1.0) -> None:
+        self._children[()].dec(v)
+
+    def get(self) -> float:
+        return self._children[()].get()
+
+    def samples(self):
+        for key, c in list(self._children.items()):
+            yield f"{self.name}{_fmt_labels(self.labelnames, key)} {_num(c.get())}"
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "_shards")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        n = len(buckets)
+        # [bucket0..bucketN-1, +Inf, sum]（非累積。合算時に累積へ）
+        self._shards = _Shards(lambda: [0] * (n + 1) + [0.0])
+
+    def observe(self, v: float) -> None:
+        s = self._shards.local()
+        s[bisect_left(self.buckets, v)] += 1
+        s[-1] += v
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        for s in self._shards.all():
+            for i in range(len(counts)):
+                counts[i] += s[i]
+            total += s[-1]
+        return counts, total
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, doc, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, doc, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, v: float) -> None:
+        self._children[()].observe(v)
+
+    def samples(self):
+        for key, c in list(self._children.items()):
+            counts, total = c.snapshot()
+            cum = 0
+            for le, n in zip(self.buckets + (math.inf,), counts):
+                cum += n
+                le_label = 'le="%s"' % _num(le)
+                yield f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le_label)} {cum}"
+            lab = _fmt_labels(self.labelnames, key)
+            yield f"{self.name}_sum{lab} {_num(total)}"
+            yield f"{self.name}_count{lab} {cum}"
+
+
+class Callback(_Metric):
+    """スクレイプ時に fn() を呼んで値を出すだけのメトリクス（プロセス情報など）"""
+
+    def __init__(self, name, doc, fn: Callable[[], float], kind: str = "gauge", registry=None):
+        self.fn, self.kind = fn, kind
+        super().__init__(name, doc, (), registry)
+
+    def _new_child(self):
+        return None
+
+    def samples(self):
+        try:
+            v = self.fn()
+        except Exception:  # 取得できない値（/proc が無い等）は出さない
+            return
+        yield f"{self.name} {_num(v)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._names = set()
+        self._lock = threading.Lock()
+
+    def register(self, m: _Metric) -> None:
+        with self._lock:
+            if m.name in self._names:
+                raise ValueError(f"duplicate metric: {m.name}")
+            self._names.add(m.name)
+            self._metrics.append(m)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in list(self._metrics):
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ── プロセス情報（読み取り時に /proc から取る。記録側のコストはゼロ）
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def process_rss_bytes() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * _PAGE
+
+
+_IMPORTED_AT = time.time()
+
+
+def process_start_time() -> float:
+    """プロセス開始時刻（UNIX 秒）。/proc が無ければこのモジュールの import 時刻"""
+    try:
+        with open("/proc/self/stat") as f:
+            ticks = int(f.read().rsplit(")", 1)[1].split()[19])  # starttime（comm の後ろから数えて 20 番目）
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        # /proc/stat の btime は秒単位なので、起動からの経過（1/100 秒単位）の差で求める
+        return time.time() - (uptime - ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return _IMPORTED_AT
+
+
+def process_cpu_seconds() -> float:
+    t = os.times()
+    return t.user + t.system
+
+
+def smaps_rollup(pid="self") -> Dict[str, int]:
+    """/proc/<pid>/smaps_rollup をバイト単位で。rss / pss（共有ページを共有数で割った実質量）/ shared / private"""
+    kb: Dict[str, int] = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                kb[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return {
+        "rss": kb.get("Rss", 0),
+        "pss": kb.get("Pss", 0),
+        "shared": kb.get("Shared_Clean", 0) + kb.get("Shared_Dirty", 0),
+        "private": kb.get("Private_Clean", 0) + kb.get("Private_Dirty", 0),
+    }
+
+
+def process_pss_bytes() -> float:
+    return smaps_rollup()["pss"]
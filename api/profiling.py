@@ -0,0 +1,145 @@
+# api/profiling.py
+"""
+リクエスト単位のプロファイル（実行中に ON/OFF できる）。
+サンプルされたリクエストだけが Trace を contextvar に持ち、mark(name) ごとに
+「前の mark からの経過時間・確保済みメモリブロック数の増減（sys.getallocatedblocks）」を区間として記録する。
+集計（ルート × 区間）と遅い順の上位 N 件のトレースをメモリに持ち、/debug/profile で返す。
+無効時のコストは contextvar の読み出し 1 回（mark）と属性参照 1 回（ミドルウェア）だけ。
+"""
+from __future__ import annotations
+import contextvars, gc, heapq, itertools, random, sys, threading, time
+from typing import Dict, List, Optional, Tuple
+
+_current: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("profile_trace", default=None)
+
+
+def _gc_collections() -> int:
+    return sum(s["collections"] for s in gc.get_stats())
+
+
+class Trace:
+    __slots__ = ("started_at", "stages", "_t", "_blocks", "_gc0")
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.stages: List[Tuple[str, float, int]] = []  # (区間名, 秒, ブロック増減)
+        self._gc0 = _gc_collections()
+        self._blocks = sys.getallocatedblocks()
+        self._t = time.perf_counter()
+
+    def mark(self, name: str) -> None:
+        t = time.perf_counter()
+        b = sys.getallocatedblocks()
+        self.stages.append((name, t - self._t, b - self._blocks))
+        self._t, self._blocks = t, b
+
+    @property
+    def total(self) -> float:
+        return sum(s[1] for s in self.stages)
+
+    def to_dict(self, route: str, status: int) -> dict:
+        return {
+            "route": route,
+            "status": status,
+            "started_at": self.started_at,
+            "total_ms": round(self.total * 1000, 3),
+            "gc_collections": _gc_collections() - self._gc0,
+            "stages": [{"stage": n, "ms": round(s * 1000, 3), "alloc_blocks": b} for n, s, b in self.stages],
+        }
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+def mark(name: str) -> None:
+    """サンプル中のリクエストなら区間を切る。それ以外は何もしない"""
+    tr = _current.get()
+    if tr is not None:
+        tr.mark(name)
+
+
+class Profiler:
+    def __init__(self, sample_rate: float = 0.0, top_n: int = 20):
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._gen = 0  # configure ごとに進める。切り替え前に始まったトレースは集計しない
+        self.sample_rate = 0.0
+        self.top_n = 20
+        self.configure(sample_rate, top_n)
+
+    def configure(self, sample_rate: float, top_n: Optional[int] = None) -> None:
+        """設定を変えて集計をリセット（sample_rate=0 で無効）"""
+        with self._lock:
+            self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+            if top_n is not None:
+                self.top_n = max(0, int(top_n))
+            self._gen += 1
+            self._routes: Dict[str, dict] = {}
+            self._slowest: List[tuple] = []  # (total, seq, trace dict) の最小ヒープ
+            self._since = time.time()
+
+    # ── リクエスト側（ミドルウェアから）
+    def start(self):
+        """サンプル対象なら (Trace, token, 世代)、対象外なら None"""
+        rate = self.sample_rate
+        if rate <= 0.0 or (rate < 1.0 and random.random() >= rate):
+            return None
+        tr = Trace()
+        return tr, _current.set(tr), self._gen
+
+    def finish(self, started, route: str, status: int) -> None:
+        tr, token, gen = started
+        tr.mark("respond")  # 最後の mark 以降（レスポンス生成・ミドルウェア）
+        _current.reset(token)
+        total = tr.total
+        with self._lock:
+            if gen != self._gen:
+                return
+            agg = self._routes.setdefault(route, {"count": 0, "total": 0.0, "max": 0.0, "stages": {}})
+            agg["count"] += 1
+            agg["total"] += total
+            agg["max"] = max(agg["max"], total)
+            for name, sec, blocks in tr.stages:
+                st = agg["stages"].setdefault(name, [0, 0.0, 0.0, 0])
+                st[0] += 1
+                st[1] += sec
+                st[2] = max(st[2], sec)
+                st[3] += blocks
+            if self.top_n:
+                item = (total, next(self._seq), tr.to_dict(route, status))
+                if len(self._slowest) < self.top_n:
+                    heapq.heappush(self._slowest, item)
+                elif total > self._slowest[0][0]:
+                    heapq.heapreplace(self._slowest, item)
+
+    # ── 参照側
+    def report(self) -> dict:
+        with self._lock:
+            routes = {}
+            for route, agg in self._routes.items():
+                n, total = agg["count"], agg["total"]
+                routes[route] = {
+                    "requests": n,
+                    "mean_ms": round(total / n * 1000, 3),
+                    "max_ms": round(agg["max"] * 1000, 3),
+                    "stages": {
+                        name: {
+                            "mean_ms": round(s / c * 1000, 3),
+                            "max_ms": round(mx * 1000, 3),
+                            "share": round(s / total, 4) if total else 0.0,
+                            "mean_alloc_blocks": round(b / c, 1),
+                            "count": c,
+                        }
+                        for name, (c, s, mx, b) in agg["stages"].items()
+                    },
+                }
+            slowest = [t for _total, _seq, t in sorted(self._slowest, key=lambda x: -x[0])]
+            return {
+                "enabled": self.sample_rate > 0.0,
+                "sample_rate": self.sample_rate,
+                "top_n": self.top_n,
+                "since": self._since,
+                "routes": routes,
+                "slowest": slowest,
+            }
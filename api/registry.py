@@ -0,0 +1,155 @@
+# api/registry.py
+"""
+名前付きモデルのレジストリ。初回アクセスで遅延ロードし、常駐メモリ合計が予算を超えたら
+最も長く使われていないモデルから追い出す（LRU）。ロード自体は loader に任せる。
+"""
+from __future__ import annotations
+import re, sys, threading, time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+def valid_name(name: str) -> bool:
+    # パスに埋め込むので区切り文字や .. を含む名前は受け付けない
+    return bool(_NAME_RE.match(name)) and ".." not in name
+
+
+def estimate_bytes(obj: Any) -> int:
+    """オブジェクトグラフの概算常駐バイト数（ndarray は nbytes、その他は getsizeof の合計）"""
+    seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        if isinstance(o, np.ndarray):
+            total += o.nbytes if o.base is None else 0  # view は元配列側で数える
+            if o.base is not None:
+                stack.append(o.base)
+            if o.dtype == object:
+                stack.extend(o.ravel().tolist())
+            continue
+        try:
+            total += sys.getsizeof(o)
+        except TypeError:
+            continue
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        elif isinstance(o, (str, bytes, int, float, bool, type(None))):
+            pass
+        else:
+            d = getattr(o, "__dict__", None)
+            if d is not None:
+                stack.append(d)
+            for slot in getattr(type(o), "__slots__", ()):
+                if hasattr(o, slot):
+                    stack.append(getattr(o, slot))
+    return total
+
+
+class _Entry:
+    __slots__ = ("value", "bytes", "load_sec", "loaded_at")
+
+    def __init__(self, value, nbytes, load_sec):
+        self.value, self.bytes, self.load_sec, self.loaded_at = value, nbytes, load_sec, time.time()
+
+
+class ModelRegistry:
+    def __init__(self, loader: Callable[[str], Any], resolve: Callable[[str], Optional[str]],
+                 memory_budget: int = 0, sizer: Callable[[Any], int] = estimate_bytes):
+        self.loader = loader          # path -> 推論用オブジェクト（ModelSnapshot）
+        self.resolve = resolve        # name -> モデルファイルのパス（無ければ None）
+        self.memory_budget = max(0, int(memory_budget))  # 0 = 無制限
+        self.sizer = sizer
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._name_locks: Dict[str, threading.Lock] = {}
+        # 統計（追い出し後も残す）
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self.load_sec: Dict[str, float] = {}
+        self.evictions = 0
+
+    def get(self, name: str):
+        """name のモデルを返す。未ロードならここでロード（同名の同時ロードは1回にまとめる）。無ければ KeyError"""
+        with self._lock:
+            ent = self._entries.get(name)
+            if ent is not None:
+                self._entries.move_to_end(name)
+                self.hits[name] = self.hits.get(name, 0) + 1
+                return ent.value
+        # 名前ごとのロックは実在するモデルにだけ作る（存在しない名前を投げ続けられても増えない）
+        path = self.resolve(name) if valid_name(name) else None
+        if path is None:
+            raise KeyError(name)
+        with self._lock:
+            name_lock = self._name_locks.setdefault(name, threading.Lock())
+        with name_lock:
+            with self._lock:  # 待っている間に別スレッドがロードし終えていればそれを使う
+                ent = self._entries.get(name)
+                if ent is not None:
+                    self._entries.move_to_end(name)
+                    self.hits[name] = self.hits.get(name, 0) + 1
+                    return ent.value
+            t0 = time.perf_counter()
+            value = self.loader(path)
+            el = time.perf_counter() - t0
+            nbytes = self.sizer(value)
+            with self._lock:
+                self.misses[name] = self.misses.get(name, 0) + 1
+                self.load_sec[name] = el
+                self._entries[name] = _Entry(value, nbytes, el)
+                self._evict_over_budget(keep=name)
+            return value
+
+    def _evict_over_budget(self, keep: str) -> None:
+        if not self.memory_budget:
+            return
+        while self.resident_bytes() > self.memory_budget:
+            victim = next((n for n in self._entries if n != keep), None)
+            if victim is None:  # 1個で予算超過でも、今ロードしたものは残す
+                break
+            del self._entries[victim]
+            self.evictions += 1
+
+    def evict(self, name: str) -> bool:
+        with self._lock:
+            return self._entries.pop(name, None) is not None
+
+    def loaded(self) -> List[str]:
+        with self._lock:
+            return list(self._entries)
+
+    def resident_bytes(self) -> int:
+        return sum(e.bytes for e in self._entries.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            names = sorted(set(self.hits) | set(self.misses) | set(self._entries))
+            models = {}
+            for n in names:
+                ent = self._entries.get(n)
+                hits, misses = self.hits.get(n, 0), self.misses.get(n, 0)
+                models[n] = {
+                    "loaded": ent is not None,
+                    "resident_bytes": ent.bytes if ent is not None else 0,
+                    "load_sec": self.load_sec.get(n),
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": hits / (hits + misses) if hits + misses else None,
+                }
+            return {
+                "models": models,
+                "resident_bytes": self.resident_bytes(),
+                "memory_budget": self.memory_budget,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,146 @@
+# api/serve.py
+"""
+prefork 起動。親プロセスでモデルを 1 回だけロードしてから uvicorn の worker を fork する。
+インポート済みモジュールとモデルのページは copy-on-write で全 worker が共有する
+（uvicorn --workers は spawn なので worker ごとに import とロードをやり直し、メモリが worker 数に比例する）。
+
+  python -m api.serve --workers 4 --port 8000
+
+- 待ち受けソケットは親が作って worker に継承させる（同じポートを全 worker が accept）
+- 落ちた worker は作り直す。SIGTERM / SIGINT は全 worker に転送して終了を待つ
+- worker ごとの RSS / PSS を /proc/<pid>/smaps_rollup から定期的に JSON 1行で出す（タスクのメモリ見積もり用）
+- worker では POST /reload を 409 で断る（受けた 1 worker だけ差し替わるため）。モデルの更新は再起動で行う
+"""
+from __future__ import annotations
+import argparse, gc, json, os, signal, socket, sys, time
+from typing import Dict, List, Optional
+
+from api.metrics import smaps_rollup
+
+
+def _bind(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _preload():
+    """親でモデルを用意する（S3 指定なら取得も）。失敗しても worker 側の遅延ロードに任せて起動は続ける"""
+    from api import app as A
+    try:
+        path = A._ensure_model_local()
+        if path:
+            A.load_model(path)
+    except Exception as e:
+        _log(event="preload_failed", err=str(e))
+    # 以降の GC が共有ページ上のオブジェクトヘッダへ書き込まないよう、ロード済みの世代を凍結する
+    gc.collect()
+    gc.freeze()
+    return A.app
+
+
+def _run_worker(app, sock: socket.socket, args) -> None:
+    import uvicorn
+    from api import app as A
+    A.PREFORK_WORKER = True
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, signal.SIG_DFL)
+    config = uvicorn.Config(app, log_level=args.log_level, timeout_keep_alive=args.timeout_keep_alive)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def memory_report(pids: List[int]) -> dict:
+    """worker ごとの rss/pss/shared/private（バイト）と、親を含めた PSS 合計（＝タスクの実質使用量）"""
+    workers = []
+    for pid in pids:
+        try:
+            workers.append({"pid": pid, **smaps_rollup(pid)})
+        except OSError:
+            continue
+    parent = smaps_rollup()
+    return {
+        "workers": workers,
+        "parent": parent,
+        "total_pss": parent["pss"] + sum(w["pss"] for w in workers),
+    }
+
+
+def _log(**fields) -> None:
+    print(json.dumps({"ts": time.time(), **fields}), flush=True)
+
+
+class Supervisor:
+    def __init__(self, app, sock: socket.socket, args):
+        self.app, self.sock, self.args = app, sock, args
+        self.workers: Dict[int, float] = {}  # pid → 起動時刻
+        self.stopping = False
+
+    def spawn(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(self.app, self.sock, self.args)
+            except BaseException:
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = time.monotonic()
+
+    def _on_signal(self, signum, _frame) -> None:
+        self.stopping = True
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self._on_signal)
+        signal.signal(signal.SIGINT, self._on_signal)
+        for _ in range(self.args.workers):
+            self.spawn()
+        _log(event="workers_started", pids=list(self.workers))
+        next_report = time.monotonic() + min(5.0, self.args.memory_report_sec)  # 起動直後に 1 回
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                if self.args.memory_report_sec > 0 and time.monotonic() >= next_report:
+                    _log(event="worker_memory", **memory_report(list(self.workers)))
+                    next_report = time.monotonic() + self.args.memory_report_sec
+                time.sleep(0.2)
+                continue
+            started = self.workers.pop(pid, None)
+            if self.stopping or started is None:
+                continue
+            _log(event="worker_exited", pid=pid, status=os.waitstatus_to_exitcode(status))
+            if time.monotonic() - started < 1.0:
+                time.sleep(1.0)  # 起動直後に落ち続ける場合の fork ループを避ける
+            self.spawn()
+        return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="prefork server: load the model once, then fork uvicorn workers")
+    ap.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    ap.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    ap.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))))
+    ap.add_argument("--memory-report-sec", type=float, default=float(os.getenv("MEMORY_REPORT_SEC", "60")),
+                    help="interval of per-worker RSS/PSS log lines (0 = off)")
+    ap.add_argument("--log-level", default="info")
+    ap.add_argument("--timeout-keep-alive", type=int, default=5)
+    args = ap.parse_args(argv)
+
+    sock = _bind(args.host, args.port)
+    app = _preload()
+    return Supervisor(app, sock, args).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
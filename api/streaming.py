@@ -0,0 +1,232 @@
+# api/streaming.py
+"""
+大量行のストリーミング推論。リクエスト本文（NDJSON / Arrow IPC stream）を読みながら固定行数の
+チャンクに切ってモデルへ通し、結果をできた順に返す。保持するのは常に 1 チャンク分だけなので、
+入力サイズによらずメモリは一定。Arrow は pyarrow がある場合のみ（extras: arrow）。
+"""
+from __future__ import annotations
+import asyncio, io, json, threading, time
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple
+
+import numpy as np
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+
+_pa: Any = False  # pyarrow モジュール / None（未導入）/ False（未確認）。import は重いので Arrow 入力が来たときだけ
+
+
+def load_pyarrow():
+    """pyarrow（と pyarrow.ipc）を初回だけ import して返す。無ければ None"""
+    global _pa
+    if _pa is False:
+        try:
+            import pyarrow
+            import pyarrow.ipc  # noqa: F401
+            _pa = pyarrow
+        except ImportError:  # pragma: no cover - 任意依存
+            _pa = None
+    return _pa
+
+NDJSON_TYPE = "application/x-ndjson"
+ARROW_TYPE = "application/vnd.apache.arrow.stream"
+
+InferFn = Callable[[List[dict]], Tuple[str, np.ndarray]]
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """本文を読みながら応答を流す用。既定の StreamingResponse は ASGI spec<2.4 だと切断監視のために
+    receive() を読み続け、まだ読んでいないリクエスト本文を横取りしてしまうので、それをしない
+    （切断は本文側の ClientDisconnect / 送信側の OSError で検知する）"""
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
+
+
+class _BadRow:
+    __slots__ = ("error",)
+
+    def __init__(self, error: str):
+        self.error = error
+
+
+class StreamStats:
+    """/metrics 用の累計（複数リクエストから同時に更新される）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.rows = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    def record(self, rows: int, errors: int, seconds: float) -> None:
+        with self._lock:
+            self.requests += 1
+            self.rows += rows
+            self.errors += errors
+            self.seconds += seconds
+
+
+# ── 推論（チャンク単位。失敗したら1行ずつやり直して不正行だけをエラーにする）
+def _infer_chunk(infer: InferFn, rows: List[Any]) -> Tuple[Optional[str], List[Any]]:
+    good = [i for i, r in enumerate(rows) if not isinstance(r, _BadRow)]
+    out: List[Any] = [r if isinstance(r, _BadRow) else None for r in rows]
+    key = None
+    if not good:
+        return key, out
+    try:
+        key, vals = infer([rows[i] for i in good])
+        for i, v in zip(good, vals.tolist()):
+            out[i] = v
+    except Exception:
+        for i in good:
+            try:
+                key, vals = infer([rows[i]])
+                out[i] = vals.tolist()[0]
+            except Exception as e:
+                out[i] = _BadRow(str(e))
+    return key, out
+
+
+# ── NDJSON
+async def _ndjson_rows(body: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    buf = b""
+    async for piece in body:
+        buf += piece
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield _parse_line(line)
+    if buf.strip():
+        yield _parse_line(buf)
+
+
+def _parse_line(line: bytes) -> Any:
+    try:
+        row = json.loads(line)
+    except ValueError as e:
+        return _BadRow(f"invalid json: {e}")
+    return row if isinstance(row, dict) else _BadRow("each line must be a JSON object")
+
+
+async def _chunked(rows: AsyncIterator[Any], n: int) -> AsyncIterator[List[Any]]:
+    chunk: List[Any] = []
+    async for r in rows:
+        chunk.append(r)
+        if len(chunk) >= n:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def ndjson_stream(body: AsyncIterator[bytes], infer: InferFn, chunk_rows: int,
+                        stats: Optional[StreamStats] = None) -> AsyncIterator[bytes]:
+    """1行1オブジェクトで {"pred_proba": x} / {"error": "..."} を返し、最終行に {"summary": {...}}"""
+    t0 = time.perf_counter()
+    n = errors = 0
+    async for chunk in _chunked(_ndjson_rows(body), chunk_rows):
+        key, out = await asyncio.to_thread(_infer_chunk, infer, chunk)
+        lines = []
+        for v in out:
+            if isinstance(v, _BadRow):
+                errors += 1
+                lines.append(json.dumps({"error": v.error}, ensure_ascii=False))
+            else:
+                lines.append(json.dumps({key: v}))
+        n += len(out)
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+    el = time.perf_counter() - t0
+    if stats is not None:
+        stats.record(n, errors, el)
+    yield (json.dumps({"summary": _summary(n, errors, el)}) + "\n").encode("utf-8")
+
+
+def _summary(n: int, errors: int, el: float) -> dict:
+    return {"rows": n, "errors": errors, "elapsed_sec": round(el, 6),
+            "rows_per_sec": round(n / el, 1) if el > 0 else None}
+
+
+# ── Arrow IPC stream
+class _BodyReader(io.RawIOBase):
+    """非同期の本文イテレータを、ワーカースレッドからブロッキング read できるファイルに見せる"""
+
+    def __init__(self, body: AsyncIterator[bytes], loop: asyncio.AbstractEventLoop):
+        self._it = body.__aiter__()
+        self._loop = loop
+        self._buf = b""
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buf:
+            if self._eof:
+                return 0
+            try:
+                self._buf = asyncio.run_coroutine_threadsafe(self._it.__anext__(), self._loop).result()
+            except StopAsyncIteration:
+                self._eof = True
+                return 0
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+
+def _next_batch(reader):
+    try:
+        return reader.read_next_batch()
+    except StopIteration:
+        return None
+
+
+async def arrow_stream(body: AsyncIterator[bytes], infer: InferFn, chunk_rows: int,
+                       stats: Optional[StreamStats] = None) -> AsyncIterator[bytes]:
+    """入力の record batch を chunk_rows 行ずつ推論し、結果列1本の Arrow IPC stream で返す。
+    不正行は null（行数・順序は入力と一致）。Arrow には末尾の集計行が無いので rows/sec は /metrics で見る"""
+    pa = load_pyarrow()
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed")
+    t0 = time.perf_counter()
+    n = errors = 0
+    f = io.BufferedReader(_BodyReader(body, asyncio.get_running_loop()), buffer_size=1 << 16)
+    reader = await asyncio.to_thread(pa.ipc.open_stream, f)
+    sink, writer, schema = io.BytesIO(), None, None
+    while True:
+        batch = await asyncio.to_thread(_next_batch, reader)
+        if batch is None:
+            break
+        for start in range(0, batch.num_rows, chunk_rows):
+            rows = batch.slice(start, chunk_rows).to_pylist()
+            key, out = await asyncio.to_thread(_infer_chunk, infer, rows)
+            bad = [isinstance(v, _BadRow) for v in out]
+            errors += sum(bad)
+            vals = [None if b else v for v, b in zip(out, bad)]
+            if writer is None:
+                typ = pa.float64() if key in (None, "pred_proba") else pa.array(vals).type
+                schema = pa.schema([(key or "pred_proba", typ)])
+                writer = pa.ipc.new_stream(sink, schema)
+            arr = pa.array(vals, type=schema.field(0).type)
+            writer.write_batch(pa.record_batch([arr], schema=schema))
+            n += len(out)
+            yield _drain(sink)
+    if writer is None:  # 空入力でも有効な（0 バッチの）ストリームを返す
+        writer = pa.ipc.new_stream(sink, pa.schema([("pred_proba", pa.float64())]))
+    writer.close()
+    yield _drain(sink)
+    if stats is not None:
+        stats.record(n, errors, time.perf_counter() - t0)
+
+
+def _drain(sink: io.BytesIO) -> bytes:
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
@@ -15,8 +15,9 @@ resource "aws_lb_target_group" "api" {
   target_type = "ip"
   vpc_id      = data.aws_vpc.default.id
 
+  # readiness: モデルのウォームアップが終わるまで 503 を返すので、準備前のタスクには振り分けない
   health_check {
-    path                = "/health"
+    path                = "/readyz"
     protocol            = "HTTP"
     interval            = 30
     timeout             = 5
@@ -41,8 +41,17 @@ resource "aws_ecs_task_definition" "api" {
       environment = [
         { name = "MODEL_PATH",   value = "/app/models/model_openml_adult.joblib" },
         { name = "MODEL_S3_URI", value = "s3://<BUCKET>/mlops-sklearn-portfolio/models/latest/model_openml_adult.joblib" },
-        { name = "LOG_JSON",     value = "1" }
+        { name = "LOG_JSON",     value = "1" },
+        { name = "FAST_START",   value = "1" }
       ]
+      # liveness はモデルの有無と無関係な /healthz（イメージに curl が無いので python で叩く）
+      healthCheck = {
+        command     = ["CMD-SHELL", "python -c \"import urllib.request; urllib.request.urlopen('http://127.0.0.1:${var.container_port}/healthz', timeout=2)\" || exit 1"]
+        interval    = 15
+        timeout     = 5
+        retries     = 3
+        startPeriod = 10
+      }
       logConfiguration = {
         logDriver = "awslogs"
         options = {
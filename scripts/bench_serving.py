@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+推論経路のマイクロベンチ（1行あたり μs）。
+  preprocess: _normalize_batch + pre.transform  vs  コンパイル済みエンコーダ
+  classifier: clf.predict_proba                 vs  平坦化 HGB 評価器
+  end2end   : model.predict_proba(_normalize_batch(rows))  vs  _infer(rows)
+  decode    : json.loads + pydantic Rows                   vs  codec.decode_batch（列バッファへ直接）
+  encode    : jsonable_encoder + JSONResponse.render       vs  codec.encode_predictions（ndarray から直接）
+  ※ us/row の値はそのまま ms / 1k rows として読める
+Usage:
+  python scripts/bench_serving.py --dataset adult
+  python scripts/bench_serving.py --dataset local --model models/model_local_csv.joblib --sizes 1,32,1024
+"""
+from __future__ import annotations
+import argparse, json, os, sys, time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "src")]
+
+from datasets import load_dataset  # noqa: E402
+from opt_threshold import default_model_path  # noqa: E402
+
+
+def per_row_us(fn, data, n_rows: int, min_sec: float = 0.3) -> float:
+    fn(data)  # warm-up
+    n, t0 = 0, time.perf_counter()
+    while True:
+        fn(data)
+        n += 1
+        el = time.perf_counter() - t0
+        if el >= min_sec and n >= 3:
+            return el / n / n_rows * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dataset", choices=["builtin", "adult", "credit-g", "local"], default="builtin")
+    ap.add_argument("--model", default=None)
+    ap.add_argument("--sizes", default="1,32,1024")
+    args = ap.parse_args()
+
+    X, _y, dsname = load_dataset(args.dataset)
+    model_path = args.model or default_model_path(dsname)
+    if not os.path.exists(model_path):
+        raise SystemExit(f"model not found: {model_path}")
+
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from api import app as A, codec
+    A.load_model(model_path)
+    snap = A._snap
+    pre, clf = snap.model.named_steps["pre"], snap.model.steps[-1][1]
+    if snap.encoder is None or snap.flat is None:
+        raise SystemExit("this model cannot be compiled (encoder or flat evaluator unavailable)")
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    rows_all = X.sample(n=max(sizes), replace=len(X) < max(sizes), random_state=0).to_dict(orient="records")
+    Xt_all = snap.encoder.transform(rows_all)
+    proba_all = A._infer(rows_all)[1]
+    clean = [{k: (None if isinstance(v, float) and v != v else v) for k, v in r.items()} for r in rows_all]  # NaN → null
+    bodies = {n: json.dumps({"rows": clean[:n]}, default=float).encode() for n in sizes}
+
+    cases = {  # name: (baseline, fast, n -> 入力)
+        "preprocess": (lambda r: pre.transform(A._normalize_batch(r)), snap.encoder.transform, lambda n: rows_all[:n]),
+        "classifier": (clf.predict_proba, snap.flat.predict_proba, lambda n: Xt_all[:n]),
+        "end2end": (lambda r: snap.model.predict_proba(A._normalize_batch(r)), A._infer, lambda n: rows_all[:n]),
+        "decode": (lambda b: A.Rows.model_validate(json.loads(b)),
+                   lambda b: codec.decode_batch(b, snap.required_cols, snap.numeric_cols), bodies.__getitem__),
+        "encode": (lambda p: JSONResponse(jsonable_encoder({"pred_proba": p.tolist()})).body,
+                   lambda p: codec.encode_predictions("pred_proba", p), lambda n: proba_all[:n]),
+    }
+    results = {}
+    for name, (base_fn, fast_fn, make) in cases.items():
+        print(f"\n### {name}\n| batch | baseline [us/row] | fast [us/row] | speedup |\n|-:|-:|-:|-:|")
+        results[name] = []
+        for n in sizes:
+            data = make(n)
+            base, fast = per_row_us(base_fn, data, n), per_row_us(fast_fn, data, n)
+            results[name].append({"batch": n, "baseline_us": base, "fast_us": fast, "speedup": base / fast})
+            print(f"| {n} | {base:.1f} | {fast:.2f} | x{base / fast:.1f} |")
+
+    os.makedirs("artifacts", exist_ok=True)
+    out = f"artifacts/bench_serving_{dsname}.json"
+    with open(out, "w") as f:
+        json.dump({"dataset": dsname, "model_path": os.path.basename(model_path),
+                   **results, "generated_at": int(time.time())}, f, indent=2)
+    print(f"-> {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+推論 API の負荷試験（docker / hey 不要）。load_dataset から行をサンプルして実データに近い本文を作り、
+/predict・/predict_batch・/predict_stream を closed-loop（並列数固定）か open-loop（目標 RPS 固定）で叩く。
+  closed: N 本のワーカーが応答を待っては次を送る（スループット上限を見る）
+  open  : 到着時刻を先に決めて送る（一定 or ポアソン）。レイテンシは「予定時刻」から測るので、
+          サーバが詰まったときの待ちも数字に出る（coordinated omission を避ける）
+結果（p50/p95/p99/p99.9・エラー率・達成 RPS）は artifacts/loadtest_<endpoint>_<mode>_<時刻>.json に保存し、
+--compare で複数の結果を横並びにできる。
+Usage:
+  python scripts/loadtest.py --url http://127.0.0.1:8000 --endpoint predict --mode closed --concurrency 16
+  python scripts/loadtest.py --inprocess --model models/model_local_csv.joblib --dataset local \\
+      --endpoint predict_batch --batch 64 --mode open --rps 50 --duration 20
+  python scripts/loadtest.py --compare artifacts/loadtest_a.json artifacts/loadtest_b.json
+"""
+from __future__ import annotations
+import argparse, asyncio, json, os, random, socket, subprocess, sys, threading, time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "src")]
+
+PERCENTILES = (50, 95, 99, 99.9)
+ENDPOINTS = ("predict", "predict_batch", "predict_stream")
+
+
+# ── 本文の生成
+def _clean(row: dict) -> dict:
+    # NaN は JSON の null に（クライアントが実際に送る形）
+    return {k: (None if isinstance(v, float) and v != v else v.item() if hasattr(v, "item") else v)
+            for k, v in row.items()}
+
+
+def sample_rows(X, n: int, seed: int = 0) -> List[dict]:
+    return [_clean(r) for r in X.sample(n=n, replace=len(X) < n, random_state=seed).to_dict(orient="records")]
+
+
+def build_bodies(rows: List[dict], endpoint: str, batch: int, stream_rows: int,
+                 pool: int = 64) -> Tuple[List[bytes], str, int]:
+    """→ (本文のプール, content-type, 1本文あたりの行数)。送信中に JSON 化しないよう先に bytes にしておく"""
+    rng = random.Random(0)
+    if endpoint == "predict":
+        return [json.dumps({"features": r}).encode() for r in rows[:pool]], "application/json", 1
+    if endpoint == "predict_batch":
+        return ([json.dumps({"rows": rng.sample(rows, min(batch, len(rows)))}).encode() for _ in range(pool)],
+                "application/json", batch)
+    ndjson = [("\n".join(json.dumps(r) for r in rng.choices(rows, k=stream_rows)) + "\n").encode()
+              for _ in range(min(pool, 8))]
+    return ndjson, "application/x-ndjson", stream_rows
+
+
+# ── 計測
+class Recorder:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.status: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+
+    def add(self, latency: float, status: Optional[int], error: Optional[str] = None) -> None:
+        if error is not None:
+            self.errors[error] = self.errors.get(error, 0) + 1
+            return
+        self.status[str(status)] = self.status.get(str(status), 0) + 1
+        if 200 <= status < 300:
+            self.latencies.append(latency)
+
+    def summary(self, elapsed: float, rows_per_request: int) -> dict:
+        ok = len(self.latencies)
+        total = ok + sum(v for k, v in self.status.items() if not k.startswith("2")) + sum(self.errors.values())
+        lat = np.asarray(self.latencies) * 1000.0
+        pct = {f"p{p:g}_ms": round(float(np.percentile(lat, p)), 3) if ok else None for p in PERCENTILES}
+        return {
+            "requests": total,
+            "ok": ok,
+            "error_rate": round((total - ok) / total, 5) if total else 0.0,
+            "status": self.status,
+            "errors": self.errors,
+            "achieved_rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "ok_rows_per_sec": round(ok * rows_per_request / elapsed, 1) if elapsed else 0.0,
+            "mean_ms": round(float(lat.mean()), 3) if ok else None,
+            **pct,
+            "max_ms": round(float(lat.max()), 3) if ok else None,
+        }
+
+
+async def _send(client, url: str, body: bytes, ctype: str, headers: dict, rec: Optional[Recorder],
+                t_start: float) -> None:
+    """1 リクエスト。rec が None（ウォームアップ中に出したもの）なら結果を捨てる"""
+    try:
+        r = await client.post(url, content=body, headers={"content-type": ctype, **headers})
+        await r.aread()
+        if rec is not None:
+            rec.add(time.perf_counter() - t_start, r.status_code)
+    except Exception as e:  # 接続拒否・タイムアウト等はエラー種別ごとに数える
+        if rec is not None:
+            rec.add(0.0, None, type(e).__name__)
+
+
+async def run_closed(client, url, bodies, ctype, headers, rec, concurrency, duration, warmup) -> float:
+    t_rec = time.perf_counter() + warmup
+    t_end = t_rec + duration
+
+    async def worker(i: int):
+        k = i
+        while time.perf_counter() < t_end:
+            t0 = time.perf_counter()
+            await _send(client, url, bodies[k % len(bodies)], ctype, headers, rec if t0 >= t_rec else None, t0)
+            k += concurrency
+
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return duration
+
+
+async def run_open(client, url, bodies, ctype, headers, rec, rps, duration, warmup, poisson, max_inflight) -> float:
+    rng = random.Random(1)
+    t0 = time.perf_counter()
+    t_rec, t_end = t0 + warmup, t0 + warmup + duration
+    tasks, scheduled, k = set(), t0, 0
+    while scheduled < t_end:
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        target = rec if scheduled >= t_rec else None
+        if len(tasks) >= max_inflight:  # クライアント側の上限。送れなかった分もエラーとして残す
+            if target is not None:
+                target.add(0.0, None, "client_overflow")
+        else:
+            t = asyncio.ensure_future(_send(client, url, bodies[k % len(bodies)], ctype, headers, target, scheduled))
+            tasks.add(t)
+            t.add_done_callback(tasks.discard)
+        k += 1
+        scheduled += rng.expovariate(rps) if poisson else 1.0 / rps
+    if tasks:
+        await asyncio.gather(*tasks)
+    return duration
+
+
+# ── サーバ（--inprocess）
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_inprocess(model_path: str):
+    """同じプロセスの別スレッドで uvicorn を起動（--url 不要で完結させる）。→ (base url, server)"""
+    import uvicorn
+    os.environ["MODEL_PATH"] = model_path
+    from api import app as A
+    A._log_writer.stdout = None  # アクセスログはファイルにだけ（計測結果の表示に混ぜない）
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(A.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="loadtest-server", daemon=True).start()
+    deadline = time.time() + 60
+    while not server.started and time.time() < deadline:
+        time.sleep(0.05)
+    if not server.started:
+        raise SystemExit("in-process server did not start")
+    if A._snap is None or A._snap.path != model_path:  # 先に import 済み・FAST_START などで未ロードなら明示的に
+        A.load_model(model_path)
+    return f"http://127.0.0.1:{port}", server
+
+
+def _git_sha() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# ── 比較
+def compare(paths: List[str]) -> None:
+    runs = []
+    for p in paths:
+        with open(p) as f:
+            runs.append(json.load(f))
+    keys = ["achieved_rps", "ok_rows_per_sec", "error_rate", "mean_ms",
+            *[f"p{p:g}_ms" for p in PERCENTILES], "max_ms"]
+    print("| metric | " + " | ".join(os.path.basename(p) for p in paths) + " |")
+    print("|---|" + "-:|" * len(paths))
+
+    def load(r):  # closed は並列数、open は目標 RPS が意味を持つ
+        c = r["config"]
+        if c["mode"] == "closed":
+            return f'c={c["concurrency"]}'
+        return f'{c["rps"]:g} rps' + (" (poisson)" if c.get("poisson") else "")
+
+    rows = {"endpoint": lambda r: r["config"]["endpoint"], "mode": lambda r: r["config"]["mode"], "load": load,
+            "rows/req": lambda r: {"predict": 1, "predict_batch": r["config"]["batch"]}.get(
+                r["config"]["endpoint"], r["config"]["stream_rows"]),
+            "git_sha": lambda r: r.get("git_sha")}
+    for name, fn in rows.items():
+        print(f"| {name} | " + " | ".join(str(fn(r)) for r in runs) + " |")
+    for k in keys:
+        print(f"| {k} | " + " | ".join(str(r["result"].get(k)) for r in runs) + " |")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="load test for the prediction API (open/closed loop)")
+    ap.add_argument("--url", default=os.getenv("BENCH_URL", "http://127.0.0.1:8000"))
+    ap.add_argument("--inprocess", action="store_true", help="start the API in this process (needs --model)")
+    ap.add_argument("--model", default=None)
+    ap.add_argument("--dataset", choices=["builtin", "adult", "credit-g", "local"], default="builtin")
+    ap.add_argument("--endpoint", choices=ENDPOINTS, default="predict")
+    ap.add_argument("--mode", choices=["closed", "open"], default="closed")
+    ap.add_argument("--concurrency", type=int, default=16, help="closed-loop workers")
+    ap.add_argument("--rps", type=float, default=100.0, help="open-loop target requests/sec")
+    ap.add_argument("--poisson", action="store_true", help="open-loop: exponential inter-arrival times")
+    ap.add_argument("--max-inflight", type=int, default=1000, help="open-loop: client-side cap on outstanding requests")
+    ap.add_argument("--duration", type=float, default=30.0)
+    ap.add_argument("--warmup", type=float, default=2.0, help="seconds excluded from the results")
+    ap.add_argument("--batch", type=int, default=32, help="rows per /predict_batch request")
+    ap.add_argument("--stream-rows", type=int, default=1000, help="rows per /predict_stream request")
+    ap.add_argument("--deadline-ms", type=float, default=None, help="send X-Request-Deadline-Ms")
+    ap.add_argument("--timeout", type=float, default=30.0)
+    ap.add_argument("--out", default=None)
+    ap.add_argument("--compare", nargs="+", metavar="JSON", help="print saved results side by side and exit")
+    args = ap.parse_args(argv)
+
+    if args.compare:
+        compare(args.compare)
+        return 0
+    try:
+        import httpx
+    except ImportError:
+        raise SystemExit("httpx is required: pip install -e '.[dev]'")
+
+    from datasets import load_dataset
+    X, _y, dsname = load_dataset(args.dataset)
+    server = None
+    url = args.url.rstrip("/")
+    if args.inprocess:
+        from opt_threshold import default_model_path
+        model_path = args.model or default_model_path(dsname)
+        if not os.path.exists(model_path):
+            raise SystemExit(f"model not found: {model_path}")
+        url, server = start_inprocess(model_path)
+
+    rows = sample_rows(X, max(256, args.batch, args.stream_rows))
+    bodies, ctype, rows_per_req = build_bodies(rows, args.endpoint, args.batch, args.stream_rows)
+    headers = {"x-request-deadline-ms": f"{args.deadline_ms:g}"} if args.deadline_ms else {}
+    rec = Recorder()
+    conns = args.concurrency if args.mode == "closed" else args.max_inflight
+    limits = httpx.Limits(max_connections=conns, max_keepalive_connections=conns)
+
+    async def go():
+        async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+            target = f"{url}/{args.endpoint}"
+            if args.mode == "closed":
+                return await run_closed(client, target, bodies, ctype, headers, rec,
+                                        args.concurrency, args.duration, args.warmup)
+            return await run_open(client, target, bodies, ctype, headers, rec, args.rps, args.duration,
+                                  args.warmup, args.poisson, args.max_inflight)
+
+    elapsed = asyncio.run(go())
+    if server is not None:
+        server.should_exit = True
+    result = rec.summary(elapsed, rows_per_req)
+    config = {k: v for k, v in vars(args).items() if k not in ("compare", "out")}
+    config["url"] = url
+    doc = {"config": config, "result": result, "git_sha": _git_sha(), "generated_at": int(time.time())}
+
+    print(json.dumps(result, indent=2))
+    os.makedirs("artifacts", exist_ok=True)
+    out = args.out or time.strftime(f"artifacts/loadtest_{args.endpoint}_{args.mode}_%Y%m%d_%H%M%S.json")
+    with open(out, "w") as f:
+        json.dump(doc, f, indent=2)
+    print(f"-> {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+本番で効く関数のマイクロベンチと、基準値（baseline）に対する劣化チェック。
+  normalize        : api.app._normalize_batch（rows → DataFrame）
+  load_model       : api.app.load_model（joblib 読み込み + スナップショット構築）
+  extract_columns  : api.app._extract_columns_from_model
+  predict_proba    : model.predict_proba（バッチサイズ別）
+  preprocess       : build_preprocessor(X) を fit したものの transform
+  best_threshold   : opt_threshold.best_threshold_f1
+  importance       : perm_importance.compute_importance（n_repeats=2）
+データは synthetic（数値+カテゴリ、欠損あり）と builtin（breast cancer）。
+1 呼び出しあたりの時間を repeat 回測り、最速値（他プロセスの割り込みを最も受けにくい）が baseline の最速値より
+tolerance 以上遅いものを劣化として報告する（終了コード 1）。中央値も記録する。結果には train.py と同じ環境情報（python / sklearn / pandas / git commit）を添える。
+Usage:
+  python scripts/microbench.py                          # 計測して artifacts/microbench_<時刻>.json、baseline があれば比較
+  python scripts/microbench.py --save-baseline          # 今回の結果を baseline にする
+  python scripts/microbench.py --only predict_proba,normalize --sizes 1,100 --tolerance 0.2
+"""
+from __future__ import annotations
+import argparse, json, os, platform, statistics, sys, tempfile, time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "src")]
+
+DEFAULT_BASELINE = "artifacts/microbench_baseline.json"
+IMPORTANCE_MAX_ROWS = 2000  # compute_importance は列数 × repeat 回の predict なので大きいサイズは測らない
+
+
+def synthetic(n: int, seed: int = 0):
+    """数値 6 列 + カテゴリ 3 列（欠損 5%）の二値分類データ"""
+    rng = np.random.RandomState(seed)
+    num = rng.normal(size=(n, 6))
+    X = pd.DataFrame(num, columns=[f"x{i}" for i in range(6)])
+    for i, k in enumerate((3, 8, 20)):
+        X[f"c{i}"] = pd.Series(rng.randint(0, k, n)).map(lambda v, i=i: f"c{i}_{v}").astype(object)
+    X = X.mask(rng.rand(*X.shape) < 0.05)
+    logit = num[:, 0] - 0.5 * num[:, 1] + (X["c0"] == "c0_1").to_numpy()
+    y = pd.Series((logit + rng.normal(scale=0.5, size=n) > 0).astype(int))
+    return X, y
+
+
+def time_call(fn: Callable[[], object], repeat: int, min_time: float) -> dict:
+    """repeat 回 × loops 回呼んで 1 呼び出しあたりの秒を返す。loops は 1 回の計測が min_time/repeat 以上になるよう決める"""
+    fn()  # warm-up
+    loops, target = 1, min_time / repeat
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        el = time.perf_counter() - t0
+        if el >= target or loops >= 1 << 20:
+            break
+        loops = max(loops * 2, int(loops * target / max(el, 1e-9)))
+    runs = [el / loops]
+    for _ in range(repeat - 1):
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        runs.append((time.perf_counter() - t0) / loops)
+    return {"median_us": statistics.median(runs) * 1e6, "min_us": min(runs) * 1e6, "loops": loops,
+            "repeat": repeat}
+
+
+def build_cases(datasets: List[str], sizes: List[int], workdir: str) -> Dict[str, Callable[[], object]]:
+    """→ {"<case>/<dataset>/<size>": 引数なしで呼べる関数}。データとモデルはここで用意しておく"""
+    from joblib import dump
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    from sklearn.pipeline import Pipeline
+    import train
+    from opt_threshold import best_threshold_f1
+    from perm_importance import compute_importance
+    from api import app as A
+
+    A._log_writer.stdout = None  # load_model の model_loaded ログを表に混ぜない
+    cases: Dict[str, Callable[[], object]] = {}
+    n_max = max(sizes)
+    for ds in datasets:
+        if ds == "synthetic":
+            X, y = synthetic(max(n_max, 2000))
+        else:
+            from datasets import load_dataset
+            X, y, _ = load_dataset(ds)
+        X = X.reset_index(drop=True)
+        y = pd.Series(np.asarray(y), name="y")
+        model = Pipeline([("pre", train.build_preprocessor(X)),
+                          ("clf", HistGradientBoostingClassifier(max_iter=50, random_state=0))]).fit(X, y)
+        path = os.path.join(workdir, f"model_{ds}.joblib")
+        dump(model, path)
+        A.load_model(path)
+        snap = A._snap
+        pre = train.build_preprocessor(X).fit(X)
+        big = X.sample(n=n_max, replace=len(X) < n_max, random_state=0).reset_index(drop=True)
+        ybig = y.sample(n=n_max, replace=len(y) < n_max, random_state=0).reset_index(drop=True)
+        rows_all = big.to_dict(orient="records")
+        scores_all = model.predict_proba(big)[:, 1]
+
+        # サイズに依存しないもの
+        cases[f"load_model/{ds}/-"] = lambda p=path: A.load_model(p)
+        cases[f"extract_columns/{ds}/-"] = lambda m=model: A._extract_columns_from_model(m)
+        for n in sizes:
+            rows, Xn, yn, sc = rows_all[:n], big.iloc[:n], ybig.iloc[:n].to_numpy(), scores_all[:n]
+            cases[f"normalize/{ds}/{n}"] = lambda r=rows, s=snap: A._normalize_batch(r, s)
+            cases[f"predict_proba/{ds}/{n}"] = lambda x=Xn, m=model: m.predict_proba(x)
+            cases[f"preprocess/{ds}/{n}"] = lambda x=Xn, p=pre: p.transform(x)
+            if n >= 10 and len(np.unique(yn)) == 2:
+                cases[f"best_threshold/{ds}/{n}"] = lambda t=yn, s=sc: best_threshold_f1(t, s)
+            if 100 <= n <= IMPORTANCE_MAX_ROWS and len(np.unique(yn)) == 2:
+                cases[f"importance/{ds}/{n}"] = lambda x=Xn, t=ybig.iloc[:n], m=model: compute_importance(
+                    m, x, t, n_repeats=2, scorer_name="roc_auc", max_samples=None, seed=0)
+    return cases
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float,
+            min_delta_us: float = 1.0) -> List[dict]:
+    """baseline と共通のケースを最速値で比べる。tolerance を超えて遅く、かつ差が min_delta_us 以上なら regression"""
+    out = []
+    for key, cur in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        ratio = cur["min_us"] / base["min_us"] if base["min_us"] > 0 else float("inf")
+        regressed = ratio > 1.0 + tolerance and cur["min_us"] - base["min_us"] >= min_delta_us
+        out.append({"case": key, "baseline_us": base["min_us"], "current_us": cur["min_us"],
+                    "ratio": ratio, "regression": regressed})
+    return out
+
+
+def _env() -> dict:
+    import train
+    return {**train.env_metadata(), "numpy": np.__version__, "machine": platform.machine(),
+            "cpu_count": os.cpu_count()}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="microbenchmarks for hot functions with baseline regression check")
+    ap.add_argument("--datasets", default="synthetic,builtin")
+    ap.add_argument("--sizes", default="1,100,1000,10000")
+    ap.add_argument("--only", default=None, help="comma-separated case names (e.g. predict_proba,normalize)")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--min-time", type=float, default=0.5, help="seconds spent per case (all repeats)")
+    ap.add_argument("--threads", type=int, default=1, help="BLAS/OpenMP threads (threadpoolctl)")
+    ap.add_argument("--baseline", default=DEFAULT_BASELINE)
+    ap.add_argument("--tolerance", type=float, default=0.3, help="allowed slowdown vs baseline (0.3 = +30%%)")
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args(argv)
+
+    from threadpoolctl import threadpool_limits
+    sizes = sorted({int(s) for s in args.sizes.split(",")})
+    only = set(args.only.split(",")) if args.only else None
+    os.makedirs("artifacts", exist_ok=True)
+
+    results: Dict[str, dict] = {}
+    with tempfile.TemporaryDirectory() as workdir, threadpool_limits(limits=args.threads):
+        cases = build_cases(args.datasets.split(","), sizes, workdir)
+        print("| case | dataset | size | median [us] | min [us] | loops |\n|---|---|-:|-:|-:|-:|")
+        for key, fn in cases.items():
+            if only and key.split("/")[0] not in only:
+                continue
+            r = results[key] = time_call(fn, args.repeat, args.min_time)
+            print(f"| {' | '.join(key.split('/'))} | {r['median_us']:.1f} | {r['min_us']:.1f} | {r['loops']} |")
+
+    config = {k: getattr(args, k) for k in ("datasets", "sizes", "repeat", "min_time", "threads")}
+    doc = {"env": _env(), "config": config, "generated_at": int(time.time()), "results": results}
+    out = args.out or time.strftime("artifacts/microbench_%Y%m%d_%H%M%S.json")
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            base = json.load(f)
+        changed = {k: (base["env"].get(k), v) for k, v in doc["env"].items()
+                   if k != "git_commit" and base["env"].get(k) != v}
+        if changed:
+            print(f"[WARN] environment differs from baseline: {changed}")
+        rows = compare(results, base["results"], args.tolerance)
+        doc["comparison"] = {"baseline": args.baseline, "baseline_commit": base["env"].get("git_commit"),
+                             "tolerance": args.tolerance, "cases": rows}
+        print(f"\n### vs baseline ({base['env'].get('git_commit')}, tolerance +{args.tolerance:.0%})")
+        print("| case | baseline min [us] | current min [us] | ratio | |\n|---|-:|-:|-:|---|")
+        for r in rows:
+            print(f"| {r['case']} | {r['baseline_us']:.1f} | {r['current_us']:.1f} | x{r['ratio']:.2f} | "
+                  f"{'REGRESSION' if r['regression'] else ''} |")
+        regressions = [r["case"] for r in rows if r["regression"]]
+    with open(out, "w") as f:
+        json.dump(doc, f, indent=2)
+    print(f"-> {out}")
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(doc, f, indent=2)
+        print(f"-> baseline {args.baseline}")
+    if regressions:
+        print(f"[FAIL] {len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
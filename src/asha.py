@@ -0,0 +1,241 @@
+# src/asha.py
+"""
+非同期 Successive Halving（ASHA）の探索器（train.py --search asha）。
+HalvingGridSearchCV は段ごとに同期する（段の全候補が終わるまで昇格しない）ので、遅い候補が残ると worker が遊ぶ。
+ここでは worker が空くたびに次の仕事を 1 つ決める:
+  - 上の段から順に「その段で終わった結果の上位 1/factor に入っていて、まだ昇格していない候補」があれば 1 つ上の段へ
+  - 無ければ新しい候補を最下段で始める
+資源は学習行数（n_samples: 段ごとに固定の層化サブサンプル）か HGB の反復回数（max_iter）。
+候補はグリッド（param_grid_from_env の全組み合わせ）か、連続分布からのランダムサンプル（ASHA_SPACE=random）。
+評価は loky のプロセスプールで 1 仕事 = (候補, 段) の CV 全 fold。学習データは一度だけファイルに置き、worker ごとに 1 回読む。
+結果は HalvingGridSearchCV と同じ形の cv_results_（行 = 候補 × 段）と best_params_ / best_estimator_ に加えて、
+最良スコアが出た時刻（time_to_best_）と worker の稼働率を残す。
+"""
+from __future__ import annotations
+import math, os, shutil, tempfile, time
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from joblib import dump, load
+from joblib.executor import get_memmapping_executor
+from sklearn.base import clone
+from sklearn.metrics import check_scoring
+from sklearn.model_selection import ParameterGrid, ParameterSampler, train_test_split
+
+# 資源: n_samples（学習行数）/ max_iter（HGB の反復回数）
+ASHA_RESOURCE = os.getenv("ASHA_RESOURCE", "n_samples")
+# 候補空間: grid（GRID_* の全組み合わせ）/ random（連続分布から ASHA_CANDIDATES 個）
+ASHA_SPACE = os.getenv("ASHA_SPACE", "grid")
+# random のときの候補数（grid では 0 = 全組み合わせ）
+ASHA_CANDIDATES = int(os.getenv("ASHA_CANDIDATES", "0"))
+
+_DATA: Dict[str, tuple] = {}  # path → (X, y)。worker ごとに 1 回だけ読む
+
+
+def random_space() -> dict:
+    """ASHA_SPACE=random の候補分布（グリッドの範囲を連続に広げたもの）"""
+    from scipy.stats import loguniform, randint
+    return {
+        "clf__max_depth": [None, 3, 4, 5, 6, 8, 10],
+        "clf__learning_rate": loguniform(0.02, 0.3),
+        "clf__max_leaf_nodes": randint(15, 256),
+        "clf__l2_regularization": loguniform(1e-4, 1.0),
+    }
+
+
+def rung_resources(min_resources: float, max_resources: float, factor: int) -> List[int]:
+    """段ごとの資源 r_min·factor^k（最後の段は max_resources まで）"""
+    n = 1 + int(math.floor(math.log(max(max_resources / min_resources, 1), factor) + 1e-9))
+    res = [int(round(min_resources * factor ** k)) for k in range(n)]
+    res[-1] = int(max_resources)
+    return res
+
+
+def _subsample(X, y, n: int, seed: int):
+    if n >= len(X):
+        return X, y
+    Xs, _, ys, _ = train_test_split(X, y, train_size=n, stratify=y, random_state=seed)
+    return Xs, ys
+
+
+def _evaluate(data_path: str, estimator, params: dict, resource: str, r: int, rung: int, cv, scoring,
+              error_score: float, seed: int) -> dict:
+    """worker 側: (候補, 段) を CV で評価する"""
+    t_start = time.time()
+    if data_path not in _DATA:
+        _DATA[data_path] = load(data_path)
+    X, y = _DATA[data_path]
+    if resource == "n_samples":
+        X, y = _subsample(X, y, r, seed + rung)  # 同じ段の候補は同じサブサンプルで比べる
+    else:
+        params = {**params, "clf__max_iter": r}
+    scorer = check_scoring(estimator, scoring=scoring)
+    scores, fit_times, score_times = [], [], []
+    for tr, te in cv.split(X, y):
+        est = clone(estimator).set_params(**params)
+        t0 = time.perf_counter()
+        try:
+            est.fit(X.iloc[tr], y.iloc[tr])
+            t1 = time.perf_counter()
+            scores.append(float(scorer(est, X.iloc[te], y.iloc[te])))
+        except Exception:
+            t1 = time.perf_counter()
+            scores.append(error_score)  # 失敗は error_score で足切り
+        fit_times.append(t1 - t0)
+        score_times.append(time.perf_counter() - t1)
+    return {"scores": scores, "fit_times": fit_times, "score_times": score_times, "n_rows": len(X),
+            "pid": os.getpid(), "worker_start": t_start, "worker_end": time.time()}
+
+
+class AshaSearchCV:
+    """ASHA で候補を探して最良パラメータで refit する。train.py が使う属性は HalvingGridSearchCV と揃える"""
+
+    def __init__(self, estimator, param_distributions: dict, scoring="roc_auc", cv=None, factor: int = 3,
+                 min_resources: Optional[int] = None, resource: str = ASHA_RESOURCE, space: str = ASHA_SPACE,
+                 n_candidates: int = ASHA_CANDIDATES, n_jobs: int = 1, error_score: float = 0.0,
+                 random_state: int = 0, workdir: str = "cache", verbose: int = 0):
+        self.estimator = estimator
+        self.param_distributions = param_distributions
+        self.scoring = scoring
+        self.cv = cv
+        self.factor = factor
+        self.min_resources = min_resources
+        self.resource = resource
+        self.space = space
+        self.n_candidates = n_candidates
+        self.n_jobs = n_jobs
+        self.error_score = error_score
+        self.random_state = random_state
+        self.workdir = workdir
+        self.verbose = verbose
+
+    def _candidates(self) -> List[dict]:
+        if self.space == "random":
+            sampled = ParameterSampler(random_space(), n_iter=self.n_candidates or 27, random_state=self.random_state)
+            # numpy のスカラーは summary の JSON に書けるよう Python の値へ
+            return [{k: v.item() if isinstance(v, np.generic) else v for k, v in p.items()} for p in sampled]
+        grid = list(ParameterGrid(self.param_distributions))
+        order = np.random.RandomState(self.random_state).permutation(len(grid))
+        grid = [grid[i] for i in order]  # 始める順で結果が偏らないように混ぜる
+        return grid[:self.n_candidates] if self.n_candidates else grid
+
+    def _resources(self, n_rows: int, n_cand: int) -> List[int]:
+        if self.resource == "max_iter":
+            max_r = self.estimator.get_params().get("clf__max_iter", 100)
+            return rung_resources(max(1, max_r / self.factor ** int(math.log(max(n_cand, 1), self.factor))),
+                                  max_r, self.factor)
+        n_splits = self.cv.get_n_splits()
+        max_r = n_rows
+        # 指定が無ければ HalvingGridSearchCV の 'exhaust' と同じく候補数から最下段を決める
+        min_r = self.min_resources or max_r / self.factor ** int(math.log(max(n_cand, 1), self.factor))
+        return rung_resources(max(min_r, 2 * n_splits), max_r, self.factor)
+
+    def _next_job(self) -> Optional[tuple]:
+        """空いた worker に渡す (候補番号, 段)。上の段への昇格を優先し、無ければ新しい候補"""
+        for k in range(len(self.resources_) - 2, -1, -1):
+            done = self._done[k]
+            top = sorted(done, key=lambda c: -done[c])[:len(done) // self.factor]
+            for c in top:
+                if c not in self._promoted[k]:
+                    self._promoted[k].add(c)
+                    return c, k + 1
+        if self._next_new < len(self.candidates_):
+            self._next_new += 1
+            return self._next_new - 1, 0
+        return None
+
+    def fit(self, X: pd.DataFrame, y: pd.Series):
+        self.candidates_ = self._candidates()
+        self.resources_ = self._resources(len(X), len(self.candidates_))
+        self._done: List[Dict[int, float]] = [{} for _ in self.resources_]
+        self._promoted: List[set] = [set() for _ in self.resources_]
+        self._next_new = 0
+        rows: List[dict] = []
+        best = (-1, -np.inf)  # (段, スコア)。上の段を優先
+        busy = 0.0
+
+        os.makedirs(self.workdir, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix="asha-", dir=self.workdir)
+        data_path = os.path.join(tmp, "Xy.joblib")
+        dump((X.reset_index(drop=True), y.reset_index(drop=True)), data_path)
+        n_workers = max(1, self.n_jobs or 1)
+        executor = get_memmapping_executor(n_workers)  # joblib.Parallel と同じ loky worker を使い回す
+        t0 = time.time()
+        running = {}
+        try:
+            while True:
+                while len(running) < n_workers:
+                    job = self._next_job()
+                    if job is None:
+                        break
+                    c, k = job
+                    fut = executor.submit(_evaluate, data_path, self.estimator, self.candidates_[c], self.resource,
+                                          self.resources_[k], k, self.cv, self.scoring, self.error_score,
+                                          self.random_state)
+                    running[fut] = (c, k, time.time())
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    c, k, submitted = running.pop(fut)
+                    r = fut.result()
+                    mean = float(np.mean(r["scores"]))
+                    self._done[k][c] = mean
+                    busy += r["worker_end"] - r["worker_start"]
+                    finished = time.time() - t0  # 属性は丸めない（丸めると search_wall_ を超えうる）
+                    row = {"candidate": c, "iter": k, "n_resources": self.resources_[k], "n_rows": r["n_rows"],
+                           "params": self.candidates_[c], "mean_test_score": mean,
+                           "std_test_score": float(np.std(r["scores"])),
+                           "mean_fit_time": float(np.mean(r["fit_times"])),
+                           "std_fit_time": float(np.std(r["fit_times"])),
+                           "mean_score_time": float(np.mean(r["score_times"])),
+                           "submitted_sec": round(submitted - t0, 3), "finished_sec": round(finished, 3),
+                           "worker_pid": r["pid"]}
+                    for i, s in enumerate(r["scores"]):
+                        row[f"split{i}_test_score"] = s
+                    rows.append(row)
+                    if (k, mean) > best:
+                        best = (k, mean)
+                        self.best_index_ = len(rows) - 1
+                        self.time_to_best_ = finished
+                    if self.verbose:
+                        print(f"[ASHA] t={row['finished_sec']:.1f}s rung={k} r={self.resources_[k]} "
+                              f"cand={c} score={mean:.4f} best={best[1]:.4f}")
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.search_wall_ = time.time() - t0
+        self.worker_util_ = round(busy / (self.search_wall_ * n_workers), 3) if self.search_wall_ > 0 else None
+
+        self.cv_results_ = self._cv_results(rows)
+        self.best_params_ = dict(rows[self.best_index_]["params"])
+        self.best_score_ = rows[self.best_index_]["mean_test_score"]
+        self.n_candidates_ = [len(d) for d in self._done if d]
+        self.n_resources_ = self.resources_[:len(self.n_candidates_)]
+        self.n_samples_ = [int(np.mean([r["n_rows"] for r in rows if r["iter"] == k]))
+                           for k in range(len(self.n_candidates_))]
+        t = time.perf_counter()
+        self.best_estimator_ = clone(self.estimator).set_params(**self.best_params_).fit(X, y)
+        self.refit_time_ = time.perf_counter() - t
+        return self
+
+    def _cv_results(self, rows: List[dict]) -> dict:
+        names = sorted({p for r in rows for p in r["params"]})
+        out = {k: [r.get(k) for r in rows] for k in rows[0] if k != "params"}
+        for p in names:
+            out[f"param_{p}"] = [r["params"].get(p) for r in rows]
+        out["params"] = [r["params"] for r in rows]
+        # HalvingGridSearchCV と同じく、段が上のものほど上位（同じ段ならスコア順）
+        order = sorted(range(len(rows)), key=lambda i: (-rows[i]["iter"], -rows[i]["mean_test_score"]))
+        rank = np.empty(len(rows), dtype=int)
+        rank[order] = np.arange(1, len(rows) + 1)
+        out["rank_test_score"] = rank.tolist()
+        return out
+
+    def report(self) -> dict:
+        """summary_*.json の search に足す分"""
+        return {"resource": self.resource, "space": self.space, "rungs": self.resources_,
+                "evaluations": self.n_candidates_, "best_score": round(self.best_score_, 6),
+                "time_to_best_sec": round(self.time_to_best_, 3), "search_wall_sec": round(self.search_wall_, 2),
+                "worker_util": self.worker_util_}
@@ -0,0 +1,278 @@
+# src/cache.py
+"""
+Pipeline(memory=...) 用の管理つき joblib キャッシュ（cache/ 配下）。
+  - 名前空間: sklearn / numpy / pandas / joblib の版と前処理コードのハッシュごとに cache/<用途>-<指紋>/ を分け、
+              同じ用途で指紋の違う古い名前空間（と従来の cache/joblib）は prepare() で消す。
+              使用中の名前空間は cache/locks/<名前空間>.<pid> で示し、生きているプロセスが持つものは消さない
+              （別のチェックアウトから同時に走る run の名前空間を途中で消さない。finish() で外す）
+  - 容量上限: CACHE_BUDGET_MB（既定 2048）。cache/ 全体で、prepare() と finish() のたびに
+              最終アクセスの古いエントリから追い出す
+              （ヒット時に output.pkl の atime を明示的に更新するので relatime/noatime でも LRU になる）
+  - 統計    : ヒット/ミス・読み出し bytes・節約できた計算時間（保存時の所要時間 − 読み込み時間）を
+              呼び出しごとに stats ファイルへ 1 行追記する（loky worker の分も集まる）。finish() で集計。
+              落ちた run の stats / lock ファイルは次の prepare() で消す
+  キャッシュの読み書きは MemorizedFunc の公開 API（call_and_shelve / MemorizedResult）だけを使い、引数のハッシュは 1 呼び出し 1 回
+Usage:
+  python -u src/cache.py            # 名前空間ごとの使用量を表示
+  python -u src/cache.py --prune    # 上限まで追い出す（--budget-mb 0 で全部消す）
+"""
+from __future__ import annotations
+import argparse, functools, hashlib, inspect, json, os, shutil, threading, time, uuid
+from typing import Iterable, Optional
+
+from joblib import Memory
+
+CACHE_ROOT = os.getenv("CACHE_DIR", "cache")
+# ディスク上限（MB）。0 なら追い出さない
+CACHE_BUDGET_MB = float(os.getenv("CACHE_BUDGET_MB", "2048"))
+
+
+def fingerprint(code: Iterable = ()) -> str:
+    """ライブラリの版 + 渡された関数（のソース）/ 文字列から名前空間の指紋を作る"""
+    import joblib, numpy, pandas, sklearn
+    h = hashlib.blake2b(digest_size=6)
+    for v in (sklearn.__version__, numpy.__version__, pandas.__version__, joblib.__version__):
+        h.update(v.encode() + b"\0")
+    for c in code:
+        h.update((c if isinstance(c, str) else inspect.getsource(c)).encode() + b"\0")
+    return h.hexdigest()
+
+
+def _size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:  # 並行する run が消した直後など
+        return 0
+
+
+def _dir_bytes(path: str) -> int:
+    return sum(_size(os.path.join(d, fn)) for d, _, files in os.walk(path) for fn in files)
+
+
+def evict(root: str, budget_bytes: int) -> dict:
+    """root 配下の joblib エントリ（output.pkl のあるディレクトリ）を atime の古い順に消して budget_bytes 以下にする"""
+    items, total = [], 0
+    for dirpath, _, files in os.walk(root):
+        size = sum(_size(os.path.join(dirpath, fn)) for fn in files)
+        total += size
+        if "output.pkl" in files:
+            try:
+                items.append((os.stat(os.path.join(dirpath, "output.pkl")).st_atime, size, dirpath))
+            except OSError:
+                pass
+    evicted_bytes = evicted_items = 0
+    for _, size, path in sorted(items):
+        if total <= budget_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        evicted_bytes += size
+        evicted_items += 1
+    return {"evicted_bytes": evicted_bytes, "evicted_items": evicted_items, "disk_bytes": total}
+
+
+class _TrackedFunc:
+    """MemorizedFunc を包んでヒット/ミスを数える。
+    call_and_shelve を 1 回だけ呼ぶ（引数のハッシュも 1 回）。包んだ関数が走ったら外れで、その戻り値をそのまま返す
+    （保存したものを読み直さない）。当たりのときだけ get() で読む"""
+
+    def __init__(self, memorized, box: threading.local, stats_path: Optional[str]):
+        self.memorized = memorized
+        self.box = box
+        self.stats_path = stats_path
+
+    def _shelve(self, args, kwargs):
+        self.box.ran = None
+        t0 = time.perf_counter()
+        res = self.memorized.call_and_shelve(*args, **kwargs)
+        return res, t0, time.perf_counter() - t0, self.box.ran
+
+    def __call__(self, *args, **kwargs):
+        res, t0, shelve_sec, ran = self._shelve(args, kwargs)
+        if ran is None:
+            t1 = time.perf_counter()
+            try:
+                out = res.get()
+            except KeyError:  # 壊れたエントリは消して計算し直す
+                res.clear()
+                res, t0, shelve_sec, ran = self._shelve(args, kwargs)
+                t1 = time.perf_counter()
+                out = res.get() if ran is None else None  # 消した直後に別の worker が書いていれば当たり
+            load_sec = time.perf_counter() - t1
+        item_dir = os.path.join(res.store_backend.location, res.func_id, res.args_id)
+        if ran is None:
+            self._touch(os.path.join(item_dir, "output.pkl"))
+            self._record(hit=True, bytes=_dir_bytes(item_dir), hash_sec=shelve_sec, load_sec=load_sec,
+                         saved_sec=max(0.0, (res.duration or 0.0) - load_sec))
+            return out
+        started, out = ran  # 計算を始めるまで = 引数のハッシュとキャッシュの確認
+        hash_sec = started - t0
+        self._record(hit=False, bytes=_dir_bytes(item_dir), hash_sec=hash_sec, compute_sec=shelve_sec - hash_sec)
+        return out
+
+    @staticmethod
+    def _touch(path: str) -> None:
+        try:
+            st = os.stat(path)
+            os.utime(path, (time.time(), st.st_mtime))
+        except OSError:
+            pass
+
+    def _record(self, **fields) -> None:
+        if not self.stats_path:
+            return
+        line = json.dumps(fields) + "\n"
+        try:  # 1 行は PIPE_BUF より短いので O_APPEND の 1 回の write で混ざらない
+            fd = os.open(self.stats_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line.encode())
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
+
+
+class ManagedMemory(Memory):
+    """名前空間・容量上限・統計つきの Memory。sklearn の Pipeline(memory=...) にそのまま渡せる"""
+
+    def __init__(self, name: str, code: Iterable = (), root: str = CACHE_ROOT,
+                 budget_mb: float = CACHE_BUDGET_MB, verbose: int = 0):
+        self.root = root
+        self.name = name
+        self.namespace = f"{name}-{fingerprint(code)}"
+        self.budget_bytes = int(budget_mb * 2**20)
+        self.stats_path: Optional[str] = None
+        super().__init__(os.path.join(root, self.namespace), verbose=verbose)
+
+    def cache(self, func=None, **kwargs):
+        if func is None or self.location is None:
+            return super().cache(func, **kwargs)  # デコレータ形式・キャッシュ無効時はそのまま
+        box = threading.local()
+
+        def run(*a, **kw):  # 外れのときだけ呼ばれる。戻り値を手元に残して読み直しを省く
+            started = time.perf_counter()
+            out = func(*a, **kw)
+            box.ran = (started, out)
+            return out
+
+        functools.update_wrapper(run, func)  # キャッシュの置き場・引数の扱いは func と同じ
+        return _TrackedFunc(super().cache(run, **kwargs), box, self.stats_path)
+
+    def _lock_path(self) -> str:
+        return os.path.join(self.root, "locks", f"{self.namespace}.{os.getpid()}")
+
+    def prepare(self) -> dict:
+        """run の開始時: 使用中の印をつけ、使われていない古い名前空間・落ちた run の残骸を消し、
+        上限まで追い出し、統計ファイルを用意する"""
+        for d in ("locks", "stats"):
+            os.makedirs(os.path.join(self.root, d), exist_ok=True)
+        open(self._lock_path(), "w").close()
+        in_use = _live_files(os.path.join(self.root, "locks"))
+        in_use = {fn.rsplit(".", 1)[0] for fn in in_use}
+        _live_files(os.path.join(self.root, "stats"))  # 落ちた run の stats を消す
+        removed = 0
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if (name.startswith(f"{self.name}-") and name not in in_use) or name == "joblib":
+                removed += _dir_bytes(path)
+                shutil.rmtree(path, ignore_errors=True)
+        self.stats_path = os.path.join(self.root, "stats", f"{uuid.uuid4().hex}.{os.getpid()}.jsonl")
+        evicted = self.enforce_budget()
+        return {"stale_removed_bytes": removed, **{f"start_{k}": v for k, v in evicted.items()}}
+
+    def enforce_budget(self) -> dict:
+        if self.budget_bytes <= 0:
+            return {"evicted_bytes": 0, "evicted_items": 0, "disk_bytes": _dir_bytes(self.root)}
+        return evict(self.root, self.budget_bytes)
+
+    def stats(self) -> dict:
+        """ここまでの統計（全プロセスの分）。run の途中で区切って見るとき用。ファイルは消さない"""
+        hits = misses = hit_bytes = stored_bytes = 0
+        saved = compute = load = hashing = 0.0
+        if self.stats_path and os.path.exists(self.stats_path):
+            with open(self.stats_path) as f:
+                for line in f:
+                    r = json.loads(line)
+                    hashing += r.get("hash_sec", 0.0)
+                    if r["hit"]:
+                        hits += 1
+                        hit_bytes += r["bytes"]
+                        saved += r["saved_sec"]
+                        load += r["load_sec"]
+                    else:
+                        misses += 1
+                        stored_bytes += r["bytes"]
+                        compute += r["compute_sec"]
+        calls = hits + misses
+        return {
+            "calls": calls,
+            "hits": hits,
+            "hit_ratio": round(hits / calls, 4) if calls else None,
+            "hit_bytes": hit_bytes,          # 計算せずにキャッシュから読んだ量
+            "stored_bytes": stored_bytes,    # 今回書き足した量
+            "time_saved_sec": round(saved, 3),
+            "load_sec": round(load, 3),
+            "compute_sec": round(compute, 3),
+            "hash_sec": round(hashing, 3),   # キー計算（引数の DataFrame のハッシュ）にかかった時間
+        }
+
+    def finish(self) -> dict:
+        """run の終わり: 統計を集計し、上限まで追い出す → summary_*.json に入れる dict"""
+        st = self.stats()
+        if self.stats_path and os.path.exists(self.stats_path):
+            os.unlink(self.stats_path)
+        try:
+            os.unlink(self._lock_path())
+        except OSError:
+            pass
+        return {"namespace": self.namespace, "budget_bytes": self.budget_bytes, **st, **self.enforce_budget()}
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # 別ユーザーのプロセス
+        return True
+    return True
+
+
+def _live_files(d: str) -> list:
+    """d 直下の <名前>.<pid>[.jsonl] のうち、pid が生きているものを返し、死んでいるものは消す"""
+    live = []
+    for fn in os.listdir(d):
+        stem = fn[:-len(".jsonl")] if fn.endswith(".jsonl") else fn
+        pid = stem.rsplit(".", 1)[-1]
+        if not pid.isdigit():
+            continue
+        if pid_alive(int(pid)):
+            live.append(stem)
+        else:
+            try:
+                os.unlink(os.path.join(d, fn))
+            except OSError:
+                pass
+    return live
+
+
+def usage(root: str = CACHE_ROOT) -> dict:
+    if not os.path.isdir(root):
+        return {}
+    return {name: _dir_bytes(os.path.join(root, name)) for name in sorted(os.listdir(root))}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--root", default=CACHE_ROOT)
+    ap.add_argument("--prune", action="store_true", help="evict least recently used entries down to the budget")
+    ap.add_argument("--budget-mb", type=float, default=CACHE_BUDGET_MB)
+    args = ap.parse_args()
+    if args.prune:
+        print(json.dumps(evict(args.root, int(args.budget_mb * 2**20))))
+    for name, size in usage(args.root).items():
+        print(f"{size / 2**20:10.1f} MB  {os.path.join(args.root, name)}")
+
+
+if __name__ == "__main__":
+    main()
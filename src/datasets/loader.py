@@ -5,6 +5,8 @@ from typing import Tuple
 
 # OpenMLキャッシュの場所を統一
 OPENML_CACHE = "data/openml_cache"
+# --dataset local の CSV（train.py --chunksize はここを chunk で読む）
+LOCAL_CSV = "data/train.csv"
 
 def _to_numeric(df: pd.DataFrame, cols) -> None:
     for col in cols:
@@ -38,7 +40,7 @@ def load_dataset(name: str) -> Tuple[pd.DataFrame, pd.Series, str]:
         return df, y, "openml_credit_g"
 
     if name == "local":
-        df = pd.read_csv("data/train.csv")
+        df = pd.read_csv(LOCAL_CSV)
         y = df.pop("target")
         return df, y, "local_csv"
 
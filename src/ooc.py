@@ -0,0 +1,310 @@
+# src/ooc.py
+"""
+メモリに載らない大きさの local CSV 向けの学習（train.py --dataset local --chunksize N）。
+CSV は chunk ごとに読み、全体を DataFrame にしない:
+  1 周目: 数値列の欠損数・平均・分散（Chan の併合）、カテゴリ列の出現数、クラスごとの行数を集計。
+          同時に学習側の行から一様な reservoir サンプル（OOC_SAMPLE_ROWS 行）を取る
+  探索  : サンプルで通常どおり HalvingGridSearchCV（前処理込みの Pipeline）
+  前処理: build_preprocessor と同じ構成を、1 周目の全体統計（補完値・平均/分散・カテゴリ一覧と最頻値）で作る
+  2 周目: 学習側の行を変換して float32 行列に詰め、最良パラメータの HGB を fit し直す。
+          HGB は fit 時に float64 へコピーして binning するので、その分を含めて OOC_MEMORY_MB に収まる行数だけ使う
+          （収まれば全行。収まらなければクラスごとに同じ割合で等間隔に間引く）
+  3 周目: ホールドアウト行を chunk ごとに予測して AUC / 正解率
+ホールドアウトは各クラスの通し番号で等間隔に 2 割（クラスごとの seed つきオフセット）なので、周回間で同じ行になり層化もされる。
+保存するモデルは通常の Pipeline(pre, clf)（API の encoder / flat もそのまま使える）。
+"""
+from __future__ import annotations
+import os, time, zlib
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# 探索に使うサンプル行数
+OOC_SAMPLE_ROWS = int(os.getenv("OOC_SAMPLE_ROWS", "50000"))
+# 最終 fit に使ってよいメモリ（MB）。0 なら MemAvailable の半分
+OOC_MEMORY_MB = int(os.getenv("OOC_MEMORY_MB", "0"))
+TEST_SIZE = 0.2
+
+
+def mem_available_mb() -> Optional[int]:
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return None
+
+
+def systematic(ordinals: np.ndarray, frac: float, offset: float) -> np.ndarray:
+    """通し番号 k の行を frac の割合で等間隔に選ぶ（floor((k+1)f + o) > floor(kf + o)）"""
+    if frac >= 1:
+        return np.ones(len(ordinals), dtype=bool)
+    k = ordinals.astype(np.float64)
+    return np.floor((k + 1) * frac + offset) > np.floor(k * frac + offset)
+
+
+def class_offset(c, seed: int) -> float:
+    """クラスごとの等間隔抽出の開始位置（プロセスをまたいで同じ値）"""
+    return np.random.RandomState((seed * 1000003 + zlib.crc32(str(c).encode())) % 2**32).rand()
+
+
+class _Splitter:
+    """クラスごとの通し番号でホールドアウト / 最終 fit に使う行を決める（周回ごとに作り直すと同じ結果になる）"""
+
+    def __init__(self, seed: int, refit_frac: float = 1.0):
+        self.seed = seed
+        self.seen: Dict = {}
+        self.train_seen: Dict = {}
+        self.refit_frac = refit_frac
+
+    def split(self, y: np.ndarray):
+        """→ (holdout マスク, 最終 fit に使う学習行マスク)"""
+        hold = np.zeros(len(y), dtype=bool)
+        refit = np.zeros(len(y), dtype=bool)
+        for c in np.unique(y):
+            self.seen.setdefault(c, 0)
+            self.train_seen.setdefault(c, 0)
+            off = class_offset(c, self.seed)
+            idx = np.flatnonzero(y == c)
+            h = systematic(self.seen[c] + np.arange(len(idx)), TEST_SIZE, off)
+            self.seen[c] += len(idx)
+            hold[idx[h]] = True
+            tr = idx[~h]
+            r = systematic(self.train_seen[c] + np.arange(len(tr)), self.refit_frac, off)
+            self.train_seen[c] += len(tr)
+            refit[tr[r]] = True
+        return hold, refit
+
+
+class _Reader:
+    def __init__(self, path: str, chunksize: int, target: str = "target"):
+        self.path, self.chunksize, self.target = path, chunksize, target
+        head = pd.read_csv(path, nrows=chunksize)
+        feats = head.drop(columns=[target])
+        self.num_cols = list(feats.select_dtypes(include=["number"]).columns)
+        self.cat_cols = list(feats.select_dtypes(exclude=["number"]).columns)
+
+    def __iter__(self):
+        # 1 chunk 目で決めた型に揃える（途中の chunk で列が全部欠損でも型がぶれないように）
+        for chunk in pd.read_csv(self.path, chunksize=self.chunksize, dtype={c: "str" for c in self.cat_cols}):
+            y = chunk.pop(self.target).to_numpy()
+            for c in self.num_cols:
+                chunk[c] = pd.to_numeric(chunk[c], errors="coerce")
+            yield chunk, y
+
+
+class _Reservoir:
+    """乱数キーの小さい方から capacity 行を残す一様な reservoir。
+    列ごとに capacity 行の配列を 1 度だけ確保し、キーが今の最大より小さい行だけを空き・追い出し枠に書き込む"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.u = np.full(capacity, np.inf)  # 空き枠は inf（先に埋まる）
+        self.index = np.zeros(capacity, dtype=np.int64)
+        self.y: Optional[np.ndarray] = None
+        self.cols: Dict[str, np.ndarray] = {}
+        self.dtypes: Dict = {}
+
+    def add(self, chunk: pd.DataFrame, y: np.ndarray, u: np.ndarray) -> None:
+        cand = np.flatnonzero(u < self.u.max())
+        if not len(cand):
+            return
+        keys = np.concatenate([self.u, u[cand]])
+        k = self.capacity
+        keep = np.argpartition(keys, k - 1)[:k]
+        new = cand[keep[keep >= k] - k]
+        slots = np.setdiff1d(np.arange(k), keep[keep < k], assume_unique=True)
+        if not len(new):
+            return
+        if self.y is None:
+            self.y = np.empty(k, dtype=y.dtype)
+            for c in chunk.columns:
+                dt = self.dtypes[c] = chunk[c].dtype
+                self.cols[c] = np.empty(k, dtype=dt if isinstance(dt, np.dtype) else object)
+        for c, buf in self.cols.items():
+            v = chunk[c].to_numpy()[new]
+            if buf.dtype != object and buf.dtype != np.result_type(buf.dtype, v.dtype):
+                # 途中の chunk で型が広がった（int → 欠損ありの float など）ときだけ確保し直す
+                buf = self.cols[c] = buf.astype(np.result_type(buf.dtype, v.dtype))
+                self.dtypes[c] = buf.dtype
+            buf[slots] = v
+        self.y[slots] = y[new]
+        self.index[slots] = chunk.index.to_numpy()[new]
+        self.u[slots] = u[new]
+
+    def result(self):
+        filled = np.flatnonzero(np.isfinite(self.u))
+        filled = filled[np.argsort(self.index[filled], kind="stable")]
+        index = pd.Index(self.index[filled])
+        X = pd.DataFrame({c: pd.Series(buf[filled], index=index).astype(self.dtypes[c])
+                          for c, buf in self.cols.items()}, index=index)
+        y = pd.Series(self.y[filled] if self.y is not None else [], index=index, name="target")
+        return X, y
+
+
+def scan(reader: _Reader, seed: int, sample_rows: int) -> dict:
+    """1 周目: 学習側の行の統計（ホールドアウトは前処理に混ぜない）と reservoir サンプル"""
+    nc = len(reader.num_cols)
+    n_obs, mean, m2 = np.zeros(nc), np.zeros(nc), np.zeros(nc)
+    counts: List[Dict[str, int]] = [dict() for _ in reader.cat_cols]
+    class_counts: Dict = {}
+    rows = n_train = 0
+    splitter = _Splitter(seed)
+    rng = np.random.RandomState(seed)
+    reservoir = _Reservoir(sample_rows)
+    for chunk, y in reader:
+        rows += len(chunk)
+        for c, n in zip(*np.unique(y, return_counts=True)):
+            class_counts[c] = class_counts.get(c, 0) + int(n)
+        hold, _ = splitter.split(y)
+        chunk, y = chunk.loc[~hold], y[~hold]
+        n_train += len(chunk)
+        if nc:
+            v = chunk[reader.num_cols].to_numpy(dtype=np.float64)
+            ok = ~np.isnan(v)
+            n_b = ok.sum(axis=0)
+            mean_b = np.where(n_b > 0, np.nansum(v, axis=0) / np.maximum(n_b, 1), 0.0)
+            m2_b = np.nansum((v - mean_b) ** 2, axis=0)
+            n_ab = n_obs + n_b
+            delta = mean_b - mean
+            mean = np.where(n_ab > 0, mean + delta * n_b / np.maximum(n_ab, 1), 0.0)
+            m2 = m2 + m2_b + delta ** 2 * n_obs * n_b / np.maximum(n_ab, 1)
+            n_obs = n_ab
+        for d, c in zip(counts, reader.cat_cols):
+            for val, n in chunk[c].value_counts(dropna=True).items():
+                d[val] = d.get(val, 0) + int(n)
+        reservoir.add(chunk, y, rng.rand(len(chunk)))
+    sample_X, sample_y = reservoir.result()
+    return {"rows": rows, "n_train": n_train, "class_counts": class_counts, "n_obs": n_obs, "mean": mean,
+            "var": np.where(n_obs > 0, m2 / np.maximum(n_obs, 1), 0.0), "counts": counts,
+            "sample_X": sample_X, "sample_y": sample_y}
+
+
+def streamed_preprocessor(stats: dict, reader: _Reader, encoding: str = "onehot"):
+    """build_preprocessor と同じ構成を全体統計で作る（サンプルで構造を fit してから統計を差し替える）"""
+    from train import build_preprocessor
+    X = stats["sample_X"]
+    # サンプルに出てこないカテゴリも OneHotEncoder / OrdinalEncoder に覚えさせる
+    extra = []
+    for c, d in zip(reader.cat_cols, stats["counts"]):
+        missing = sorted(set(d) - set(X[c].dropna()))
+        if missing:
+            proto = X.iloc[[0] * len(missing)].copy()
+            proto[c] = missing
+            extra.append(proto)
+    proto = pd.concat([X, *extra]) if extra else X
+    pre = build_preprocessor(X, encoding).fit(proto)
+
+    rows = stats["n_train"]
+    for name, _, cols in pre.transformers_:
+        if name == "num" and len(cols):
+            imp, sc = pre.named_transformers_["num"].named_steps["imp"], pre.named_transformers_["num"].named_steps["sc"]
+            idx = [reader.num_cols.index(c) for c in cols]
+            mean, var, n_obs = stats["mean"][idx], stats["var"][idx], stats["n_obs"][idx]
+            imp.statistics_ = mean.copy()
+            # 平均で補完した列の母分散 = 観測値の母分散 × 観測数 / 全行数（平均は変わらない）
+            var_imp = var * n_obs / max(rows, 1)
+            sc.mean_, sc.var_ = mean.copy(), var_imp
+            sc.scale_ = np.where(var_imp > 0, np.sqrt(var_imp), 1.0)
+            sc.n_samples_seen_ = rows
+        if name == "cat" and len(cols) and encoding == "onehot":  # native は補完しない（欠損は HGB の欠損バケット）
+            imp = pre.named_transformers_["cat"].named_steps["imp"]
+            # SimpleImputer(most_frequent) と同じく、同数なら小さい値
+            imp.statistics_ = np.array([min(d.items(), key=lambda kv: (-kv[1], kv[0]))[0] if d else np.nan
+                                        for d in (stats["counts"][reader.cat_cols.index(c)] for c in cols)],
+                                       dtype=object)
+    return pre
+
+
+def refit_budget(n_train: int, n_features: int, memory_mb: int = OOC_MEMORY_MB) -> dict:
+    """最終 fit に使える行数。1 行あたり float32 の行列 + HGB 内部の float64 コピー + uint8 の bin + 勾配類"""
+    budget = memory_mb or (mem_available_mb() or 4096) // 2
+    per_row = n_features * (4 + 8 + 1) + 32
+    rows = int(budget * 2**20 // per_row)
+    return {"memory_budget_mb": budget, "bytes_per_row": per_row, "refit_rows": min(n_train, rows),
+            "refit_frac": min(1.0, rows / max(n_train, 1))}
+
+
+def run(path: str, chunksize: int, mode: str, n_jobs: int, seed: int, memory=None,
+        encoding: str = "onehot") -> dict:
+    """→ model / 探索器 / 評価値 / summary に足す ooc ブロック"""
+    from sklearn.base import clone
+    from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+    from sklearn.metrics import accuracy_score, roc_auc_score
+    from sklearn.model_selection import HalvingGridSearchCV, StratifiedKFold
+    from sklearn.pipeline import Pipeline
+    from threadpoolctl import threadpool_limits
+    import train
+
+    timing = {}
+    reader = _Reader(path, chunksize)
+    t = time.perf_counter()
+    stats = scan(reader, seed, OOC_SAMPLE_ROWS)
+    timing["scan_sec"] = round(time.perf_counter() - t, 2)
+    Xs, ys = stats["sample_X"], stats["sample_y"]
+
+    n_splits, factor = train.search_settings(mode)
+    pipe = Pipeline([("pre", train.build_preprocessor(Xs, encoding)), ("clf", train.build_classifier(Xs, encoding, seed))],
+                    memory=memory)
+    kwargs = dict(estimator=pipe, param_grid=train.param_grid_from_env(), scoring="roc_auc",
+                  cv=StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=seed), factor=factor,
+                  n_jobs=n_jobs, error_score=0.0, verbose=1)
+    min_res = train.compute_min_resources(ys, n_splits, mode)
+    if min_res is not None:
+        kwargs["min_resources"] = min_res
+    search = HalvingGridSearchCV(**kwargs)
+    t = time.perf_counter()
+    with threadpool_limits(limits=1):
+        search.fit(Xs, ys)
+    timing["search_sec"] = round(time.perf_counter() - t, 2)
+
+    pre = streamed_preprocessor(stats, reader, encoding)
+    n_features = len(pre.get_feature_names_out())
+    n_train = stats["n_train"]
+    budget = refit_budget(n_train, n_features)
+
+    # 2 周目: 最終 fit 用の行列を chunk ごとに変換して詰める
+    t = time.perf_counter()
+    cap = budget["refit_rows"] + len(stats["class_counts"]) * 2  # 等間隔抽出の端数はクラスごとに ±1
+    Xf = np.empty((cap, n_features), dtype=np.float32)
+    yf = np.empty(cap, dtype=ys.dtype)
+    splitter, filled = _Splitter(seed, budget["refit_frac"]), 0
+    for chunk, y in reader:
+        _, refit = splitter.split(y)
+        if refit.any():
+            m = int(refit.sum())
+            Xf[filled:filled + m] = pre.transform(chunk.loc[refit])
+            yf[filled:filled + m] = y[refit]
+            filled += m
+    Xf, yf = Xf[:filled], yf[:filled]
+    clf_params = {k.split("__", 1)[1]: v for k, v in search.best_params_.items() if k.startswith("clf__")}
+    clf = clone(pipe.named_steps["clf"]).set_params(**clf_params)
+    with threadpool_limits(limits=n_jobs):
+        clf.fit(Xf, yf)
+    del Xf
+    model = Pipeline([("pre", pre), ("clf", clf)])
+    timing["refit_sec"] = round(time.perf_counter() - t, 2)
+
+    # 3 周目: ホールドアウトを chunk ごとに予測
+    t = time.perf_counter()
+    splitter = _Splitter(seed)
+    y_true, proba = [], []
+    for chunk, y in reader:
+        hold, _ = splitter.split(y)
+        if hold.any():
+            y_true.append(y[hold])
+            proba.append(model.predict_proba(chunk.loc[hold])[:, 1].astype(np.float32))
+    y_true, proba = np.concatenate(y_true), np.concatenate(proba)
+    timing["holdout_sec"] = round(time.perf_counter() - t, 2)
+    pos = model.classes_[1]
+    auc = float(roc_auc_score(y_true == pos, proba))
+    acc = float(accuracy_score(y_true, np.where(proba >= 0.5, pos, model.classes_[0])))
+
+    ooc = {"chunksize": chunksize, "rows": stats["rows"], "n_train": n_train, "n_holdout": len(y_true),
+           "class_counts": {str(k): v for k, v in stats["class_counts"].items()}, "sample_rows": len(Xs),
+           "n_features": n_features, **budget, "refit_rows": filled, "passes": 3, **timing}
+    return {"model": model, "search": search, "auc": auc, "accuracy": acc, "min_resources": min_res,
+            "cv_splits": n_splits, "ooc": ooc}
@@ -0,0 +1,239 @@
+# src/orchestrate.py
+"""
+複数 (dataset, mode) の学習を同時に走らせ、CPU コアを見積もりコストに比例して配分する。
+コストは Successive Halving の作業量（行数 × 列数 × 候補数 × CV 分割数 × 段数 / factor^(段数-1)）+ 最終 refit。
+各ジョブには train.py --n-jobs で割り当てコア数を渡し、内側 BLAS は 1 スレッドに固定する。
+--search / --cat-encoding / --checkpoint は全ジョブの train.py にそのまま渡す（asha は見積もりの対象外なので受け付けない）。
+終了したジョブは起動した PID だけを wait4 で回収して CPU 時間（子の loky worker を含む）を取り、
+ジョブごとの wall / CPU 使用率と全体の結果を artifacts/orchestrate_<時刻>.json にまとめる。
+Usage:
+  python -u src/orchestrate.py --jobs adult:full,credit-g:full
+  python -u src/orchestrate.py --jobs adult:fast,credit-g:fast,builtin:fast --cores 16 --dry-run
+"""
+from __future__ import annotations
+import argparse, json, math, os, subprocess, sys, time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import train
+from datasets import load_dataset
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+DSNAMES = {"builtin": "builtin_breast_cancer", "adult": "openml_adult", "credit-g": "openml_credit_g",
+           "local": "local_csv"}
+BLAS_ENV = {k: "1" for k in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS")}
+
+
+@dataclass
+class Job:
+    dataset: str
+    mode: str
+    rows: int = 0
+    cols: int = 0
+    candidates: int = 0
+    splits: int = 0
+    cost: float = 0.0
+    n_jobs: int = 1
+    result: Dict = field(default_factory=dict)
+
+    @property
+    def name(self) -> str:
+        return f"{self.dataset}:{self.mode}"
+
+    @property
+    def max_useful_jobs(self) -> int:
+        # 最初の段で同時に走るタスク数（候補 × 分割）より多く渡しても遊ぶだけ
+        return max(1, self.candidates * self.splits)
+
+
+def parse_jobs(spec: str) -> List[Job]:
+    jobs = []
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        ds, _, mode = item.partition(":")
+        if ds not in DSNAMES or (mode or "fast") not in ("fast", "full"):
+            raise ValueError(f"bad job: {item!r} (expected <builtin|adult|credit-g|local>:<fast|full>)")
+        jobs.append(Job(ds, mode or "fast"))
+    seen = [j.dataset for j in jobs]
+    dup = {d for d in seen if seen.count(d) > 1}
+    if dup:  # 出力先 models/model_<ds>.joblib・artifacts/summary_<ds>.json が衝突する
+        raise ValueError(f"dataset listed more than once: {sorted(dup)}")
+    return jobs
+
+
+def estimate_cost(rows: int, cols: int, candidates: int, splits: int, factor: int,
+                  min_resources: Optional[int] = None) -> float:
+    """HalvingGridSearchCV の学習量の目安。各段は 候補/factor^i × 資源 r_min·factor^i でほぼ一定。
+    min_resources=None は sklearn 既定の 'exhaust'（最終段が全行を使う r_min）"""
+    max_res = rows * (1 - 1 / splits)  # CV の学習側
+    n_iter = 1 + int(math.floor(math.log(max(candidates, 1), factor)))
+    if min_resources:
+        n_iter = min(n_iter, 1 + int(math.floor(math.log(max(max_res / min_resources, 1), factor))))
+        r_min = float(min_resources)
+    else:
+        r_min = max_res / factor ** (n_iter - 1)
+    return n_iter * candidates * r_min * cols * splits + rows * cols
+
+
+def describe(job: Job) -> Job:
+    X, y, _ = load_dataset(job.dataset)
+    job.rows, job.cols = X.shape
+    job.splits, factor = train.search_settings(job.mode)
+    job.candidates = math.prod(len(v) for v in train.param_grid_from_env().values())
+    n_train = int(job.rows * 0.8)  # train.py は 2 割をテストに取り分ける
+    job.cost = estimate_cost(n_train, job.cols, job.candidates, job.splits, factor,
+                             train.compute_min_resources(y.iloc[:n_train], job.splits, job.mode))
+    return job
+
+
+def allocate(costs: List[float], cores: int, caps: Optional[List[int]] = None) -> List[int]:
+    """コア数をコスト比で整数配分（最大剰余法）。各ジョブ最低 1、caps を超える分は他へ回す"""
+    n = len(costs)
+    caps = list(caps) if caps else [cores] * n
+    alloc = [1] * n
+    left = cores - n
+    active = [i for i in range(n) if alloc[i] < caps[i]]
+    while left > 0 and active:
+        total = sum(costs[i] for i in active) or len(active)
+        share = {i: left * (costs[i] or 1) / total for i in active}
+        give = {i: min(int(share[i]), caps[i] - alloc[i]) for i in active}
+        rest = left - sum(give.values())
+        for i in sorted(active, key=lambda i: share[i] - int(share[i]), reverse=True):
+            if rest <= 0:
+                break
+            if alloc[i] + give[i] < caps[i]:
+                give[i] += 1
+                rest -= 1
+        if not any(give.values()):
+            break
+        for i, g in give.items():
+            alloc[i] += g
+        left = cores - sum(alloc)
+        active = [i for i in active if alloc[i] < caps[i]]
+    return alloc
+
+
+def available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def run_all(commands: Dict[str, List[str]], env: Dict[str, Dict[str, str]], logs: Dict[str, str],
+            cwd: Optional[str] = None) -> Dict[str, dict]:
+    """全コマンドを同時に起動し、終わった順に wait4 で回収 → {name: wall / CPU / maxrss / returncode}。
+    回収するのは起動した PID だけ（同じプロセスの他の子には触らない）"""
+    procs, started = {}, {}
+    for name, cmd in commands.items():
+        log = open(logs[name], "w")
+        p = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, cwd=cwd, env={**os.environ, **env[name]})
+        log.close()
+        procs[p.pid], started[p.pid] = (name, p), time.perf_counter()
+    out = {}
+    while procs:
+        done = []
+        for pid in list(procs):
+            wpid, status, ru = os.wait4(pid, os.WNOHANG)
+            if wpid == pid:
+                done.append((pid, status, ru))
+        if not done:
+            time.sleep(0.1)
+            continue
+        for pid, status, ru in done:
+            name, p = procs.pop(pid)
+            p.returncode = os.waitstatus_to_exitcode(status)  # Popen 側にも終了を伝える（二重 wait しない）
+            out[name] = {
+                "returncode": p.returncode,
+                "wall_sec": round(time.perf_counter() - started[pid], 2),
+                "cpu_user_sec": round(ru.ru_utime, 2),
+                "cpu_sys_sec": round(ru.ru_stime, 2),
+                "max_rss_mb": round(ru.ru_maxrss / 1024, 1),  # Linux は KiB。回収済みの子を含む最大値
+            }
+    return out
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--jobs", default="adult:fast,credit-g:fast", help="comma-separated <dataset>:<mode>")
+    ap.add_argument("--cores", type=int, default=None, help="cores to divide (default: CPU affinity)")
+    ap.add_argument("--parallel", choices=["fixed", "auto"], default=os.getenv("PARALLEL_PLAN", "fixed"),
+                    help="train.py --parallel (auto: per-iteration worker/thread plan inside each job)")
+    # train.py にそのまま渡す。コストの見積もりは HalvingGridSearchCV の段数モデルなので asha は扱わない
+    ap.add_argument("--search", choices=["pipeline", "pretransform"], default=os.getenv("SEARCH_MODE", "pipeline"),
+                    help="train.py --search (asha is not covered by the cost estimate)")
+    ap.add_argument("--cat-encoding", choices=["onehot", "native"], default=os.getenv("CAT_ENCODING", "onehot"),
+                    help="train.py --cat-encoding")
+    ap.add_argument("--checkpoint", default=os.getenv("CHECKPOINT_DB", ""), help="train.py --checkpoint")
+    ap.add_argument("--dry-run", action="store_true", help="print the plan and exit")
+    args = ap.parse_args()
+    if args.checkpoint and args.search == "pretransform":
+        ap.error("--checkpoint is not supported with --search pretransform")
+
+    cores = args.cores or available_cores()
+    jobs = [describe(j) for j in parse_jobs(args.jobs)]
+    # auto ではジョブ内で余ったコアを OpenMP スレッドに回せるので上限をかけない
+    caps = None if args.parallel == "auto" else [j.max_useful_jobs for j in jobs]
+    for j, n in zip(jobs, allocate([j.cost for j in jobs], cores, caps)):
+        j.n_jobs = n
+    total_cost = sum(j.cost for j in jobs) or 1.0
+    print(f"[PLAN] cores={cores}" + (" (oversubscribed: more jobs than cores)" if len(jobs) > cores else ""))
+    for j in jobs:
+        print(f"[PLAN] {j.name:<16} rows={j.rows} cols={j.cols} candidates={j.candidates} splits={j.splits} "
+              f"cost={j.cost / total_cost:.1%} n_jobs={j.n_jobs}")
+    if args.dry_run:
+        return 0
+
+    os.makedirs("logs", exist_ok=True)
+    os.makedirs("artifacts", exist_ok=True)
+    ts = time.strftime("%Y%m%d_%H%M%S")
+    train_py = os.path.join(SRC_DIR, "train.py")
+    extra = ["--search", args.search, "--cat-encoding", args.cat_encoding]
+    if args.checkpoint:
+        extra += ["--checkpoint", args.checkpoint]
+    commands = {j.name: [sys.executable, "-u", train_py, "--dataset", j.dataset, "--mode", j.mode,
+                         "--n-jobs", str(j.n_jobs), "--parallel", args.parallel, *extra] for j in jobs}
+    env = {j.name: {**BLAS_ENV, "N_JOBS": str(j.n_jobs)} for j in jobs}
+    logs = {j.name: f"logs/train-{j.dataset}-{j.mode}-{ts}.log" for j in jobs}
+
+    t0 = time.perf_counter()
+    results = run_all(commands, env, logs)
+    wall = time.perf_counter() - t0
+
+    cpu_total = 0.0
+    for j in jobs:
+        r = j.result = {**results[j.name], "log": logs[j.name]}
+        cpu = r["cpu_user_sec"] + r["cpu_sys_sec"]
+        cpu_total += cpu
+        r["cpu_util"] = round(cpu / (r["wall_sec"] * j.n_jobs), 3) if r["wall_sec"] else None
+        try:
+            with open(f"artifacts/summary_{DSNAMES[j.dataset]}.json") as f:
+                s = json.load(f)
+            r.update(auc=s.get("auc"), accuracy=s.get("accuracy"), best_params=s.get("best_params"))
+        except (OSError, ValueError):
+            pass
+        print(f"[JOB] {j.name:<16} rc={r['returncode']} n_jobs={j.n_jobs} wall={r['wall_sec']}s "
+              f"cpu={cpu:.1f}s util={r['cpu_util']} auc={r.get('auc')}")
+
+    summary = {
+        "cores": cores,
+        "parallel": args.parallel,
+        "search": args.search,
+        "cat_encoding": args.cat_encoding,
+        "wall_sec": round(wall, 2),
+        "cpu_sec": round(cpu_total, 2),
+        "cpu_util": round(cpu_total / (wall * cores), 3) if wall else None,
+        "jobs": [{"dataset": j.dataset, "mode": j.mode, "rows": j.rows, "cols": j.cols, "candidates": j.candidates,
+                  "cv_splits": j.splits, "cost_share": round(j.cost / total_cost, 4), "n_jobs": j.n_jobs, **j.result}
+                 for j in jobs],
+        "finished_at": int(time.time()),
+        **train.env_metadata(),
+    }
+    out = f"artifacts/orchestrate_{ts}.json"
+    with open(out, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"[RESULT] jobs={len(jobs)} wall={summary['wall_sec']}s cpu_util={summary['cpu_util']} -> {out}")
+    return 0 if all(j.result["returncode"] == 0 for j in jobs) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
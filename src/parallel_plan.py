@@ -0,0 +1,197 @@
+# src/parallel_plan.py
+"""
+HalvingGridSearchCV の入れ子並列（joblib worker 数 × worker 内 OpenMP スレッド数）を段ごとに決める。
+序盤は候補が多いので worker を増やしてスレッド 1、終盤に候補が減ったら worker を減らして
+HistGradientBoosting の OpenMP にコアを回す。行数が少ないときはスレッドを増やしても速くならないので 1 のまま。
+  PlannedHalvingGridSearchCV: 段ごとに plan_iteration() で (outer, inner) を決め、
+                              loky の worker 数を合わせ、各タスクを threadpool_limits(inner) の下で実行する
+  最後の refit（親プロセス）は全コアのスレッドで実行する。
+決めた計画と段ごとの実測コア使用率（プロセスツリーの CPU 時間 / (wall × コア数)）は parallel_plan_ に残る。
+sklearn の探索は fit の最初に作った Parallel 1 つで全段を回すので、parallel_config(n_jobs=...) を段ごとにかけ直しても効かない。
+そのため joblib の非公開 API（LokyBackend・_prepare_worker_env・Parallel._id・backend_kwargs）を使う。
+動作確認した joblib（PLANNED_JOBLIB）以外や API が見つからないときは警告して固定の計画（n_jobs 本・スレッド 1）で回す。
+"""
+from __future__ import annotations
+import math, os, time, warnings
+from typing import Dict, List, Optional, Tuple
+
+import joblib
+from joblib import parallel_config
+from joblib.executor import get_memmapping_executor
+from threadpoolctl import threadpool_limits
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import HalvingGridSearchCV
+
+try:  # 非公開 API。無くても import は通し、fit で固定の計画に戻す
+    from joblib._parallel_backends import LokyBackend
+except ImportError:
+    LokyBackend = object
+
+# HGB の OpenMP はヒストグラム構築を行方向に分けるので、1 スレッドあたりこの程度の行が無いと同期の方が高くつく
+MIN_ROWS_PER_THREAD = int(os.getenv("PLAN_MIN_ROWS_PER_THREAD", "5000"))
+# 非公開 API の使い方を確認した joblib の minor
+PLANNED_JOBLIB = ("1.6",)
+
+
+def planned_backend_unsupported() -> Optional[str]:
+    """段ごとの計画を使えない理由（使えるなら None）"""
+    minor = ".".join(joblib.__version__.split(".")[:2])
+    if minor not in PLANNED_JOBLIB:
+        return f"joblib {joblib.__version__} is not verified for --parallel auto ({', '.join(PLANNED_JOBLIB)}.x)"
+    if LokyBackend is object or not all(hasattr(LokyBackend, a) for a in ("_prepare_worker_env", "configure")):
+        return "joblib LokyBackend internals not found"
+    return None
+
+
+def detect_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def plan_iteration(cores: int, n_tasks: int, n_rows: int) -> Tuple[int, int]:
+    """→ (outer=joblib worker 数, inner=worker あたりのスレッド数)。outer × inner ≤ cores"""
+    cores, n_tasks = max(1, cores), max(1, n_tasks)
+    waves = math.ceil(n_tasks / cores)
+    outer = min(cores, math.ceil(n_tasks / waves))  # 同じ段数で済むなら worker を減らして最後の波の空きを減らす
+    inner = max(1, cores // outer)
+    inner = min(inner, max(1, n_rows // MIN_ROWS_PER_THREAD))
+    return outer, inner
+
+
+def tree_cpu_seconds() -> float:
+    """自プロセス + 回収済みの子 + 生きている直接の子（loky worker）の CPU 秒。/proc が無ければ前 2 つだけ"""
+    t = os.times()
+    total = t.user + t.system + t.children_user + t.children_system
+    me, tick = os.getpid(), os.sysconf("SC_CLK_TCK")
+    try:
+        pids = [p for p in os.listdir("/proc") if p.isdigit()]
+    except OSError:
+        return total
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == me:  # fields[1] = ppid
+            total += (int(fields[11]) + int(fields[12])) / tick  # utime, stime
+    return total
+
+
+_worker_threads: Optional[int] = None  # worker プロセス内で今かかっているスレッド数
+
+
+class _Limited:
+    """worker 側でスレッド数を合わせてからバッチを実行する（pickle されて送られる）。
+    threadpool_limits は 1 回 10ms 前後かかるので、値が変わったときだけかけ直す"""
+
+    def __init__(self, func, threads: int):
+        self.func, self.threads = func, threads
+
+    def __call__(self):
+        global _worker_threads
+        if _worker_threads != self.threads:
+            threadpool_limits(limits=self.threads)
+            _worker_threads = self.threads
+        return self.func()
+
+
+class _PlanState:
+    def __init__(self, outer: int, inner: int):
+        self.outer, self.inner = outer, inner
+
+
+class PlannedLokyBackend(LokyBackend):
+    """loky backend。submit のたびに現在の計画を見て worker 数を合わせ、タスクに inner スレッドの制限をつける"""
+
+    def __init__(self, state: _PlanState, **kwargs):
+        super().__init__(**kwargs)
+        self.state = state
+        self._size = 0
+        self._base_n = 1
+
+    def configure(self, n_jobs=1, parallel=None, prefer=None, require=None, idle_worker_timeout=None,
+                  **memmapping_executor_kwargs):
+        n = super().configure(n_jobs=n_jobs, parallel=parallel, prefer=prefer, require=require,
+                              idle_worker_timeout=idle_worker_timeout, **memmapping_executor_kwargs)
+        self._size = self._base_n = n
+        # resize 時に同じ引数で呼ばないと loky は executor を作り直す（worker の起動からやり直しになる）
+        self._executor_kwargs = {**self.backend_kwargs, **memmapping_executor_kwargs}
+        self._executor_kwargs.pop("idle_worker_timeout", None)
+        self._idle_timeout = idle_worker_timeout or self.backend_kwargs.get("idle_worker_timeout", 300)
+        return n
+
+    def submit(self, func, callback=None):
+        outer = max(1, min(self.state.outer, self._base_n))
+        if outer != self._size:
+            # 段の切り替わり（前の段のタスクは全部終わっている）。同じ executor を resize させる
+            self._workers = get_memmapping_executor(
+                outer, timeout=self._idle_timeout, env=self._prepare_worker_env(n_jobs=self._base_n),
+                context_id=self.parallel._id, **self._executor_kwargs)
+            self._size = outer
+        return super().submit(_Limited(func, self.state.inner), callback)
+
+
+class PlannedHalvingGridSearchCV(HalvingGridSearchCV):
+    """段ごとに worker / スレッドを計画する HalvingGridSearchCV。n_jobs は使ってよいコア数として扱う"""
+
+    def fit(self, X, y=None, **params):
+        cores = self.n_jobs if self.n_jobs and self.n_jobs > 0 else detect_cores()
+        reason = planned_backend_unsupported()
+        self._planned = reason is None
+        if reason is not None:
+            warnings.warn(f"{reason}; falling back to the fixed plan", RuntimeWarning)
+            self.parallel_plan_ = {"mode": "fixed", "fallback": reason}
+            return super().fit(X, y, **params)
+        n_splits = getattr(self.cv, "n_splits", None) or 5
+        self.parallel_plan_: Dict = {"cores": cores, "min_rows_per_thread": MIN_ROWS_PER_THREAD, "iterations": []}
+        self._plan_ctx = (cores, n_splits, 1 - 1 / n_splits)
+        self._state = _PlanState(cores, 1)
+        self._refit_limits: Optional[threadpool_limits] = None
+        t0, c0 = time.perf_counter(), tree_cpu_seconds()
+        try:
+            with parallel_config(backend=PlannedLokyBackend(self._state)):
+                return super().fit(X, y, **params)
+        finally:
+            if self._refit_limits is not None:
+                self._refit_limits.restore_original_limits()
+                refit = self.parallel_plan_["refit"]
+                refit["wall_sec"] = round(time.perf_counter() - refit.pop("_t0"), 3)
+                refit["cpu_sec"] = round(tree_cpu_seconds() - refit.pop("_c0"), 3)
+                refit["core_util"] = _util(refit["cpu_sec"], refit["wall_sec"], cores)
+            wall, cpu = time.perf_counter() - t0, tree_cpu_seconds() - c0
+            self.parallel_plan_.update(wall_sec=round(wall, 3), cpu_sec=round(cpu, 3),
+                                       core_util=_util(cpu, wall, cores))
+
+    def _run_search(self, evaluate_candidates):
+        if not self._planned:
+            return super()._run_search(evaluate_candidates)
+        cores, n_splits, train_frac = self._plan_ctx
+        iterations: List[Dict] = self.parallel_plan_["iterations"]
+
+        def planned(candidate_params, cv=None, more_results=None):
+            candidate_params = list(candidate_params)
+            n_res = (more_results or {}).get("n_resources", [self._n_samples_orig])[0]
+            n_tasks = len(candidate_params) * n_splits
+            outer, inner = plan_iteration(cores, n_tasks, int(n_res * train_frac))
+            self._state.outer, self._state.inner = outer, inner
+            t0, c0 = time.perf_counter(), tree_cpu_seconds()
+            out = evaluate_candidates(candidate_params, cv, more_results=more_results)
+            wall, cpu = time.perf_counter() - t0, tree_cpu_seconds() - c0
+            iterations.append({"iter": len(iterations), "candidates": len(candidate_params), "tasks": n_tasks,
+                               "n_resources": int(n_res), "outer": outer, "inner": inner,
+                               "wall_sec": round(wall, 3), "cpu_sec": round(cpu, 3),
+                               "core_util": _util(cpu, wall, cores)})
+            return out
+
+        super()._run_search(planned)
+        # refit は親プロセスで 1 本だけなので全コアをスレッドに（fit の finally で元に戻す）
+        threads = plan_iteration(cores, 1, int(self._n_samples_orig))[1] if self.refit else 1
+        self.parallel_plan_["refit"] = {"threads": threads, "_t0": time.perf_counter(), "_c0": tree_cpu_seconds()}
+        self._refit_limits = threadpool_limits(limits=threads)
+
+
+def _util(cpu: float, wall: float, cores: int) -> Optional[float]:
+    return round(cpu / (wall * cores), 3) if wall > 0 else None
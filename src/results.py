@@ -0,0 +1,162 @@
+# src/results.py
+"""
+探索の評価結果（1 fold 分のスコア）を SQLite に書き残し、再開・重なる探索で使い回す（train.py --checkpoint）。
+  キー: 文脈（学習データ全体の指紋・前処理コードとライブラリの版・scoring）
+        + その fold の学習行（行ラベルのハッシュ。分割の seed・fold・資源＝サブサンプルで決まる）
+        + 推定器のパラメータ（スカラーの get_params 全部）
+  CheckpointedPipeline.fit は同じキーの結果があれば学習を飛ばし、ResultStore.scorer が保存済みのスコアを返す。
+  無ければ通常どおり学習・採点し、採点が終わった時点でコミットする（途中で落ちても終わった fold は残る）。
+どの run で使い回した / 計算したかは events 表に残り、usage(run_id) が summary_*.json 用に数える。
+Successive Halving のサブサンプルが run ごとに変わると当たらないので、train.py は random_state を SEED に固定する。
+"""
+from __future__ import annotations
+import hashlib, json, os, sqlite3, time, uuid
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import check_scoring
+from sklearn.pipeline import Pipeline
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS evals (
+  key TEXT PRIMARY KEY, context TEXT, train_rows TEXT, test_rows TEXT, n_train INTEGER,
+  params TEXT, score REAL, fit_sec REAL, run_id TEXT, created_at REAL);
+CREATE TABLE IF NOT EXISTS events (run_id TEXT, key TEXT, reused INTEGER, at REAL);
+"""
+_CONN: Dict[str, sqlite3.Connection] = {}  # path → 接続（プロセスごと。worker でも 1 回だけ開く）
+
+
+def rows_key(X) -> str:
+    """行ラベルのハッシュ（DataFrame の中身はハッシュしない）"""
+    h = pd.util.hash_array(np.asarray(X.index))
+    return hashlib.blake2b(h.tobytes(), digest_size=12).hexdigest()
+
+
+def params_key(est) -> str:
+    skip = ("checkpoint", "memory", "verbose")
+    p = {k: v for k, v in est.get_params(deep=True).items()
+         if k not in skip and not k.endswith(tuple("__" + s for s in skip))
+         and (v is None or isinstance(v, (bool, int, float, str)))}
+    return json.dumps(p, sort_keys=True)
+
+
+class ResultStore:
+    """評価結果の SQLite。pickle されて loky worker にも渡る（接続はプロセスごとに開き直す）"""
+
+    def __init__(self, path: str, context: str, run_id: Optional[str] = None):
+        self.path = path
+        self.context = context
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+
+    @staticmethod
+    def context_of(X: pd.DataFrame, y: pd.Series, code=(), scoring: str = "roc_auc") -> str:
+        import joblib
+        from cache import fingerprint
+        return f"{joblib.hash((X, y))[:16]}-{fingerprint(code)}-{scoring}"
+
+    def _conn(self) -> sqlite3.Connection:
+        c = _CONN.get(self.path)
+        if c is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            c = _CONN[self.path] = sqlite3.connect(self.path, timeout=60)
+            c.execute("PRAGMA journal_mode=WAL")  # worker 同士の書き込みで読み手を止めない
+            c.executescript(_SCHEMA)
+        return c
+
+    def key(self, train_rows: str, params: str) -> str:
+        return hashlib.blake2b(f"{self.context}|{train_rows}|{params}".encode(), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[tuple]:
+        """→ (score, test_rows) か None"""
+        return self._conn().execute("SELECT score, test_rows FROM evals WHERE key=?", (key,)).fetchone()
+
+    def put(self, key: str, train_rows: str, test_rows: str, n_train: int, params: str, score: float,
+            fit_sec: float) -> None:
+        c = self._conn()
+        with c:
+            c.execute("INSERT OR REPLACE INTO evals VALUES (?,?,?,?,?,?,?,?,?,?)",
+                      (key, self.context, train_rows, test_rows, n_train, params, score, fit_sec,
+                       self.run_id, time.time()))
+            c.execute("INSERT INTO events VALUES (?,?,0,?)", (self.run_id, key, time.time()))
+
+    def mark_reused(self, key: str) -> None:
+        c = self._conn()
+        with c:
+            c.execute("INSERT INTO events VALUES (?,?,1,?)", (self.run_id, key, time.time()))
+
+    def scorer(self, scoring: str = "roc_auc") -> "_CheckpointScorer":
+        return _CheckpointScorer(self, scoring)
+
+    def usage(self) -> dict:
+        """この run で使い回した / 計算した fold 評価の数と、使い回しで浮いた学習時間"""
+        c = self._conn()
+        reused, computed = (c.execute("SELECT COUNT(*) FROM events WHERE run_id=? AND reused=?",
+                                      (self.run_id, r)).fetchone()[0] for r in (1, 0))
+        saved = c.execute("SELECT COALESCE(SUM(e.fit_sec), 0) FROM events v JOIN evals e ON v.key = e.key "
+                          "WHERE v.run_id=? AND v.reused=1", (self.run_id,)).fetchone()[0]
+        total = c.execute("SELECT COUNT(*) FROM evals").fetchone()[0]
+        return {"path": self.path, "run_id": self.run_id, "fits_reused": reused, "fits_computed": computed,
+                "fit_sec_saved": round(saved, 2), "store_evals": total}
+
+
+class _CheckpointScorer:
+    """scoring の代わりに渡す callable。使い回した推定器なら保存済みのスコア、そうでなければ採点して保存"""
+
+    def __init__(self, store: ResultStore, scoring: str):
+        self.store = store
+        self.scoring = scoring
+
+    def __call__(self, est, X, y, **kwargs):
+        ck = getattr(est, "ckpt_", None)
+        if ck is None:  # 最終 refit 後など、チェックポイントを通っていない推定器
+            return check_scoring(est, scoring=self.scoring)(est, X, y, **kwargs)
+        test_rows = rows_key(X)
+        if test_rows == ck["train_rows"]:  # return_train_score の採点は保存しない
+            if ck["hit"] is not None:
+                est.fit_uncached()
+            return check_scoring(est, scoring=self.scoring)(est, X, y, **kwargs)
+        if ck["hit"] is not None and ck["hit"][1] == test_rows:
+            self.store.mark_reused(ck["key"])
+            return ck["hit"][0]
+        if ck["hit"] is not None:  # 同じ学習行で評価行だけ違う（想定外）。学習からやり直す
+            est.fit_uncached()
+            ck = est.ckpt_
+        score = float(check_scoring(est, scoring=self.scoring)(est, X, y, **kwargs))
+        self.store.put(ck["key"], ck["train_rows"], test_rows, ck["n_train"], ck["params"], score, ck["fit_sec"])
+        return score
+
+
+class CheckpointedPipeline(Pipeline):
+    """Pipeline と同じパラメータ名のまま、ResultStore に結果があれば fit を飛ばす"""
+
+    def __init__(self, steps, *, transform_input=None, memory=None, verbose=False, checkpoint=None):
+        super().__init__(steps, transform_input=transform_input, memory=memory, verbose=verbose)
+        self.checkpoint = checkpoint
+
+    def fit(self, X, y=None, **params):
+        if self.checkpoint is None:
+            return super().fit(X, y, **params)
+        train_rows, p = rows_key(X), params_key(self)
+        key = self.checkpoint.key(train_rows, p)
+        hit = self.checkpoint.get(key)
+        self.ckpt_ = {"key": key, "train_rows": train_rows, "params": p, "n_train": len(X), "hit": hit,
+                      "fit_sec": 0.0}
+        if hit is not None:
+            self._deferred = (X, y, params)  # 評価行が食い違ったときだけ使う
+            return self
+        t0 = time.perf_counter()
+        super().fit(X, y, **params)
+        self.ckpt_["fit_sec"] = time.perf_counter() - t0
+        return self
+
+    def fit_uncached(self):
+        X, y, params = self._deferred
+        t0 = time.perf_counter()
+        super().fit(X, y, **params)
+        self.ckpt_.update(hit=None, fit_sec=time.perf_counter() - t0)
+        return self
+
+    def plain(self) -> Pipeline:
+        """保存用の素の Pipeline（推論側をこのモジュールに依存させない）"""
+        return Pipeline(self.steps, transform_input=self.transform_input, verbose=self.verbose)
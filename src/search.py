@@ -0,0 +1,224 @@
+# src/search.py
+"""
+前処理を CV fold ごとに 1 回だけ fit/transform する探索モード（train.py --search pretransform）。
+param_grid は clf__* しか動かさないので、候補ごとに ColumnTransformer を fit し直すのは無駄。
+Pipeline(memory=...) は結果こそ使い回すが、呼ぶたびに DataFrame 全体をハッシュしてキャッシュを読み直す。
+
+探索器には元データの代わりに行番号の列（n×1）を渡し、PretransformedClassifier が
+「学習側の行番号」をキーに fit 済み前処理と float32 の変換結果を FoldFeatureStore から引く。
+Successive Halving の段（サブサンプル）ごと・fold ごとに 1 回だけ前処理が走り、キーのハッシュは行番号の bytes だけで済む。
+ストアはディレクトリ（.npy を mmap で読む + プロセス内の dict）なので loky worker 間でも共有できる。
+キー計算・前処理の fit の実測は呼び出しごとに <ストア>/stats.jsonl へ 1 行追記し（worker の分も集まる）、stats() で集計する。
+エントリを作る役は <キー>.lock（中身は持ち主の pid）で決め、持ち主が落ちていたら lock を外して作り直す。
+探索後は最良パラメータで通常の Pipeline(pre, clf) を全学習データで fit し直す（保存形式・API は従来どおり）。
+"""
+from __future__ import annotations
+import hashlib, json, os, pickle, shutil, tempfile, time
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from joblib import dump, load
+from sklearn.base import BaseEstimator, ClassifierMixin, clone
+
+from cache import pid_alive
+
+_RAW: Dict[str, pd.DataFrame] = {}        # root → 元データ（プロセスごとに 1 回だけ読む）
+_MATS: Dict[str, np.ndarray] = {}         # root/key → 変換済み行列（mmap）
+_PRES: Dict[str, object] = {}             # root/key → fit 済み前処理
+_STAT_KEYS = ("hash_sec", "hash_calls", "pre_fits", "pre_fit_sec", "hits")
+
+
+def _key(idx: np.ndarray) -> Tuple[str, float]:
+    """→ (キー, ハッシュにかかった秒)"""
+    t0 = time.perf_counter()
+    k = hashlib.blake2b(np.ascontiguousarray(idx, dtype=np.int64).tobytes(), digest_size=16).hexdigest()
+    return k, time.perf_counter() - t0
+
+
+class FoldFeatureStore:
+    """fold の学習行ごとの「fit 済み前処理 + float32 変換結果」を置くディレクトリ"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    @classmethod
+    def create(cls, X: pd.DataFrame, parent: str = "cache") -> "FoldFeatureStore":
+        os.makedirs(parent, exist_ok=True)
+        root = tempfile.mkdtemp(prefix="pretransform-", dir=parent)
+        with open(os.path.join(root, "X.pkl"), "wb") as f:
+            pickle.dump(X.reset_index(drop=True), f, protocol=pickle.HIGHEST_PROTOCOL)
+        return cls(root)
+
+    def raw(self) -> pd.DataFrame:
+        X = _RAW.get(self.root)
+        if X is None:
+            with open(os.path.join(self.root, "X.pkl"), "rb") as f:
+                X = _RAW[self.root] = pickle.load(f)
+        return X
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def fitted(self, pre, idx: np.ndarray):
+        """学習行 idx に対する (fit 済み前処理, 変換済み float32 行列, キー)。無ければ作って置く"""
+        key, hash_sec = _key(idx)
+        mem = f"{self.root}/{key}"
+        if mem in _MATS and mem in _PRES:
+            self._record(hash_sec=hash_sec, hash_calls=1, hits=1)
+            return _PRES[mem], _MATS[mem], key
+        npy, pkl, lock = self._path(f"{key}.npy"), self._path(f"{key}.pre"), self._path(f"{key}.lock")
+        if self._acquire(lock, npy):
+            try:
+                t0 = time.perf_counter()
+                fitted = clone(pre).fit(self.raw().iloc[idx])
+                Xt = np.asarray(fitted.transform(self.raw().iloc[idx]), dtype=np.float32)
+                fit_sec = time.perf_counter() - t0
+                tmp = f".{os.getpid()}.tmp"  # lock を外された後に別の worker と重なっても一時ファイルはぶつからない
+                dump(fitted, pkl + tmp)
+                np.save(npy + tmp + ".npy", Xt)
+                os.replace(pkl + tmp, pkl)
+                os.replace(npy + tmp + ".npy", npy)  # .npy が見えたら .pre も揃っている
+            finally:
+                try:
+                    os.unlink(lock)
+                except FileNotFoundError:  # 落ちたと見なされて外された
+                    pass
+            self._record(hash_sec=hash_sec, hash_calls=1, pre_fits=1, pre_fit_sec=fit_sec)
+        else:
+            self._record(hash_sec=hash_sec, hash_calls=1, hits=1)
+        _PRES[mem] = load(pkl)
+        _MATS[mem] = np.load(npy, mmap_mode="r")
+        return _PRES[mem], _MATS[mem], key
+
+    def transformed(self, train_key: str, pre_fitted, idx: np.ndarray) -> np.ndarray:
+        """fit 済み前処理で idx 行を変換（評価側。同じ fold の評価行は候補間で共通なので置いておく）"""
+        key, hash_sec = _key(idx)
+        mem = f"{self.root}/{train_key}/{key}"
+        Xt = _MATS.get(mem)
+        if Xt is None:
+            Xt = _MATS[mem] = np.asarray(pre_fitted.transform(self.raw().iloc[idx]), dtype=np.float32)
+            self._record(hash_sec=hash_sec, hash_calls=1)
+        else:
+            self._record(hash_sec=hash_sec, hash_calls=1, hits=1)
+        return Xt
+
+    @staticmethod
+    def _acquire(lock: str, npy: str, timeout: float = 600.0) -> bool:
+        """作る役を取れたら True。出来上がっていれば、または他の worker が作り終えるのを待てたら False。
+        lock は pid を書いた一時ファイルの link で作る（中身の無い lock が見えない）。
+        持ち主の pid が死んでいる lock・作らずに外された lock は取り直す"""
+        mine = f"{lock}.{os.getpid()}"
+        with open(mine, "w") as f:
+            f.write(str(os.getpid()))
+        try:
+            deadline = time.time() + timeout
+            while not os.path.exists(npy):
+                try:
+                    os.link(mine, lock)
+                    return True
+                except FileExistsError:
+                    pass
+                try:
+                    with open(lock) as f:
+                        owner = int(f.read())
+                except FileNotFoundError:
+                    continue  # 持ち主が作らずに外した（fit の失敗など）→ 取り直す
+                if not pid_alive(owner):
+                    try:
+                        os.unlink(lock)
+                    except FileNotFoundError:
+                        pass
+                    continue
+                if time.time() > deadline:
+                    raise TimeoutError(f"pretransform cache entry not produced: {npy}")
+                time.sleep(0.01)
+            return False
+        finally:
+            os.unlink(mine)
+
+    def _record(self, **fields) -> None:
+        line = json.dumps({"pid": os.getpid(), **fields}) + "\n"
+        try:  # 1 行は PIPE_BUF より短いので O_APPEND の 1 回の write で混ざらない
+            fd = os.open(self._path("stats.jsonl"), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line.encode())
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        """全プロセス（親 + loky worker）の実測の合計"""
+        out = dict.fromkeys(_STAT_KEYS, 0)
+        pids = set()
+        try:
+            with open(self._path("stats.jsonl")) as f:
+                for line in f:
+                    r = json.loads(line)
+                    pids.add(r["pid"])
+                    for k in _STAT_KEYS:
+                        out[k] += r.get(k, 0)
+        except FileNotFoundError:
+            pass
+        return {**out, "hash_sec": round(out["hash_sec"], 4), "pre_fit_sec": round(out["pre_fit_sec"], 3),
+                "processes": len(pids)}
+
+    def entries(self) -> int:
+        return sum(1 for n in os.listdir(self.root) if n.endswith(".npy") and ".tmp" not in n)
+
+    def nbytes(self) -> int:
+        return sum(os.path.getsize(self._path(n)) for n in os.listdir(self.root))
+
+    def close(self) -> None:
+        shutil.rmtree(self.root, ignore_errors=True)
+        for d in (_RAW, _MATS, _PRES):
+            for k in [k for k in d if k.startswith(self.root)]:
+                del d[k]
+
+
+class PretransformedClassifier(ClassifierMixin, BaseEstimator):
+    """X として行番号（n×1）を受け取り、前処理は FoldFeatureStore から引いて clf だけ学習する"""
+
+    def __init__(self, pre=None, clf=None, store: Optional[str] = None):
+        self.pre = pre
+        self.clf = clf
+        self.store = store
+
+    def _idx(self, X) -> np.ndarray:
+        return np.asarray(X)[:, 0].astype(np.int64)
+
+    def fit(self, X, y, **fit_params):
+        store = FoldFeatureStore(self.store)
+        self.pre_, Xt, self.key_ = store.fitted(self.pre, self._idx(X))
+        self.clf_ = clone(self.clf).fit(Xt, y, **fit_params)
+        self.classes_ = self.clf_.classes_
+        return self
+
+    def _transform(self, X) -> np.ndarray:
+        return FoldFeatureStore(self.store).transformed(self.key_, self.pre_, self._idx(X))
+
+    def predict_proba(self, X):
+        return self.clf_.predict_proba(self._transform(X))
+
+    def decision_function(self, X):
+        return self.clf_.decision_function(self._transform(X))
+
+    def predict(self, X):
+        return self.clf_.predict(self._transform(X))
+
+
+def row_index(n: int) -> np.ndarray:
+    """探索器に渡す X（行番号の列）"""
+    return np.arange(n, dtype=np.int64).reshape(-1, 1)
+
+
+def hashing_report(mode: str, n_candidates, n_splits: int, measured: dict) -> dict:
+    """探索中のキャッシュキー計算の実測（見積もりではない）。
+    pipeline 等: Pipeline(memory) が fit ごとに引数（学習 fold の DataFrame・前処理・y）を joblib.hash した分
+                （ManagedMemory の hash_sec。refit を含む）
+    pretransform: fit と評価ごとに行番号の bytes を blake2b した分（FoldFeatureStore.stats）"""
+    return {"fits": int(sum(c * n_splits for c in n_candidates)),
+            "hash_source": "fold_store" if mode == "pretransform" else "pipeline_memory",
+            "hash_calls": int(measured.get("hash_calls", measured.get("calls", 0))),
+            "hash_sec": measured.get("hash_sec", 0.0)}
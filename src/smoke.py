@@ -1,6 +1,6 @@
 # src/smoke.py  ── scikit-learn 正式APIのみ版
 import json, time, os
-from joblib import dump, Memory
+from joblib import dump
 from threadpoolctl import threadpool_limits
 from sklearn.datasets import load_breast_cancer
 from sklearn.model_selection import StratifiedKFold, cross_val_score
@@ -9,21 +9,27 @@ from sklearn.pipeline import Pipeline
 from sklearn.impute import SimpleImputer
 from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import HistGradientBoostingClassifier
+from cache import ManagedMemory
 
 # 並列度は環境変数で調整（デフォルト8）
 N_JOBS = int(os.environ.get("N_JOBS", "8"))
 
 Xy = load_breast_cancer(as_frame=True)
 X, y = Xy.data, Xy.target
-num_cols = X.columns
+num_cols = list(X.columns)  # pandas 3 の str 型 Index は ColumnTransformer が列指定として解釈できない
 
 pre = ColumnTransformer([
     ("num", Pipeline([("imp", SimpleImputer()), ("sc", StandardScaler())]), num_cols)
 ])
 
+# 前処理キャッシュ（このファイルの中身が指紋。変えたら名前空間ごと作り直し）
+with open(__file__) as f:
+    memory = ManagedMemory("smoke", code=[f.read()])
+cache_prepare = memory.prepare()
+
 pipe = Pipeline(
     [("pre", pre), ("clf", HistGradientBoostingClassifier(random_state=42))],
-    memory=Memory("cache")
+    memory=memory
 )
 
 cv = StratifiedKFold(n_splits=2, shuffle=True, random_state=42)
@@ -41,14 +47,17 @@ elapsed = round(time.time() - t0, 2)
 
 # 全データで一度fitして保存（推論テスト用）
 pipe.fit(X, y)
-dump(pipe, "models/model.joblib")
+cache_report = {**memory.finish(), **cache_prepare}
+dump(pipe.set_params(memory=None), "models/model.joblib")
 
 with open("artifacts/summary.json", "w") as f:
     json.dump(
         {"auc_mean": float(scores.mean()),
          "auc_std": float(scores.std()),
-         "elapsed_sec": elapsed},
+         "elapsed_sec": elapsed,
+         "cache": cache_report},
         f, indent=2
     )
 
-print("SMOKE OK | AUC:", round(scores.mean(), 4), "| time(s):", elapsed)
+print("SMOKE OK | AUC:", round(scores.mean(), 4), "| time(s):", elapsed,
+      "| cache hit:", cache_report["hit_ratio"])
@@ -8,8 +8,9 @@ Usage:
 
 from __future__ import annotations
 import os, json, time, argparse, math
+import numpy as np
 import pandas as pd
-from joblib import dump, Memory
+from joblib import dump
 from threadpoolctl import threadpool_limits
 
 # Successive Halving
@@ -19,16 +20,18 @@ from sklearn.model_selection import (
 )
 
 # 前処理パイプライン
+from sklearn.base import clone
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
 from sklearn.impute import SimpleImputer
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder, StandardScaler
 
 # モデルと評価
 from sklearn.ensemble import HistGradientBoostingClassifier
 from sklearn.metrics import roc_auc_score, accuracy_score
 
 from datasets import load_dataset  # パッケージ src/datasets/loader.py
+from cache import ManagedMemory
 import platform, subprocess, sklearn
 
 def _git_commit() -> str | None:
@@ -38,10 +41,37 @@ def _git_commit() -> str | None:
     except Exception:
         return None
 
-def build_preprocessor(df: pd.DataFrame) -> ColumnTransformer:
+def env_metadata() -> dict:
+    """成果物に添える実行環境（summary_*.json・ベンチ結果で共通）"""
+    return {
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "sklearn": sklearn.__version__,
+        "pandas": pd.__version__,
+    }
+
+def peak_rss_mb() -> float:
+    """このプロセスの最大 RSS（MB）。子プロセスの値は fork 時点の親の分を含んでしまうので見ない"""
+    import resource
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)  # Linux は KiB
+
+
+def build_preprocessor(df: pd.DataFrame, encoding: str = "onehot") -> ColumnTransformer:
     num_cols = list(df.select_dtypes(include=["number"]).columns)
     cat_cols = list(df.select_dtypes(exclude=["number"]).columns)
 
+    if encoding == "native":
+        # カテゴリは 1 列のまま整数コードにし、HGB の categorical_features で扱う（build_classifier）。
+        # 欠損・未知はどちらも NaN = HGB の欠損バケット。列順はカテゴリが先（数値側で全欠損列が落ちても番号がずれない）
+        many = any(df[c].nunique() > 255 for c in cat_cols)  # HGB のカテゴリは max_bins(255) 種まで
+        ordinal = OrdinalEncoder(handle_unknown="use_encoded_value", unknown_value=np.nan,
+                                 encoded_missing_value=np.nan, max_categories=255 if many else None,
+                                 dtype=np.float64)
+        return ColumnTransformer([
+            ("cat", ordinal, cat_cols),
+            ("num", Pipeline([("imp", SimpleImputer()), ("sc", StandardScaler())]), num_cols),
+        ])
+
     # scikit-learn 互換（古い版は sparse_output が無い）
     try:
         ohe = OneHotEncoder(handle_unknown="ignore", sparse_output=False, dtype="float32")
@@ -55,6 +85,56 @@ def build_preprocessor(df: pd.DataFrame) -> ColumnTransformer:
     return pre
 
 
+def build_classifier(df: pd.DataFrame, encoding: str = "onehot", seed: int = 42) -> HistGradientBoostingClassifier:
+    """native では build_preprocessor の出力の先頭（カテゴリ列）をカテゴリ特徴量として渡す"""
+    n_cat = len(df.select_dtypes(exclude=["number"]).columns)
+    if encoding == "native" and n_cat:
+        return HistGradientBoostingClassifier(random_state=seed, categorical_features=list(range(n_cat)))
+    return HistGradientBoostingClassifier(random_state=seed)
+
+
+def encoding_profile(model: Pipeline, fit_sec: float, Xte, yte) -> dict:
+    """fit 済みモデルの保存サイズ・推論レイテンシ（1 行 / 1024 行の中央値）・AUC・前処理後の列数（fit_sec は呼び出し側で測る）"""
+    import io
+    buf = io.BytesIO()
+    dump(model, buf)
+
+    def _latency_ms(rows: pd.DataFrame, repeat: int) -> float:
+        ts = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            model.predict_proba(rows)
+            ts.append(time.perf_counter() - t)
+        return round(float(np.median(ts)) * 1000, 3)
+
+    return {
+        "fit_sec": round(fit_sec, 2),
+        "model_bytes": buf.tell(),
+        "n_features": len(model.named_steps["pre"].get_feature_names_out()),
+        "predict_ms_1": _latency_ms(Xte.iloc[:1], 50),
+        "predict_ms_1024": _latency_ms(Xte.iloc[:1024], 10),
+        "auc": round(float(roc_auc_score(yte, model.predict_proba(Xte)[:, 1])), 4),
+    }
+
+
+def compare_encodings(X, model: Pipeline, fit_sec: float, Xtr, ytr, Xte, yte, params: dict, seed: int,
+                      threads: int = 1, memory=None) -> dict:
+    """fit 済みの native モデルと、同じ最良パラメータで fit し直した onehot を並べる（summary の categorical.compare）。
+    onehot は native の refit と同じ条件（スレッド数 threads・Pipeline の memory）で fit して時間を測る"""
+    onehot = Pipeline([("pre", build_preprocessor(X, "onehot")), ("clf", build_classifier(X, "onehot", seed))],
+                      memory=memory)
+    with threadpool_limits(limits=threads):
+        t0 = time.perf_counter()
+        onehot.set_params(**params).fit(Xtr, ytr)
+        onehot_sec = time.perf_counter() - t0
+    return {"native": {**encoding_profile(model, fit_sec, Xte, yte), "fit_threads": threads},
+            "onehot": {**encoding_profile(onehot, onehot_sec, Xte, yte), "fit_threads": threads}}
+
+
+# キャッシュの指紋に入れるコード（ここが変わると前処理の結果が変わりうる）
+CACHE_CODE = (build_preprocessor,)
+
+
 def compute_min_resources(y: pd.Series, n_splits: int, mode: str) -> int | None:
     """
     小規模データでは SH の初期サンプルが小さすぎると fold で片クラスになりがち。
@@ -72,47 +152,93 @@ def compute_min_resources(y: pd.Series, n_splits: int, mode: str) -> int | None:
     return min(m, N)
 
 
+def search_settings(mode: str) -> tuple[int, int]:
+    """速度/品質の切替 → (CV 分割数, Successive Halving の factor)"""
+    return (3, 2) if mode == "fast" else (5, 3)
+
+
+def param_grid_from_env() -> dict:
+    """パラメータグリッド（GRID_DEPTH / GRID_LR / GRID_LEAFS で上書き）"""
+    import ast
+    def _maybe(env, default):
+        v = os.getenv(env)
+        return ast.literal_eval(v) if v else default
+
+    return {
+        "clf__max_depth": _maybe("GRID_DEPTH", [None, 4, 8]),
+        "clf__learning_rate": _maybe("GRID_LR", [0.05, 0.1, 0.2]),
+        "clf__max_leaf_nodes": _maybe("GRID_LEAFS", [31, 63, 127]),
+    }
+
+
 def main() -> None:
     ap = argparse.ArgumentParser()
     ap.add_argument("--dataset", choices=["builtin", "adult", "credit-g", "local"], default="builtin")
     ap.add_argument("--mode",    choices=["fast", "full"], default="fast")
+    # 並列度。fixed は既定 8（i7-9700 実コア）、auto は検出したコア数。src/orchestrate.py は割り当てを渡す
+    ap.add_argument("--n-jobs",  type=int, default=int(os.getenv("N_JOBS", "0")) or None)
+    # fixed: n_jobs 本の worker・BLAS/OpenMP 1 スレッド / auto: 段ごとに worker 数とスレッド数を計画（src/parallel_plan.py）
+    ap.add_argument("--parallel", choices=["fixed", "auto"], default=os.getenv("PARALLEL_PLAN", "fixed"))
+    # pipeline: Pipeline(pre, clf) をそのまま探索 / pretransform: 前処理は fold ごとに 1 回だけ（src/search.py）
+    # asha: 非同期 Successive Halving（src/asha.py。資源・候補空間は ASHA_RESOURCE / ASHA_SPACE）
+    ap.add_argument("--search", choices=["pipeline", "pretransform", "asha"],
+                    default=os.getenv("SEARCH_MODE", "pipeline"))
+    # fold ごとの評価結果を置く SQLite（例: artifacts/search_results.sqlite）。同じ評価は再開・別 run で使い回す（src/results.py）
+    ap.add_argument("--checkpoint", default=os.getenv("CHECKPOINT_DB", ""))
+    # カテゴリ列: onehot（密な one-hot）/ native（整数コード + HGB の categorical_features）
+    ap.add_argument("--cat-encoding", choices=["onehot", "native"], default=os.getenv("CAT_ENCODING", "onehot"))
+    # local CSV を N 行ずつ読んで学習（メモリに載らない大きさ向け。src/ooc.py）。0 なら従来どおり全部読む
+    ap.add_argument("--chunksize", type=int, default=int(os.getenv("CHUNKSIZE", "0")))
     args = ap.parse_args()
+    if args.checkpoint and args.search == "pretransform":
+        ap.error("--checkpoint is not supported with --search pretransform")
+    if args.parallel == "auto" and args.search == "asha":  # asha は自前の worker プールで段を持たない
+        ap.error("--parallel auto is not supported with --search asha")
+    if args.chunksize:
+        if args.dataset != "local":
+            ap.error("--chunksize is only supported with --dataset local")
+        # chunk 経路はサンプル上の Pipeline 探索だけ（探索方式・並列計画・checkpoint は持たない）
+        if args.search != "pipeline":
+            ap.error("--chunksize is only supported with --search pipeline")
+        if args.parallel != "fixed":
+            ap.error("--chunksize is only supported with --parallel fixed")
+        if args.checkpoint:
+            ap.error("--checkpoint is not supported with --chunksize")
+        return main_chunked(args)
 
     X, y, dsname = load_dataset(args.dataset)
 
-    pre = build_preprocessor(X)
+    pre = build_preprocessor(X, args.cat_encoding)
 
-    # 速度/品質の切替
-    n_splits = 3 if args.mode == "fast" else 5
-    factor   = 2 if args.mode == "fast" else 3
-    n_jobs   = 8  # i7-9700 実コア
+    n_splits, factor = search_settings(args.mode)
+    if args.parallel == "auto":
+        from parallel_plan import PlannedHalvingGridSearchCV as SearchCV, detect_cores
+        n_jobs = args.n_jobs or detect_cores()
+    else:
+        SearchCV = HalvingGridSearchCV
+        n_jobs = args.n_jobs or 8
 
     SEED = int(os.getenv("SEED", "42"))
     cv = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=SEED)
 
+    # 前処理の fit 結果のキャッシュ。前処理コード・ライブラリの版が変わると名前空間ごと捨てる（src/cache.py）
+    memory = ManagedMemory("train", code=CACHE_CODE)
+    cache_prepare = memory.prepare()
+
     pipe = Pipeline(
-        steps=[("pre", pre), ("clf", HistGradientBoostingClassifier(random_state=SEED))],
-        memory=Memory("cache", verbose=0),
+        steps=[("pre", pre), ("clf", build_classifier(X, args.cat_encoding, SEED))],
+        memory=memory,
     )
 
     # パラメータグリッドも環境変数で上書き
-    import ast
-    def _maybe(env, default):
-        v = os.getenv(env)
-        return ast.literal_eval(v) if v else default
-
-    param_grid = {
-        "clf__max_depth": _maybe("GRID_DEPTH", [None, 4, 8]),
-        "clf__learning_rate": _maybe("GRID_LR", [0.05, 0.1, 0.2]),
-        "clf__max_leaf_nodes": _maybe("GRID_LEAFS", [31, 63, 127]),
-    }
+    param_grid = param_grid_from_env()
 
     min_res = compute_min_resources(y, n_splits, args.mode)
 
     os.makedirs("artifacts", exist_ok=True)
     os.makedirs("models", exist_ok=True)
 
-    # 外側CVだけ並列、内側BLASは1
+    # 外側CVだけ並列、内側BLASは1（auto では段ごとに PlannedHalvingGridSearchCV がかけ直す）
     with threadpool_limits(limits=1):
         Xtr, Xte, ytr, yte = train_test_split(
             X, y, test_size=0.2, stratify=y, random_state=42
@@ -131,27 +257,89 @@ def main() -> None:
         if min_res is not None:
             search_kwargs["min_resources"] = min_res
 
-        search = HalvingGridSearchCV(**search_kwargs)
+        ckpt = None
+        if args.checkpoint:
+            from results import CheckpointedPipeline, ResultStore
+            ckpt = ResultStore(args.checkpoint, ResultStore.context_of(Xtr, ytr, code=CACHE_CODE))
+            search_kwargs.update(
+                estimator=CheckpointedPipeline(pipe.steps, memory=memory, checkpoint=ckpt),
+                scoring=ckpt.scorer("roc_auc"),
+                random_state=SEED,  # 段ごとのサブサンプルを run 間で揃えないと使い回せない
+                return_train_score=False,  # 使い回した fold は学習していないので学習側のスコアは出せない
+            )
+
+        store = None
+        if args.search == "pretransform":
+            from search import FoldFeatureStore, PretransformedClassifier, row_index
+            store = FoldFeatureStore.create(Xtr)
+            search_kwargs.update(
+                estimator=PretransformedClassifier(pre=pre, clf=build_classifier(X, args.cat_encoding, SEED),
+                                                   store=store.root),
+                refit=False,  # 最良パラメータの Pipeline を下で fit し直す
+            )
+
+        if args.search == "asha":
+            from asha import AshaSearchCV
+            search = AshaSearchCV(search_kwargs["estimator"], param_grid, scoring=search_kwargs["scoring"], cv=cv,
+                                  factor=factor, min_resources=min_res, n_jobs=n_jobs, error_score=0.0,
+                                  random_state=SEED, verbose=1)
+        else:
+            search = SearchCV(**search_kwargs)
 
         t0 = time.time()
-        search.fit(Xtr, ytr)
-        elapsed = int(time.time() - t0)
-
-        proba = search.predict_proba(Xte)[:, 1]
+        try:
+            if store is not None:
+                search.fit(row_index(len(Xtr)), ytr)
+                pre_fits, store_mb, hashing = store.entries(), round(store.nbytes() / 2**20, 1), store.stats()
+                t1 = time.perf_counter()
+                model = clone(pipe).set_params(**search.best_params_).fit(Xtr, ytr)
+                refit_sec = time.perf_counter() - t1
+            else:
+                search.fit(Xtr, ytr)
+                hashing = memory.stats()  # 探索（refit 込み）の分だけ。この後の比較の fit は含めない
+                model = search.best_estimator_
+                refit_sec = search.refit_time_
+                if ckpt is not None:
+                    model = model.plain()
+        finally:
+            if store is not None:
+                store.close()
+        wall = time.time() - t0
+        elapsed = int(wall)
+
+        proba = model.predict_proba(Xte)[:, 1]
         auc = float(roc_auc_score(yte, proba))
-        acc = float(accuracy_score(yte, search.predict(Xte)))
+        acc = float(accuracy_score(yte, model.predict(Xte)))
+
+        # native のときは one-hot と並べて比べる（CAT_COMPARE=0 で省略）
+        cat_report = {"encoding": args.cat_encoding}
+        if args.cat_encoding == "native" and os.getenv("CAT_COMPARE", "1") != "0":
+            # native の refit と同じスレッド数（auto では全コア）・同じキャッシュで onehot を fit する
+            refit_threads = ((getattr(search, "parallel_plan_", None) or {}).get("refit") or {}).get("threads", 1)
+            cat_report["compare"] = compare_encodings(X, model, refit_sec, Xtr, ytr, Xte, yte, search.best_params_,
+                                                      SEED, threads=refit_threads, memory=memory)
+            print(f"[CAT] {json.dumps(cat_report)}")
+
+    from search import hashing_report
+    search_report = {"mode": args.search, "wall_sec": round(wall, 2),
+                     **hashing_report(args.search, search.n_candidates_, n_splits, hashing)}
+    if store is not None:
+        search_report.update(pre_fits=pre_fits, pre_fit_sec=hashing["pre_fit_sec"], store_mb=store_mb)
+    if args.search == "asha":
+        search_report.update(search.report())
+    if ckpt is not None:
+        search_report["checkpoint"] = ckpt.usage()
+    print(f"[SEARCH] {json.dumps(search_report)}")
+
+    cache_report = {**memory.finish(), **cache_prepare}
+    print(f"[CACHE] {json.dumps(cache_report)}")
 
     model_path = f"models/model_{dsname}.joblib"
-    dump(search.best_estimator_, model_path)
+    dump(model.set_params(memory=None), model_path)  # 推論側でキャッシュは使わない（cache モジュールに依存させない）
 
     pd.DataFrame(search.cv_results_).to_csv(f"artifacts/cv_results_{dsname}.csv", index=False)
 
-    meta = {
-        "git_commit": _git_commit(),
-        "python": platform.python_version(),
-        "sklearn": sklearn.__version__,
-        "pandas": pd.__version__,
-    }
+    meta = env_metadata()
 
     with open(f"artifacts/summary_{dsname}.json", "w") as f:
         json.dump({
@@ -164,6 +352,12 @@ def main() -> None:
             "finished_at": int(time.time()),
             "min_resources": min_res,
             "cv_splits": n_splits,
+            "n_jobs": n_jobs,
+            "parallel": getattr(search, "parallel_plan_", None) or {"mode": "fixed"},
+            "search": search_report,
+            "cache": cache_report,
+            "categorical": cat_report,
+            "peak_rss_mb": peak_rss_mb(),
             **meta,
         }, f, indent=2)
 
@@ -174,5 +368,54 @@ def main() -> None:
     print("=== TRAIN DONE ===")
 
 
+def main_chunked(args) -> None:
+    """--chunksize: CSV を chunk で読み、サンプルで探索 → 全体統計の前処理で fit し直す（src/ooc.py）"""
+    import ooc
+    from datasets.loader import LOCAL_CSV
+
+    SEED = int(os.getenv("SEED", "42"))
+    n_jobs = args.n_jobs or 8
+    dsname = "local_csv"
+    os.makedirs("artifacts", exist_ok=True)
+    os.makedirs("models", exist_ok=True)
+    memory = ManagedMemory("train", code=CACHE_CODE)
+    cache_prepare = memory.prepare()
+
+    t0 = time.time()
+    r = ooc.run(LOCAL_CSV, args.chunksize, args.mode, n_jobs, SEED, memory=memory, encoding=args.cat_encoding)
+    elapsed = int(time.time() - t0)
+    search = r["search"]
+    cache_report = {**memory.finish(), **cache_prepare}
+    print(f"[OOC] {json.dumps(r['ooc'])}")
+
+    dump(r["model"], f"models/model_{dsname}.joblib")
+    pd.DataFrame(search.cv_results_).to_csv(f"artifacts/cv_results_{dsname}.csv", index=False)
+    with open(f"artifacts/summary_{dsname}.json", "w") as f:
+        json.dump({
+            "dataset": dsname,
+            "mode": args.mode,
+            "auc": r["auc"],
+            "accuracy": r["accuracy"],
+            "best_params": search.best_params_,
+            "elapsed_sec": elapsed,
+            "finished_at": int(time.time()),
+            "min_resources": r["min_resources"],
+            "cv_splits": r["cv_splits"],
+            "n_jobs": n_jobs,
+            "search": {"mode": "pipeline", "wall_sec": r["ooc"]["search_sec"]},
+            "cache": cache_report,
+            "ooc": r["ooc"],
+            "categorical": {"encoding": args.cat_encoding},
+            "peak_rss_mb": peak_rss_mb(),
+            **env_metadata(),
+        }, f, indent=2)
+
+    print(
+        f"[RESULT] ds={dsname} mode={args.mode} AUC={r['auc']:.4f} ACC={r['accuracy']:.4f} "
+        f"best={search.best_params_} elapsed_sec={elapsed} peak_rss_mb={peak_rss_mb()}"
+    )
+    print("=== TRAIN DONE ===")
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,129 @@
+# tests/test_admission.py
+"""Admission control: concurrency slots, FIFO hand-off, 429 on full queue, 503 on unmeetable deadline."""
+from __future__ import annotations
+
+import asyncio
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from joblib import dump
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+for p in (REPO_ROOT, REPO_ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from api.admission import AdmissionController, Overloaded  # noqa: E402
+
+
+def test_slot_is_handed_to_waiter_in_fifo_order():
+    async def main():
+        adm = AdmissionController(1, max_queue=4, default_deadline_ms=1000)
+        assert await adm.acquire(1.0) == 0.0
+        order = []
+
+        async def waiter(i):
+            await adm.acquire(1.0)
+            order.append(i)
+            adm.release(0.001)
+
+        tasks = [asyncio.create_task(waiter(i)) for i in range(3)]
+        await asyncio.sleep(0.01)
+        assert adm.queue_depth == 3 and adm.in_flight == 1
+        adm.release(0.001)
+        await asyncio.gather(*tasks)
+        assert order == [0, 1, 2]
+        assert adm.in_flight == 0 and adm.queue_depth == 0
+
+    asyncio.run(main())
+
+
+def test_full_queue_and_unmeetable_deadline_are_shed():
+    async def main():
+        adm = AdmissionController(1, max_queue=1, default_deadline_ms=1000)
+        await adm.acquire(1.0)
+        adm.service_ewma = 0.5  # 1件 0.5 秒と見積もる
+        with pytest.raises(Overloaded) as e:
+            await adm.acquire(0.1)  # 見積もり 0.5s > 期限 0.1s
+        assert e.value.status == 503 and e.value.reason == "deadline"
+        pending = asyncio.create_task(adm.acquire(1.0))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as e:
+            await adm.acquire(5.0)
+        assert e.value.status == 429 and e.value.reason == "queue_full" and e.value.retry_after >= 1
+        pending.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await pending
+        assert adm.queue_depth == 0 and adm.in_flight == 1
+
+    asyncio.run(main())
+
+
+def test_waiter_times_out_at_deadline():
+    async def main():
+        adm = AdmissionController(1, max_queue=4)
+        await adm.acquire(1.0)
+        with pytest.raises(Overloaded) as e:
+            await adm.acquire(0.02)
+        assert e.value.reason == "timeout" and adm.queue_depth == 0
+        adm.release(0.01)
+        assert adm.in_flight == 0
+
+    asyncio.run(main())
+
+
+def test_slot_granted_as_deadline_expires_is_not_leaked(monkeypatch):
+    from api import admission
+
+    async def granted_then_timeout(fut, timeout):
+        adm.release(0.01)  # 期限切れの直前に枠が渡る
+        assert fut.done()
+        raise asyncio.TimeoutError
+
+    adm = AdmissionController(1, max_queue=4)
+
+    async def main():
+        await adm.acquire(1.0)
+        monkeypatch.setattr(admission.asyncio, "wait_for", granted_then_timeout)
+        with pytest.raises(Overloaded):
+            await adm.acquire(0.02)
+        assert adm.in_flight == 0 and adm.queue_depth == 0
+
+    asyncio.run(main())
+
+
+def test_deadline_header_parsing():
+    adm = AdmissionController(1, default_deadline_ms=250)
+    assert adm.deadline_for("40") == 0.04
+    assert adm.deadline_for(None) == adm.deadline_for("abc") == adm.deadline_for("-5") == 0.25
+
+
+def test_predict_is_shed_with_retry_after(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from fastapi.testclient import TestClient
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import Pipeline
+    import train
+    from api import app as A
+
+    rng = np.random.RandomState(0)
+    X = pd.DataFrame({"age": rng.randint(17, 90, 200).astype(float)})
+    pipe = Pipeline([("pre", train.build_preprocessor(X)),
+                     ("clf", LogisticRegression())]).fit(X, (X["age"] > 40).astype(int))
+    dump(pipe, tmp_path / "m.joblib")
+    A.load_model(str(tmp_path / "m.joblib"))
+
+    adm = AdmissionController(1, max_queue=0)
+    monkeypatch.setattr(A, "_admission", adm)
+    client = TestClient(A.app)
+    assert client.post("/predict", json={"features": {"age": 30}}).status_code == 200
+    adm.in_flight = 1  # 枠を埋めたままにする
+    r = client.post("/predict_batch", json={"rows": [{"age": 30}]}, headers={"X-Request-Deadline-Ms": "50"})
+    assert r.status_code == 429 and r.headers["retry-after"] == "1"
+    adm.in_flight = 0
+    text = client.get("/metrics").text
+    assert 'app_admission_shed_total{reason="queue_full"}' in text
+    assert "app_admission_queue_wait_seconds_count" in text and "app_admission_queue_depth 0" in text
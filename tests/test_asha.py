@@ -0,0 +1,59 @@
+# tests/test_asha.py
+"""Asynchronous successive halving: rung schedule, promotion rule, and a small end-to-end search."""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+for p in (REPO_ROOT, REPO_ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from asha import AshaSearchCV, rung_resources  # noqa: E402
+
+
+def test_rung_resources_end_at_max():
+    assert rung_resources(100, 900, 3) == [100, 300, 900]
+    assert rung_resources(100, 1000, 3) == [100, 300, 1000]  # 最後の段は全量
+    assert rung_resources(500, 400, 3) == [400]
+
+
+def test_promotes_top_fraction_before_starting_new_candidates():
+    s = AshaSearchCV(estimator=None, param_distributions={}, factor=3)
+    s.candidates_ = [{}] * 9
+    s.resources_ = [10, 30, 90]
+    s._done = [{0: 0.5, 1: 0.9, 2: 0.7}, {}, {}]
+    s._promoted = [set(), set(), set()]
+    s._next_new = 3
+    assert s._next_job() == (1, 1)   # 3 件終わった段 0 の上位 1/3
+    assert s._next_job() == (3, 0)   # 昇格できる候補が無ければ新しい候補
+    s._done[1] = {1: 0.8, 4: 0.6, 5: 0.7}
+    assert s._next_job() == (1, 2)   # 上の段の昇格が先
+
+
+def test_fit_writes_halving_like_results(tmp_path):
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    from sklearn.model_selection import StratifiedKFold
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    rng = np.random.RandomState(0)
+    X = pd.DataFrame(rng.normal(size=(600, 4)), columns=list("abcd"))
+    y = pd.Series((X["a"] + 0.5 * rng.normal(size=600) > 0).astype(int))
+    pipe = Pipeline([("pre", StandardScaler()), ("clf", HistGradientBoostingClassifier(max_iter=20))])
+    grid = {"clf__learning_rate": [0.05, 0.1, 0.2], "clf__max_depth": [2, 3, 4]}
+    s = AshaSearchCV(pipe, grid, cv=StratifiedKFold(3), factor=3, n_jobs=2, workdir=str(tmp_path),
+                     resource="n_samples", space="grid").fit(X, y)
+
+    res = pd.DataFrame(s.cv_results_)
+    assert s.resources_ == [67, 200, 600] and s.n_candidates_[0] == 9
+    assert {"params", "mean_test_score", "rank_test_score", "split2_test_score", "iter"} <= set(res.columns)
+    best = res.loc[res["rank_test_score"] == 1].iloc[0]
+    assert best["iter"] == res["iter"].max() and best["params"] == s.best_params_
+    assert 0 < s.time_to_best_ <= s.search_wall_
+    assert s.best_estimator_.predict_proba(X).shape == (600, 2)
+    assert list(tmp_path.iterdir()) == []  # 作業ディレクトリは消える
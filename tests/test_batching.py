@@ -0,0 +1,57 @@
+# tests/test_batching.py
+"""MicroBatcher: concurrent submits are coalesced and results routed back in order."""
+from __future__ import annotations
+
+import asyncio
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from api.batching import MicroBatcher  # noqa: E402
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_submits_are_coalesced():
+    calls = []
+
+    def predict(rows):
+        calls.append(len(rows))
+        return [r * 10 for r in rows]
+
+    async def main():
+        b = MicroBatcher(predict, max_batch=8, max_wait_ms=20)
+        b.start()
+        try:
+            return await asyncio.gather(*[b.submit(i) for i in range(20)]), b.stats()
+        finally:
+            await b.stop()
+
+    results, st = _run(main())
+    assert results == [i * 10 for i in range(20)]
+    assert max(calls) <= 8 and len(calls) < 20
+    assert st["rows"] == 20 and st["flushes"] == len(calls)
+
+
+def test_bad_row_fails_only_its_caller():
+    def predict(rows):
+        if any(r < 0 for r in rows):
+            raise ValueError("negative")
+        return rows
+
+    async def main():
+        b = MicroBatcher(predict, max_batch=4, max_wait_ms=20)
+        b.start()
+        try:
+            return await asyncio.gather(*[b.submit(i) for i in (1, -1, 2)], return_exceptions=True)
+        finally:
+            await b.stop()
+
+    ok1, bad, ok2 = _run(main())
+    assert (ok1, ok2) == (1, 2)
+    assert isinstance(bad, ValueError)
@@ -0,0 +1,80 @@
+# tests/test_cache.py
+"""PredictionCache: canonical keys, LRU/byte/TTL bounds, and invalidation on load_model."""
+from __future__ import annotations
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from joblib import dump
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from api.cache import PredictionCache, row_key  # noqa: E402
+
+COLS = ["age", "education"]
+NUM = {"age"}
+
+
+def test_row_key_is_canonical():
+    k = row_key({"age": 39, "education": "HS-grad"}, COLS, NUM)
+    assert k == row_key({"education": "HS-grad", "age": 39.0, "extra": 1}, COLS, NUM)
+    assert k == row_key({"age": "39", "education": "HS-grad"}, COLS, NUM)
+    assert k != row_key({"age": 40, "education": "HS-grad"}, COLS, NUM)
+    # 欠落・None・NaN は同じ欠損
+    missing = row_key({"education": "HS-grad"}, COLS, NUM)
+    assert missing == row_key({"age": None, "education": "HS-grad"}, COLS, NUM)
+    assert missing == row_key({"age": float("nan"), "education": "HS-grad"}, COLS, NUM)
+
+
+def test_lru_and_byte_bounds():
+    c = PredictionCache(max_entries=2)
+    c.put_many([(("m", b"a"), 1), (("m", b"b"), 2)])
+    assert c.get_many([("m", b"a")]) == [1]          # a を最近使用に
+    c.put_many([(("m", b"c"), 3)])                   # b が追い出される
+    assert c.get_many([("m", b"a"), ("m", b"b"), ("m", b"c")]) == [1, None, 3]
+    assert c.stats()["evictions"] == 1
+
+    c = PredictionCache(max_entries=100, max_bytes=1)
+    c.put_many([(("m", b"a"), 1)])
+    assert len(c) == 0 and c.bytes == 0
+
+
+def test_ttl_expires_entries():
+    c = PredictionCache(max_entries=10, ttl_sec=0.01)
+    c.put_many([(("m", b"a"), 1)])
+    time.sleep(0.02)
+    assert c.get_many([("m", b"a")]) == [None]
+    assert c.stats()["expirations"] == 1 and len(c) == 0
+
+
+def test_app_cache_hits_and_reload_invalidation(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from sklearn.linear_model import LogisticRegression
+    from api import app as A
+
+    X = pd.DataFrame({"a": np.arange(50, dtype=float), "b": np.arange(50, dtype=float) % 7})
+    y = (X["a"] > 25).astype(int)
+    path = tmp_path / "m.joblib"
+    dump(LogisticRegression().fit(X, y), path)
+
+    monkeypatch.setattr(A, "_cache", PredictionCache(max_entries=100))
+    A.load_model(str(path))
+    rows = X.head(5).to_dict(orient="records")
+
+    key, first = A._infer_cached(rows[:3])
+    key2, second = A._infer_cached(rows)
+    assert key == key2 == "pred_proba"
+    assert second[:3] == first
+    assert np.allclose(second, A._infer(rows)[1])
+    st = A._cache.stats()
+    assert st["hits"] == 3 and st["misses"] == 5
+
+    A.load_model(str(path))  # 差し替えで全破棄
+    assert len(A._cache) == 0
+    A._infer_cached(rows[:1])
+    assert A._cache.stats()["misses"] == 6
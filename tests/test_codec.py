@@ -0,0 +1,92 @@
+# tests/test_codec.py
+"""Fast JSON codec: rows/columns decoding, structural validation, ndarray response encoding."""
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from joblib import dump
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+for p in (REPO_ROOT, REPO_ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from api import codec  # noqa: E402
+
+COLS = ("age", "sex")
+
+
+def test_rows_and_columns_decode_to_same_buffers():
+    rows = [{"age": 30, "sex": "Male", "extra": 1}, {"sex": "Female"}]
+    a = codec.decode_batch(json.dumps({"rows": rows}).encode(), COLS, {"age"})
+    b = codec.decode_batch(json.dumps({"columns": {"age": [30, None], "sex": ["Male", "Female"]}}).encode(),
+                           COLS, {"age"})
+    assert a.n == b.n == 2
+    assert a.data == b.data == {"age": [30, None], "sex": ["Male", "Female"]}
+    assert a.to_rows() == [{"age": 30, "sex": "Male"}, {"age": None, "sex": "Female"}]
+
+
+@pytest.mark.parametrize("body", [
+    b"not json",
+    b'{"rows": {"age": 1}}',
+    b'{"rows": [1, 2]}',
+    b'{"columns": {"age": [1, 2], "sex": ["a"]}}',
+    b'{"rows": [{"age": {"nested": 1}}]}',
+    b'{"something": []}',
+])
+def test_invalid_payloads_are_rejected(body):
+    with pytest.raises(codec.PayloadError):
+        codec.decode_batch(body, COLS, {"age"})
+
+
+def test_nan_literals_still_accepted():
+    cols = codec.decode_batch(b'{"rows": [{"age": NaN, "sex": "Male"}]}', COLS, {"age"})
+    assert np.isnan(cols.data["age"][0])
+
+
+def test_encode_predictions_roundtrip():
+    arr = np.array([0.1, 1 / 3, 0.0])
+    assert json.loads(codec.encode_predictions("pred_proba", arr)) == {"pred_proba": arr.tolist()}
+    labels = np.array(["a", "b"], dtype=object)
+    assert json.loads(codec.encode_predictions("pred", labels)) == {"pred": ["a", "b"]}
+
+
+def test_predict_batch_accepts_rows_and_columns(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from fastapi.testclient import TestClient
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import Pipeline
+    import train
+    from api import app as A
+
+    rng = np.random.RandomState(0)
+    X = pd.DataFrame({"age": rng.randint(17, 90, 100).astype(float),
+                      "sex": rng.choice(["Male", "Female"], 100)})
+    pipe = Pipeline([("pre", train.build_preprocessor(X)), ("clf", LogisticRegression())])
+    dump(pipe.fit(X, (X["age"] > 40).astype(int)), tmp_path / "m.joblib")
+    A.load_model(str(tmp_path / "m.joblib"))
+    client = TestClient(A.app)
+
+    rows = X.head(5).to_dict(orient="records")
+    r1 = client.post("/predict_batch", json={"rows": rows})
+    r2 = client.post("/predict_batch", json={"columns": X.head(5).to_dict(orient="list")})
+    assert r1.status_code == r2.status_code == 200
+    assert r1.json() == r2.json()
+    np.testing.assert_allclose(r1.json()["pred_proba"], pipe.predict_proba(X.head(5))[:, 1])
+    assert client.post("/predict_batch", json={"rows": [1]}).status_code == 422
+    assert client.post("/predict", json={"features": [1]}).status_code == 422
+    assert client.post("/predict", json={"features": rows[0]}).json()["pred_proba"] == r1.json()["pred_proba"][0]
+
+
+def test_orjson_is_a_runtime_dependency_and_in_use():
+    # Dockerfile は `pip install .` だけなので、dependencies に無いと本番は標準 json に落ちる
+    tomllib = pytest.importorskip("tomllib")  # Python 3.11+
+    with open(REPO_ROOT / "pyproject.toml", "rb") as f:
+        deps = tomllib.load(f)["project"]["dependencies"]
+    assert any(d.split(">")[0].split("=")[0].strip() == "orjson" for d in deps)
+    assert codec.orjson is not None
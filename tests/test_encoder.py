@@ -0,0 +1,77 @@
+# tests/test_encoder.py
+"""
+Parity: the compiled request encoder (api/encoder.py) must reproduce
+pre.transform(_normalize_batch(rows)) exactly for the pipelines train.py builds.
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from joblib import dump
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+for p in (REPO_ROOT, REPO_ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+
+def _mixed_frame(n: int = 400, seed: int = 0) -> tuple[pd.DataFrame, pd.Series]:
+    rng = np.random.RandomState(seed)
+    df = pd.DataFrame({
+        "age": rng.randint(17, 90, n).astype(float),
+        "hours-per-week": rng.randint(1, 99, n).astype(float),
+        "education": rng.choice(["Bachelors", "HS-grad", "Masters"], n),
+        "sex": rng.choice(["Male", "Female"], n),
+    })
+    df.loc[rng.rand(n) < 0.1, "age"] = np.nan
+    df.loc[rng.rand(n) < 0.1, "education"] = np.nan
+    y = pd.Series((df["hours-per-week"] > 40).astype(int))
+    return df, y
+
+
+@pytest.fixture(params=["onehot", "native"])
+def app_with_model(request, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # api.app は import 時に logs/ を作る
+    from sklearn.pipeline import Pipeline
+    import train
+    from api import app as A
+
+    X, y = _mixed_frame()
+    pipe = Pipeline([("pre", train.build_preprocessor(X, request.param)),
+                     ("clf", train.build_classifier(X, request.param, seed=0).set_params(max_iter=20))]).fit(X, y)
+    path = tmp_path / "model.joblib"
+    dump(pipe, path)
+    A.load_model(str(path))
+    return A, X
+
+
+def test_encoder_matches_pre_transform(app_with_model):
+    A, X = app_with_model
+    assert A._snap.encoder is not None
+    pre = A._snap.model.named_steps["pre"]
+
+    rows = X.head(50).to_dict(orient="records")
+    rows += [
+        {},                                              # 全列欠落
+        {"age": "41", "sex": "Alien"},                   # 数値文字列・未知カテゴリ
+        {"age": "abc", "education": None, "extra": 1},   # 数値化不可・None・余計な列
+    ]
+    for batch in (rows, rows[:1], rows[-3:], rows[-1:]):
+        expected = pre.transform(A._normalize_batch(batch))
+        got = A._snap.encoder.transform(batch)
+        assert got.dtype == expected.dtype
+        np.testing.assert_array_equal(got, expected)
+        cols = {c: [r.get(c) for r in batch] for c in A._snap.required_cols}
+        np.testing.assert_array_equal(A._snap.encoder.transform_columns(cols, len(batch)), expected)
+
+
+def test_predict_rows_uses_encoder_path(app_with_model):
+    A, X = app_with_model
+    rows = X.head(20).to_dict(orient="records")
+    key, proba = A._infer(rows)
+    assert key == "pred_proba"
+    np.testing.assert_allclose(proba, A._snap.model.predict_proba(A._normalize_batch(rows))[:, 1])
@@ -0,0 +1,129 @@
+# tests/test_fetcher.py
+"""ModelFetcher: ranged parallel download, ETag skip, content-addressed cache, non-blocking app load."""
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from joblib import dump
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from api.fetcher import FileBackend, ModelFetcher, S3Backend  # noqa: E402
+
+
+class CountingBackend(FileBackend):
+    def __init__(self):
+        self.ranges = []
+
+    def get_range(self, uri, start, end, etag=None):
+        self.ranges.append((start, end))
+        return super().get_range(uri, start, end, etag)
+
+
+class FakeS3Client:
+    """head_object / get_object(Range, IfMatch) だけを持つ S3 の代役"""
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.calls = []
+
+    def _etag(self, key):
+        return '"%s"' % hashlib.md5(self.objects[key]).hexdigest()
+
+    def head_object(self, Bucket, Key):
+        return {"ETag": self._etag(Key), "ContentLength": len(self.objects[Key])}
+
+    def get_object(self, Bucket, Key, Range, IfMatch=None):
+        self.calls.append(Range)
+        assert IfMatch == self._etag(Key)
+        start, end = (int(x) for x in Range[len("bytes="):].split("-"))
+        return {"Body": io.BytesIO(self.objects[Key][start:end + 1])}
+
+
+def test_parallel_ranged_fetch_and_etag_skip(tmp_path):
+    src = tmp_path / "model.joblib"
+    payload = os.urandom(10_000)
+    src.write_bytes(payload)
+    backend = CountingBackend()
+    f = ModelFetcher(backend, str(tmp_path / "cache"), part_size=1024, max_workers=4)
+
+    res = f.fetch(str(src))
+    assert res.downloaded and len(backend.ranges) == 10
+    assert res.sha256 == hashlib.sha256(payload).hexdigest()
+    assert Path(res.path).name == res.sha256 + ".joblib"
+    assert Path(res.path).read_bytes() == payload
+
+    again = f.fetch(str(src))
+    assert not again.downloaded and again.path == res.path and len(backend.ranges) == 10
+
+    src.write_bytes(payload[::-1])
+    os.utime(src, ns=(time.time_ns(), time.time_ns() + 10**9))
+    changed = f.fetch(str(src))
+    assert changed.downloaded and changed.sha256 != res.sha256
+    assert not list((tmp_path / "cache").glob(".part-*"))
+
+
+def test_new_versions_prune_all_but_current_and_keep_previous(tmp_path):
+    src = tmp_path / "model.joblib"
+    cache = tmp_path / "cache"
+    f = ModelFetcher(FileBackend(), str(cache), keep=1)
+    paths = []
+    for i in range(4):
+        src.write_bytes(os.urandom(100))
+        os.utime(src, ns=(time.time_ns(), time.time_ns() + i * 10**9))
+        res = f.fetch(str(src))
+        Path(res.path + ".flat").write_bytes(b"x")
+        os.utime(res.path, (time.time() + i, time.time() + i))  # 取得順に新しく
+        paths.append(res.path)
+    f.fetch(str(src))  # ETag 一致では消さない
+    left = sorted(p.name for p in cache.iterdir() if p.name != "index.json")
+    assert left == sorted(Path(p).name + s for p in paths[2:] for s in ("", ".flat"))
+
+
+def test_s3_backend_uses_ranges_with_if_match(tmp_path):
+    payload = os.urandom(5000)
+    client = FakeS3Client({"models/m.joblib": payload})
+    f = ModelFetcher(S3Backend(client=client), str(tmp_path / "cache"), part_size=2048)
+    res = f.fetch("s3://bucket/models/m.joblib")
+    assert Path(res.path).read_bytes() == payload
+    assert sorted(client.calls) == ["bytes=0-2047", "bytes=2048-4095", "bytes=4096-4999"]
+    assert not f.fetch("s3://bucket/models/m.joblib").downloaded and len(client.calls) == 3
+
+
+def test_predict_returns_503_while_background_fetch_loads(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from fastapi import HTTPException
+    from sklearn.linear_model import LogisticRegression
+    from api import app as A
+
+    X = pd.DataFrame({"a": np.arange(40, dtype=float)})
+    remote = tmp_path / "remote" / "m.joblib"
+    remote.parent.mkdir()
+    dump(LogisticRegression().fit(X, (X["a"] > 20).astype(int)), remote)
+    local = tmp_path / "models" / "m.joblib"
+
+    monkeypatch.setattr(A, "_snap", None)
+    monkeypatch.setattr(A, "_fetcher", None)
+    monkeypatch.setattr(A, "_autoload", None)
+    monkeypatch.setattr(A, "MODEL_S3_URI", f"file://{remote}")
+    monkeypatch.setattr(A, "MODEL_PATH", str(local))
+    monkeypatch.setattr(A, "_MODEL_PATH_CONF", str(local))
+    monkeypatch.setattr(A, "MODEL_CACHE_DIR", str(tmp_path / "cache"))
+
+    with pytest.raises(HTTPException) as ei:
+        A._require_model()
+    assert ei.value.status_code == 503 and ei.value.headers["Retry-After"]
+    A._autoload.result(timeout=30)
+    assert A._snap is not None and A._reload_state["state"] == "ok"
+    assert os.path.realpath(local).startswith(str(tmp_path / "cache"))
+    A._require_model()  # ロード済みなら何もしない
@@ -0,0 +1,125 @@
+# tests/test_fit_cache.py
+"""Managed Pipeline(memory=...) cache: fingerprinted namespaces, LRU byte budget, per-run hit stats."""
+from __future__ import annotations
+
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+for p in (REPO_ROOT, REPO_ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from cache import ManagedMemory, evict  # noqa: E402
+
+
+def _pipe(memory):
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+    return Pipeline([("sc", StandardScaler()), ("clf", LogisticRegression())], memory=memory)
+
+
+def _data(n=200, seed=0):
+    rng = np.random.RandomState(seed)
+    X = pd.DataFrame({"a": rng.normal(size=n), "b": rng.normal(size=n)})
+    return X, (X["a"] > 0).astype(int)
+
+
+def test_hits_are_counted_and_stale_namespaces_dropped(tmp_path):
+    root = str(tmp_path / "cache")
+    os.makedirs(os.path.join(root, "joblib"))          # 旧 Memory("cache") の置き場
+    os.makedirs(os.path.join(root, "train-000000000000"))
+    os.makedirs(os.path.join(root, "smoke-000000000000"))
+
+    X, y = _data()
+    mem = ManagedMemory("train", code=["v1"], root=root)
+    mem.prepare()
+    assert sorted(os.listdir(root)) == sorted(["smoke-000000000000", "locks", "stats", mem.namespace])
+    _pipe(mem).fit(X, y)
+    _pipe(mem).fit(X, y)
+    s = mem.finish()
+    assert (s["calls"], s["hits"], s["hit_ratio"]) == (2, 1, 0.5)
+    assert s["hit_bytes"] > 0 and s["stored_bytes"] > 0 and s["disk_bytes"] > 0
+
+    # コードが変わると別の名前空間になり、古い方は次の prepare で消える
+    mem2 = ManagedMemory("train", code=["v2"], root=root)
+    assert mem2.namespace != mem.namespace
+    assert mem2.prepare()["stale_removed_bytes"] > 0
+    assert not os.path.exists(os.path.join(root, mem.namespace))
+
+
+def test_namespaces_of_live_runs_are_kept_and_crash_leftovers_removed(tmp_path):
+    import subprocess
+    root = str(tmp_path / "cache")
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    os.makedirs(os.path.join(root, "locks"))
+    os.makedirs(os.path.join(root, "stats"))
+    os.makedirs(os.path.join(root, "train-crashed000"))
+    for d, fn in (("locks", f"train-crashed000.{dead.pid}"), ("stats", f"abc.{dead.pid}.jsonl")):
+        open(os.path.join(root, d, fn), "w").close()
+
+    X, y = _data()
+    a = ManagedMemory("train", code=["v1"], root=root)   # 別チェックアウトの run が同時に走っている
+    a.prepare()
+    b = ManagedMemory("train", code=["v2"], root=root)
+    b.prepare()
+    assert os.path.isdir(os.path.join(root, a.namespace))
+    assert not os.path.exists(os.path.join(root, "train-crashed000"))
+    assert os.listdir(os.path.join(root, "stats")) == []  # 落ちた run の stats は消える
+    _pipe(a).fit(X, y)
+    a.finish()
+    ManagedMemory("train", code=["v3"], root=root).prepare()  # 終わった a の名前空間は消え、走っている b は残る
+    assert not os.path.exists(os.path.join(root, a.namespace))
+    assert os.path.isdir(os.path.join(root, b.namespace))
+
+
+def test_stats_survive_worker_processes(tmp_path):
+    from sklearn.model_selection import cross_val_score
+
+    X, y = _data()
+    mem = ManagedMemory("train", code=["v1"], root=str(tmp_path / "cache"))
+    mem.prepare()
+    for _ in range(2):
+        cross_val_score(_pipe(mem), X, y, cv=2, n_jobs=2)
+    s = mem.finish()
+    assert (s["calls"], s["hits"]) == (4, 2)
+
+
+def test_each_call_hashes_arguments_once_and_misses_are_not_reloaded(tmp_path, monkeypatch):
+    import joblib.hashing
+    import joblib.memory
+
+    hashes, gets = [], []
+    real_hash, real_get = joblib.hashing.hash, joblib.memory.MemorizedResult.get
+    monkeypatch.setattr(joblib.hashing, "hash", lambda obj, *a, **k: hashes.append(1) or real_hash(obj, *a, **k))
+    monkeypatch.setattr(joblib.memory.MemorizedResult, "get", lambda self: gets.append(1) or real_get(self))
+
+    X, y = _data()
+    mem = ManagedMemory("train", code=["v1"], root=str(tmp_path / "cache"))
+    mem.prepare()
+    _pipe(mem).fit(X, y)                               # 外れ: 計算した値をそのまま使う
+    assert (len(hashes), len(gets)) == (1, 0)
+    _pipe(mem).fit(X, y)                               # 当たり: 読むのは 1 回
+    assert (len(hashes), len(gets)) == (2, 1)
+    s = mem.finish()
+    assert (s["calls"], s["hits"]) == (2, 1) and s["hash_sec"] > 0 and s["compute_sec"] > 0
+
+
+def test_evict_drops_least_recently_used_first(tmp_path):
+    root = tmp_path / "cache"
+    now = time.time()
+    for i, name in enumerate(["old", "mid", "new"]):
+        d = root / "ns" / "joblib" / "f" / name
+        d.mkdir(parents=True)
+        (d / "output.pkl").write_bytes(b"x" * 1000)
+        os.utime(d / "output.pkl", (now - 100 + i * 10, now))
+    r = evict(str(root), 2500)
+    assert (r["evicted_items"], r["evicted_bytes"], r["disk_bytes"]) == (1, 1000, 2000)
+    assert sorted(os.listdir(root / "ns" / "joblib" / "f")) == ["mid", "new"]
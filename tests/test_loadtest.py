@@ -0,0 +1,57 @@
+# tests/test_loadtest.py
+"""Load-test harness helpers: request bodies, latency summary, side-by-side comparison."""
+from __future__ import annotations
+
+import importlib.util
+import json
+import math
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+_spec = importlib.util.spec_from_file_location("loadtest", REPO_ROOT / "scripts" / "loadtest.py")
+loadtest = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(loadtest)
+
+
+def test_bodies_are_prebuilt_json_with_nan_as_null():
+    X = pd.DataFrame({"age": [30.0, np.nan, 50.0], "sex": ["Male", "Female", None]})
+    rows = loadtest.sample_rows(X, 5)
+    assert len(rows) == 5 and any(r["age"] is None for r in rows)
+    bodies, ctype, n = loadtest.build_bodies(rows, "predict_batch", batch=4, stream_rows=10, pool=3)
+    assert (ctype, n, len(bodies)) == ("application/json", 4, 3)
+    assert len(json.loads(bodies[0])["rows"]) == 4
+    bodies, ctype, n = loadtest.build_bodies(rows, "predict_stream", batch=4, stream_rows=10)
+    assert ctype == "application/x-ndjson" and n == 10
+    assert [json.loads(line) for line in bodies[0].decode().splitlines()][0].keys() == {"age", "sex"}
+
+
+def test_summary_percentiles_and_error_rate():
+    rec = loadtest.Recorder()
+    for i in range(1, 101):
+        rec.add(i / 1000.0, 200)
+    rec.add(0.5, 429)
+    rec.add(0.0, None, "ConnectError")
+    s = rec.summary(elapsed=2.0, rows_per_request=8)
+    assert s["requests"] == 102 and s["ok"] == 100
+    assert math.isclose(s["error_rate"], 2 / 102, abs_tol=1e-5)
+    assert s["status"] == {"200": 100, "429": 1} and s["errors"] == {"ConnectError": 1}
+    assert math.isclose(s["p50_ms"], 50.5) and s["p99_ms"] <= s["p99.9_ms"] <= s["max_ms"] == 100.0
+    assert s["achieved_rps"] == 51.0 and s["ok_rows_per_sec"] == 400.0
+    assert loadtest.Recorder().summary(1.0, 1)["p99_ms"] is None
+
+
+def test_compare_prints_runs_side_by_side(tmp_path, capsys):
+    paths = []
+    for name, mode, p99 in (("a", "closed", 12.5), ("b", "open", 30.0)):
+        doc = {"config": {"endpoint": "predict", "mode": mode, "concurrency": 8, "rps": 40.0, "poisson": False,
+                          "batch": 32, "stream_rows": 1000},
+               "result": {"achieved_rps": 100.0, "p99_ms": p99}, "git_sha": "abc1234"}
+        (tmp_path / f"{name}.json").write_text(json.dumps(doc))
+        paths.append(str(tmp_path / f"{name}.json"))
+    assert loadtest.main(["--compare", *paths]) == 0
+    out = capsys.readouterr().out
+    assert "| load | c=8 | 40 rps |" in out
+    assert "| p99_ms | 12.5 | 30.0 |" in out
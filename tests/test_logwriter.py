@@ -0,0 +1,94 @@
+# tests/test_logwriter.py
+"""AsyncLogWriter: background batched writes, drop counting, daily file switch; sampler rules."""
+from __future__ import annotations
+
+import io
+import json
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from api import logwriter  # noqa: E402
+from api.logwriter import AccessLogSampler, AsyncLogWriter  # noqa: E402
+
+
+def test_records_are_written_in_background(tmp_path):
+    out = io.StringIO()
+    w = AsyncLogWriter(str(tmp_path), "api", stdout=out, flush_interval=0.01)
+    for i in range(100):
+        assert w.submit({"i": i, "msg": "日本語"})
+    w.close()
+    files = list(tmp_path.glob("api-*.log"))
+    assert len(files) == 1
+    lines = files[0].read_text(encoding="utf-8").splitlines()
+    assert [json.loads(x)["i"] for x in lines] == list(range(100))
+    assert "日本語" in lines[0] and out.getvalue().count("\n") == 100
+    assert w.stats()["written"] == 100 and w.stats()["dropped"] == 0
+
+
+def test_full_queue_drops_and_counts(tmp_path):
+    w = AsyncLogWriter(str(tmp_path), "api", stdout=None, max_queue=5)
+    w._ensure_started = lambda: None  # ライターを止めたままキューを溢れさせる
+    results = [w.submit({"i": i}) for i in range(8)]
+    assert results.count(False) == 3 and w.dropped == 3
+
+
+def test_file_switches_when_day_changes(tmp_path, monkeypatch):
+    days = iter(["20250101", "20250102"])
+
+    class FakeDatetime:
+        @staticmethod
+        def now():
+            class _D:
+                def strftime(self, fmt, _d=next(days)):
+                    return _d
+            return _D()
+
+    monkeypatch.setattr(logwriter, "datetime", FakeDatetime)
+    w = AsyncLogWriter(str(tmp_path), "api", stdout=None)
+    w._write([{"a": 1}])
+    w._write([{"a": 2}])
+    assert (tmp_path / "api-20250101.log").read_text().strip() == '{"a": 1}'
+    assert (tmp_path / "api-20250102.log").read_text().strip() == '{"a": 2}'
+
+
+def test_sampler_keeps_errors_and_slow_requests():
+    s = AccessLogSampler(rate=0.0, health_rate=0.01, slow_ms=500, health_paths=("/healthz",))
+    assert s.rate_for("/predict", 500, 1) == 1.0
+    assert s.rate_for("/predict", 200, 800) == 1.0
+    assert s.rate_for("/predict", 200, 5) == 0.0
+    assert s.rate_for("/healthz", 200, 5) == 0.01
+    assert not s.keep(0.0) and s.keep(1.0)
+
+
+def test_atexit_is_registered_once_across_restarts(tmp_path, monkeypatch):
+    registered = []
+    monkeypatch.setattr(logwriter.atexit, "register", registered.append)
+    w = AsyncLogWriter(str(tmp_path), "api", stdout=None, flush_interval=0.01)
+    for _ in range(3):  # fork 後と同じく、スレッドを失ってから再起動させる
+        w.submit({"i": 1})
+        w.close()
+        w._after_fork()
+    assert registered == [w.close]
+
+
+def test_failed_writes_and_unserializable_records_are_not_counted_as_written(tmp_path, monkeypatch):
+    w = AsyncLogWriter(str(tmp_path), "api", stdout=None)
+
+    class Bad:
+        def __str__(self):
+            raise ValueError("no repr")
+
+    w._write([{"a": 1}, {"b": Bad()}])
+    assert (w.written, w.unserializable, w.failed, w.errors) == (1, 1, 0, 0)
+
+    def broken():
+        raise OSError("disk full")
+
+    monkeypatch.setattr(w, "_current_file", broken)
+    w._write([{"a": 2}, {"a": 3}])
+    st = w.stats()
+    assert (st["written"], st["failed"], st["errors"], st["unserializable"]) == (1, 2, 1, 1)
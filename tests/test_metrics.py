@@ -0,0 +1,76 @@
+# tests/test_metrics.py
+"""Sharded Prometheus metrics and the /metrics exposition of the app."""
+from __future__ import annotations
+
+import sys
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from joblib import dump
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+for p in (REPO_ROOT, REPO_ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from api.metrics import Counter, Histogram, Registry  # noqa: E402
+
+
+def test_sharded_counter_and_histogram_sum_across_threads():
+    reg = Registry()
+    c = Counter("t_total", "t", ["k"], registry=reg)
+    h = Histogram("t_seconds", "t", buckets=(0.1, 1.0), registry=reg)
+
+    def work():
+        for _ in range(1000):
+            c.labels(k="a").inc()
+            h.observe(0.5)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    text = reg.render()
+    assert 't_total{k="a"} 4000' in text
+    assert 't_seconds_bucket{le="0.1"} 0' in text
+    assert 't_seconds_bucket{le="1"} 4000' in text
+    assert 't_seconds_bucket{le="+Inf"} 4000' in text
+    assert "t_seconds_sum 2000" in text and "# TYPE t_seconds histogram" in text
+
+
+def test_app_metrics_exposition(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from fastapi.testclient import TestClient
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    from sklearn.pipeline import Pipeline
+    import train
+    from api import app as A
+
+    rng = np.random.RandomState(0)
+    X = pd.DataFrame({"age": rng.randint(17, 90, 200).astype(float),
+                      "sex": rng.choice(["Male", "Female"], 200)})
+    pipe = Pipeline([("pre", train.build_preprocessor(X)),
+                     ("clf", HistGradientBoostingClassifier(max_iter=5))]).fit(X, (X["age"] > 40).astype(int))
+    dump(pipe, tmp_path / "m.joblib")
+    A.load_model(str(tmp_path / "m.joblib"))
+
+    client = TestClient(A.app)
+    for _ in range(3):
+        assert client.post("/predict", json={"features": {"age": 30, "sex": "Male"}}).status_code == 200
+    r = client.get("/metrics")
+    assert r.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = r.text
+    assert 'app_request_duration_seconds_count{route="/predict",method="POST",status="200"}' in text
+    assert 'app_inference_stage_seconds_count{stage="preprocess"}' in text
+    assert 'app_inference_stage_seconds_count{stage="classify"}' in text
+    # the default compiled-encoder path still observes a normalize span
+    assert A._snap.encoder is not None
+    counts = {ln.split('"')[1]: float(ln.rsplit(" ", 1)[1]) for ln in text.splitlines()
+              if ln.startswith("app_inference_stage_seconds_count{")}
+    assert counts["normalize"] == counts["preprocess"] == counts["classify"] > 0
+    assert "app_inference_batch_rows_bucket" in text and "app_model_load_seconds_count" in text
+    assert "app_requests_in_flight 1" in text  # /metrics 自身
+    assert "process_resident_memory_bytes" in text
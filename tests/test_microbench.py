@@ -0,0 +1,52 @@
+# tests/test_microbench.py
+"""Microbenchmark suite: timing helper, baseline comparison, env metadata and exit code on regression."""
+from __future__ import annotations
+
+import importlib.util
+import json
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+for p in (REPO_ROOT, REPO_ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+_spec = importlib.util.spec_from_file_location("microbench", REPO_ROOT / "scripts" / "microbench.py")
+microbench = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(microbench)
+
+
+def test_compare_flags_only_slowdowns_beyond_tolerance():
+    base = {"a": {"min_us": 100.0}, "b": {"min_us": 100.0}, "c": {"min_us": 0.5}, "gone": {"min_us": 1.0}}
+    cur = {"a": {"min_us": 125.0}, "b": {"min_us": 140.0}, "c": {"min_us": 1.0}, "new": {"min_us": 9.0}}
+    rows = {r["case"]: r for r in microbench.compare(cur, base, tolerance=0.3)}
+    assert set(rows) == {"a", "b", "c"}
+    assert not rows["a"]["regression"] and rows["b"]["regression"]
+    assert not rows["c"]["regression"]  # 2 倍でも差が 1us 未満はノイズ扱い
+
+
+def test_time_call_reports_per_call_time():
+    r = microbench.time_call(lambda: sum(range(1000)), repeat=3, min_time=0.03)
+    assert r["repeat"] == 3 and r["loops"] > 1
+    assert 0 < r["min_us"] <= r["median_us"] < 10_000
+
+
+def test_baseline_roundtrip_and_regression_exit_code(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    import train
+    meta = train.env_metadata()
+    assert {"git_commit", "python", "sklearn", "pandas"} <= set(meta)
+
+    args = ["--datasets", "synthetic", "--sizes", "100", "--only", "best_threshold,extract_columns",
+            "--repeat", "2", "--min-time", "0.02"]
+    assert microbench.main(args + ["--save-baseline"]) == 0
+    base = json.loads((tmp_path / "artifacts" / "microbench_baseline.json").read_text())
+    assert set(base["results"]) == {"best_threshold/synthetic/100", "extract_columns/synthetic/-"}
+    assert base["env"]["sklearn"] == meta["sklearn"]
+
+    for r in base["results"].values():  # 基準を実測の 1/100 にして劣化を起こす
+        r["min_us"] /= 100
+    (tmp_path / "artifacts" / "microbench_baseline.json").write_text(json.dumps(base))
+    assert microbench.main(args + ["--out", "run.json"]) == 1
+    cmp = json.loads((tmp_path / "run.json").read_text())["comparison"]
+    assert any(c["regression"] for c in cmp["cases"])
@@ -0,0 +1,80 @@
+# tests/test_ooc.py
+"""Chunked local-CSV training: stratified holdout, one-pass preprocessing stats, memory-bounded refit."""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+for p in (REPO_ROOT, REPO_ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+import ooc  # noqa: E402
+
+
+def _csv(tmp_path, n=3000, seed=0):
+    rng = np.random.RandomState(seed)
+    df = pd.DataFrame({"age": rng.randint(17, 90, n).astype(float),
+                       "hours": rng.normal(40, 10, n),
+                       "sex": rng.choice(["Male", "Female"], n),
+                       "country": rng.choice(["US", "Mexico", "Japan"] + [f"c{i}" for i in range(30)], n)})
+    df.loc[rng.rand(n) < 0.1, "hours"] = np.nan
+    df.loc[rng.rand(n) < 0.05, "country"] = np.nan
+    df["target"] = ((df["age"] > 45) ^ (rng.rand(n) < 0.2)).astype(int)
+    path = tmp_path / "train.csv"
+    df.to_csv(path, index=False)
+    return str(path), df
+
+
+def test_holdout_is_stratified_and_independent_of_chunksize(tmp_path):
+    path, df = _csv(tmp_path)
+    masks = []
+    for chunksize in (500, 777):
+        s = ooc._Splitter(seed=42)
+        masks.append(np.concatenate([s.split(y)[0] for _, y in ooc._Reader(path, chunksize)]))
+    assert (masks[0] == masks[1]).all()
+    for c, n in df["target"].value_counts().items():
+        assert abs(masks[0][df["target"].to_numpy() == c].sum() - n * ooc.TEST_SIZE) <= 1
+
+
+@pytest.mark.parametrize("encoding", ["onehot", "native"])
+def test_streamed_preprocessor_matches_fit_on_training_rows(tmp_path, encoding):
+    import train
+
+    path, df = _csv(tmp_path)
+    reader = ooc._Reader(path, 400)
+    stats = ooc.scan(reader, seed=42, sample_rows=200)
+    assert len(stats["sample_X"]) == 200 and stats["n_train"] + 600 == len(df)
+    pre = ooc.streamed_preprocessor(stats, reader, encoding)
+
+    s = ooc._Splitter(seed=42)
+    hold = np.concatenate([s.split(y)[0] for _, y in ooc._Reader(path, 400)])
+    Xtr = pd.read_csv(path, dtype={"sex": "str", "country": "str"}).drop(columns=["target"])[~hold]
+    ref = train.build_preprocessor(Xtr, encoding).fit(Xtr)
+    np.testing.assert_allclose(pre.transform(Xtr), ref.transform(Xtr), atol=1e-6)
+
+
+def test_reservoir_keeps_smallest_keys_across_chunks():
+    rng = np.random.RandomState(1)
+    df = pd.DataFrame({"n": np.arange(500), "s": pd.array([f"v{i}" for i in range(500)], dtype="str")})
+    y, u = np.arange(500) % 2, rng.rand(500)
+    res = ooc._Reservoir(60)
+    for lo in range(0, 500, 70):
+        res.add(df.iloc[lo:lo + 70], y[lo:lo + 70], u[lo:lo + 70])
+    X, ys = res.result()
+    expect = np.sort(np.argsort(u)[:60])
+    assert (X.index.to_numpy() == expect).all() and (ys.to_numpy() == y[expect]).all()
+    assert (X["n"].to_numpy() == expect).all() and X["s"].dtype == df["s"].dtype
+    assert X["s"].tolist() == [f"v{i}" for i in expect]
+
+
+def test_refit_budget_caps_rows():
+    b = ooc.refit_budget(n_train=1_000_000, n_features=20, memory_mb=10)
+    assert b["refit_rows"] == 10 * 2**20 // (20 * 13 + 32)
+    assert 0 < b["refit_frac"] < 1
+    assert ooc.refit_budget(n_train=100, n_features=20, memory_mb=10)["refit_frac"] == 1.0
@@ -0,0 +1,65 @@
+# tests/test_orchestrate.py
+"""Training orchestrator: job parsing, cost-proportional core allocation, concurrent runs with rusage."""
+from __future__ import annotations
+
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+for p in (REPO_ROOT, REPO_ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+import orchestrate  # noqa: E402
+
+
+def test_parse_jobs_rejects_bad_and_duplicate_entries():
+    jobs = orchestrate.parse_jobs("adult:full, credit-g")
+    assert [(j.dataset, j.mode) for j in jobs] == [("adult", "full"), ("credit-g", "fast")]
+    with pytest.raises(ValueError):
+        orchestrate.parse_jobs("adult:slow")
+    with pytest.raises(ValueError):
+        orchestrate.parse_jobs("adult:fast,adult:full")
+
+
+def test_allocation_follows_cost_with_floor_and_caps():
+    assert orchestrate.allocate([3.0, 1.0], 8) == [6, 2]
+    assert orchestrate.allocate([100.0, 1.0], 8) == [7, 1]  # 最低 1 コア
+    assert orchestrate.allocate([100.0, 1.0], 8, caps=[3, 27]) == [3, 5]  # 使い切れない分は他へ
+    assert orchestrate.allocate([1.0, 1.0, 1.0], 2) == [1, 1, 1]  # コア不足でも全ジョブ走らせる
+    assert sum(orchestrate.allocate([5.0, 3.0, 2.0], 16)) == 16
+    # 行数・分割数が多いほど重い
+    small = orchestrate.estimate_cost(455, 30, 27, 3, 2, min_resources=120)
+    big = orchestrate.estimate_cost(39073, 14, 27, 5, 3)
+    assert big > 10 * small
+
+
+def test_run_all_reports_wall_and_cpu_including_grandchildren(tmp_path):
+    burn = ("import multiprocessing as mp, time\n"
+            "def spin():\n"
+            "    t = time.process_time()\n"
+            "    while time.process_time() - t < 0.3: pass\n"
+            "if __name__ == '__main__':\n"
+            "    p = mp.get_context('fork').Process(target=spin); p.start(); spin(); p.join()\n")
+    cmds = {"burn": [sys.executable, "-c", burn], "fail": [sys.executable, "-c", "import sys; sys.exit(3)"]}
+    logs = {k: str(tmp_path / f"{k}.log") for k in cmds}
+    t0 = time.perf_counter()
+    out = orchestrate.run_all(cmds, {k: {} for k in cmds}, logs)
+    assert time.perf_counter() - t0 < 10
+    assert out["fail"]["returncode"] == 3
+    burn_res = out["burn"]
+    assert burn_res["returncode"] == 0
+    assert burn_res["cpu_user_sec"] + burn_res["cpu_sys_sec"] >= 0.5  # 子プロセスの 0.3s も数える
+    assert burn_res["wall_sec"] > 0 and burn_res["max_rss_mb"] > 0
+
+
+def test_run_all_reaps_only_its_own_jobs(tmp_path):
+    import subprocess
+    other = subprocess.Popen([sys.executable, "-c", "import sys; sys.exit(7)"])
+    cmds = {"slow": [sys.executable, "-c", "import time; time.sleep(0.5)"]}
+    out = orchestrate.run_all(cmds, {"slow": {}}, {"slow": str(tmp_path / "slow.log")})
+    assert out["slow"]["returncode"] == 0
+    assert other.wait(timeout=10) == 7  # 起動していない子の終了状態は横取りしない
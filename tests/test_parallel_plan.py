@@ -0,0 +1,76 @@
+# tests/test_parallel_plan.py
+"""Nested-parallelism planner: worker/thread split per halving iteration, recorded plan and utilisation."""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+for p in (REPO_ROOT, REPO_ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+import parallel_plan  # noqa: E402
+from parallel_plan import plan_iteration  # noqa: E402
+
+
+def test_plan_moves_cores_from_workers_to_threads_as_candidates_shrink(monkeypatch):
+    monkeypatch.setattr(parallel_plan, "MIN_ROWS_PER_THREAD", 5000)
+    assert plan_iteration(8, 81, 200) == (8, 1)            # 序盤: 候補が多い → worker を埋める
+    assert plan_iteration(8, 9, 100_000) == (5, 1)         # 2 波なら 5 worker で十分（最後の波の空きを減らす）
+    assert plan_iteration(8, 3, 100_000) == (3, 2)         # 終盤: 余ったコアをスレッドへ
+    assert plan_iteration(8, 1, 100_000) == (1, 8)         # refit
+    assert plan_iteration(8, 1, 12_000) == (1, 2)          # 行が少ないとスレッドを増やさない
+    assert plan_iteration(1, 27, 10) == (1, 1)
+    for cores, tasks, rows in ((16, 5, 10**6), (6, 4, 10**6), (3, 100, 10)):
+        outer, inner = plan_iteration(cores, tasks, rows)
+        assert outer * inner <= cores and outer <= tasks
+
+
+def test_limited_call_sets_worker_threads_once(monkeypatch):
+    from threadpoolctl import threadpool_info, threadpool_limits
+    monkeypatch.setattr(parallel_plan, "_worker_threads", None)
+    calls = []
+    limited = parallel_plan._Limited(lambda: calls.append(1) or len(calls), 1)
+    with threadpool_limits(limits=None):  # 抜けるときにこのプロセスのスレッド数を戻す
+        assert limited() == 1 and limited() == 2
+        assert parallel_plan._worker_threads == 1
+        assert all(i["num_threads"] == 1 for i in threadpool_info() if i["user_api"] == "openmp")
+
+
+def test_planned_search_records_plan_per_iteration():
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    from sklearn.model_selection import StratifiedKFold
+
+    rng = np.random.RandomState(0)
+    X = rng.normal(size=(600, 5))
+    y = (X[:, 0] + rng.normal(scale=0.5, size=600) > 0).astype(int)
+    search = parallel_plan.PlannedHalvingGridSearchCV(
+        HistGradientBoostingClassifier(max_iter=20, random_state=0),
+        {"max_depth": [2, 3, 4, None], "learning_rate": [0.1, 0.3]},
+        cv=StratifiedKFold(3, shuffle=True, random_state=0), factor=2, n_jobs=2, scoring="roc_auc",
+    ).fit(X, y)
+    plan = search.parallel_plan_
+    its = plan["iterations"]
+    assert plan["cores"] == 2 and len(its) == search.n_iterations_
+    assert [it["candidates"] for it in its] == list(search.n_candidates_)
+    assert all(it["outer"] * it["inner"] <= 2 and it["wall_sec"] > 0 for it in its)
+    assert plan["refit"]["threads"] == 1 and plan["core_util"] > 0
+    assert search.best_score_ > 0.8
+
+
+def test_unverified_joblib_falls_back_to_fixed_plan(monkeypatch):
+    import pytest
+    from sklearn.linear_model import LogisticRegression
+
+    monkeypatch.setattr(parallel_plan.joblib, "__version__", "9.9.0")
+    rng = np.random.RandomState(0)
+    X = rng.normal(size=(200, 3))
+    y = (X[:, 0] > 0).astype(int)
+    search = parallel_plan.PlannedHalvingGridSearchCV(LogisticRegression(), {"C": [0.1, 1.0]}, cv=2, n_jobs=1)
+    with pytest.warns(RuntimeWarning, match="fixed plan"):
+        search.fit(X, y)
+    assert search.parallel_plan_["mode"] == "fixed" and "9.9.0" in search.parallel_plan_["fallback"]
+    assert search.best_score_ > 0.8
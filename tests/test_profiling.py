@@ -0,0 +1,83 @@
+# tests/test_profiling.py
+"""Runtime-toggled request profiling: stage marks, aggregation, slowest-N traces, /debug/profile."""
+from __future__ import annotations
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from joblib import dump
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+for p in (REPO_ROOT, REPO_ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from api import profiling  # noqa: E402
+from api.profiling import Profiler  # noqa: E402
+
+
+def test_disabled_profiler_records_nothing():
+    prof = Profiler(0.0)
+    assert prof.start() is None
+    profiling.mark("decode")  # トレース外では何もしない
+    assert profiling.current() is None
+    assert prof.report()["routes"] == {} and not prof.report()["enabled"]
+
+
+def test_stage_aggregation_and_slowest_traces():
+    prof = Profiler(1.0, top_n=2)
+    for delay in (0.0, 0.02, 0.01):
+        started = prof.start()
+        junk = [object() for _ in range(1000)]
+        profiling.mark("decode")
+        time.sleep(delay)
+        profiling.mark("classify")
+        prof.finish(started, "POST /predict", 200)
+        del junk
+    assert profiling.current() is None
+    rep = prof.report()
+    r = rep["routes"]["POST /predict"]
+    assert r["requests"] == 3
+    assert set(r["stages"]) == {"decode", "classify", "respond"}
+    assert r["stages"]["decode"]["mean_alloc_blocks"] > 900  # 1000 個のオブジェクト分（前後の解放で多少ぶれる）
+    assert abs(sum(s["share"] for s in r["stages"].values()) - 1.0) < 1e-3
+    assert [t["stages"][1]["ms"] >= 10 for t in rep["slowest"]] == [True, True]
+    assert rep["slowest"][0]["total_ms"] >= rep["slowest"][1]["total_ms"]
+
+
+def test_debug_profile_endpoint(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from fastapi.testclient import TestClient
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import Pipeline
+    import train
+    from api import app as A
+
+    rng = np.random.RandomState(0)
+    X = pd.DataFrame({"age": rng.randint(17, 90, 200).astype(float),
+                      "sex": rng.choice(["Male", "Female"], 200)})
+    pipe = Pipeline([("pre", train.build_preprocessor(X)),
+                     ("clf", LogisticRegression())]).fit(X, (X["age"] > 40).astype(int))
+    dump(pipe, tmp_path / "m.joblib")
+    A.load_model(str(tmp_path / "m.joblib"))
+
+    client = TestClient(A.app)
+    assert client.post("/debug/profile", params={"sample_rate": 1, "top": 3}).json()["enabled"]
+    try:
+        for _ in range(5):
+            assert client.post("/predict", json={"features": {"age": 30, "sex": "Male"}}).status_code == 200
+        assert client.post("/predict_batch", json={"rows": [{"age": 50}] * 10}).status_code == 200
+        rep = client.get("/debug/profile").json()
+        single = rep["routes"]["POST /predict"]
+        assert single["requests"] == 5
+        assert {"decode", "queue", "preprocess", "classify", "respond"} <= set(single["stages"])
+        assert {"decode", "encode"} <= set(rep["routes"]["POST /predict_batch"]["stages"])
+        assert len(rep["slowest"]) == 3
+    finally:
+        stopped = client.delete("/debug/profile").json()
+    assert stopped["routes"]
+    after = client.get("/debug/profile").json()
+    assert not after["enabled"] and after["routes"] == {} and after["slowest"] == []
@@ -0,0 +1,110 @@
+# tests/test_registry.py
+"""ModelRegistry: lazy load, LRU eviction under a memory budget, and /models/{name}/... routes."""
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from joblib import dump
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+for p in (REPO_ROOT, REPO_ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from api.registry import ModelRegistry, estimate_bytes  # noqa: E402
+
+
+def test_lazy_load_and_lru_eviction():
+    loads = []
+
+    def loader(path):
+        loads.append(path)
+        return np.zeros(1000)  # 8000 bytes
+
+    reg = ModelRegistry(loader, lambda n: None if n.startswith(("missing", "nope")) else f"/m/{n}", memory_budget=20_000)
+    a = reg.get("a")
+    assert reg.get("a") is a and loads == ["/m/a"]
+    reg.get("b")
+    reg.get("a")            # a を最近使用に
+    reg.get("c")            # 予算 20000 を超えるので LRU の b が落ちる
+    assert reg.loaded() == ["a", "c"] and reg.evictions == 1
+    st = reg.stats()
+    assert st["models"]["a"]["hits"] == 2 and st["models"]["a"]["misses"] == 1
+    assert st["resident_bytes"] == 2 * estimate_bytes(np.zeros(1000))
+
+    try:
+        reg.get("missing")
+    except KeyError:
+        pass
+    else:
+        raise AssertionError("unknown model must raise KeyError")
+    try:
+        reg.get("../etc")
+    except KeyError:
+        pass
+    else:
+        raise AssertionError("path-like names must be rejected")
+    for i in range(100):  # 存在しない名前では名前ごとのロックを作らない
+        try:
+            reg.get(f"nope{i}" if i % 2 else "missing")
+        except KeyError:
+            pass
+    assert set(reg._name_locks) == {"a", "b", "c"}
+
+
+def test_concurrent_first_use_loads_once():
+    calls = []
+
+    def loader(path):
+        calls.append(path)
+        time.sleep(0.05)
+        return object()
+
+    reg = ModelRegistry(loader, lambda n: n)
+    out = []
+    threads = [threading.Thread(target=lambda: out.append(reg.get("x"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1 and len({id(o) for o in out}) == 1
+
+
+def test_models_routes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from fastapi.testclient import TestClient
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import Pipeline
+    import train
+    from api import app as A
+
+    rng = np.random.RandomState(0)
+    X = pd.DataFrame({"age": rng.randint(17, 90, 100).astype(float),
+                      "sex": rng.choice(["Male", "Female"], 100)})
+    y = (X["age"] > 40).astype(int)
+    models = tmp_path / "models"
+    models.mkdir()
+    pipe = Pipeline([("pre", train.build_preprocessor(X)), ("clf", LogisticRegression())]).fit(X, y)
+    dump(pipe, models / "model_alpha.joblib")
+
+    monkeypatch.setattr(A, "MODELS_DIR", str(models))
+    monkeypatch.setattr(A, "_registry", ModelRegistry(lambda p: A._build_snapshot(p, next(A._load_seq)),
+                                                      A._resolve_model_name))
+    client = TestClient(A.app)
+
+    assert [m["name"] for m in client.get("/models").json()["models"]] == ["alpha"]
+    assert client.get("/models/alpha/schema").json()["numeric_columns"] == ["age"]
+    r = client.post("/models/alpha/predict", json={"features": {"age": 70, "sex": "Male"}})
+    assert r.status_code == 200 and r.json()["pred_proba"] > 0.5
+    r = client.post("/models/alpha/predict_batch", json={"rows": [{"age": 20}, {"age": 80}]})
+    assert len(r.json()["pred_proba"]) == 2
+    assert client.post("/models/nope/predict", json={"features": {}}).status_code == 404
+
+    metrics = client.get("/metrics").text
+    assert 'app_registry_model_requests_total{model="alpha",result="hit"} 2' in metrics
+    assert 'app_registry_model_load_seconds{model="alpha"}' in metrics
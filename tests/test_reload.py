@@ -0,0 +1,119 @@
+# tests/test_reload.py
+"""Background /reload: warm-up validation, atomic snapshot swap, old snapshot kept on failure."""
+from __future__ import annotations
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from joblib import dump
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+for p in (REPO_ROOT, REPO_ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+
+@pytest.fixture()
+def app_and_models(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import Pipeline
+    import train
+    from api import app as A
+
+    rng = np.random.RandomState(0)
+    X = pd.DataFrame({"age": rng.randint(17, 90, 200).astype(float),
+                      "education": rng.choice(["Bachelors", "HS-grad"], 200)})
+    y = (X["age"] > 40).astype(int)
+    paths = []
+    for name, C in (("a.joblib", 1.0), ("b.joblib", 0.01)):
+        pipe = Pipeline([("pre", train.build_preprocessor(X)), ("clf", LogisticRegression(C=C))]).fit(X, y)
+        dump(pipe, tmp_path / name)
+        paths.append(str(tmp_path / name))
+    A.load_model(paths[0])
+    return A, paths, tmp_path
+
+
+def test_failed_load_keeps_current_snapshot(app_and_models):
+    A, paths, tmp_path = app_and_models
+    before = A._snap
+    bad = tmp_path / "broken.joblib"
+    bad.write_bytes(b"not a model")
+    with pytest.raises(Exception):
+        A.load_model(str(bad))
+    assert A._snap is before
+    assert A._infer([{"age": 30}])[0] == "pred_proba"
+
+
+def test_warmup_failure_rejects_model(app_and_models, monkeypatch):
+    A, paths, _ = app_and_models
+    before = A._snap
+    monkeypatch.setattr(A, "_warmup_rows", lambda snap: [{"age": 1}, {"age": 2}])
+    monkeypatch.setattr(A, "_infer", lambda rows, snap=None, record=True: ("pred_proba", np.array([np.nan, 0.5])))
+    with pytest.raises(ValueError):
+        A.load_model(paths[1])
+    assert A._snap is before
+
+
+def test_reload_endpoint_swaps_in_background(app_and_models):
+    from fastapi.testclient import TestClient
+    A, paths, _ = app_and_models
+    old = A._snap
+    with TestClient(A.app) as client:
+        r = client.post("/reload", params={"path": paths[1]})
+        assert r.status_code == 202
+        for _ in range(200):
+            if client.get("/health").json()["reload"]["state"] in ("ok", "failed"):
+                break
+            time.sleep(0.01)
+        health = client.get("/health").json()
+        assert health["reload"]["state"] == "ok"
+        assert health["model"] == "b.joblib" and A._snap is not old
+
+        r = client.post("/reload", params={"path": paths[0], "wait": "true"})
+        assert r.status_code == 200 and r.json()["model"] == "a.joblib"
+        assert r.json()["model_id"] == A._snap.model_id
+
+        r = client.post("/reload", params={"path": paths[0] + ".missing", "wait": "true"})
+        assert r.status_code == 500
+        assert client.get("/health").json()["reload"]["state"] == "failed"
+        assert client.post("/predict", json={"features": {"age": 50}}).status_code == 200
+
+
+def test_warmup_is_not_recorded_in_inference_metrics(app_and_models):
+    A, paths, _ = app_and_models
+    before = A._INFER_ROWS._children[()].snapshot()
+    A.load_model(paths[1])
+    assert A._INFER_ROWS._children[()].snapshot() == before
+
+
+def test_failed_autoload_is_not_retried_until_file_changes(app_and_models, monkeypatch):
+    from fastapi import HTTPException
+    A, paths, tmp_path = app_and_models
+    bad = tmp_path / "broken.joblib"
+    bad.write_bytes(b"not a model")
+    monkeypatch.setattr(A, "_snap", None)
+    monkeypatch.setattr(A, "_autoload", None)
+    monkeypatch.setattr(A, "MODEL_S3_URI", None)
+    monkeypatch.setattr(A, "MODEL_PATH", str(bad))
+    submitted = []
+    real_submit = A._submit_reload
+    monkeypatch.setattr(A, "_submit_reload", lambda t: submitted.append(t) or real_submit(t))
+
+    for _ in range(3):
+        with pytest.raises(HTTPException) as ei:
+            A._require_model()
+        assert ei.value.status_code == 503
+        with pytest.raises(Exception):
+            A._autoload.result(timeout=30)
+    assert len(submitted) == 1 and ei.value.detail == "Model load failed"
+
+    Path(paths[0]).replace(bad)  # 正しいモデルに差し替わる（mtime・サイズが変わる）
+    with pytest.raises(HTTPException):
+        A._require_model()
+    A._autoload.result(timeout=30)
+    assert len(submitted) == 2 and A._snap is not None
@@ -0,0 +1,56 @@
+# tests/test_results.py
+"""Checkpointed search: per-fold results persisted to SQLite and reused by later or overlapping searches."""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+for p in (REPO_ROOT, REPO_ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from results import CheckpointedPipeline, ResultStore  # noqa: E402
+
+
+def _data(n=300, seed=0):
+    rng = np.random.RandomState(seed)
+    X = pd.DataFrame({"a": rng.normal(size=n), "b": rng.normal(size=n)})
+    return X, pd.Series((X["a"] + 0.5 * rng.normal(size=n) > 0).astype(int))
+
+
+def _search(db, X, y, grid):
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.model_selection import GridSearchCV, StratifiedKFold
+    from sklearn.preprocessing import StandardScaler
+
+    store = ResultStore(str(db), ResultStore.context_of(X, y, code=["v1"]))
+    pipe = CheckpointedPipeline([("sc", StandardScaler()), ("clf", LogisticRegression())], checkpoint=store)
+    gs = GridSearchCV(pipe, grid, scoring=store.scorer("roc_auc"), cv=StratifiedKFold(3, shuffle=True, random_state=0))
+    return gs.fit(X, y), store.usage()
+
+
+def test_rerun_reuses_every_fold_with_identical_scores(tmp_path):
+    X, y = _data()
+    grid = {"clf__C": [0.1, 1.0]}
+    first, u1 = _search(tmp_path / "r.sqlite", X, y, grid)
+    second, u2 = _search(tmp_path / "r.sqlite", X, y, grid)
+    assert (u1["fits_computed"], u1["fits_reused"]) == (6, 0)
+    assert (u2["fits_computed"], u2["fits_reused"]) == (0, 6)
+    np.testing.assert_allclose(first.cv_results_["mean_test_score"], second.cv_results_["mean_test_score"])
+    assert type(second.best_estimator_.plain()).__name__ == "Pipeline"
+    assert second.best_estimator_.plain().predict(X).shape == (300,)
+
+
+def test_overlapping_grid_and_other_data(tmp_path):
+    X, y = _data()
+    _search(tmp_path / "r.sqlite", X, y, {"clf__C": [0.1, 1.0]})
+    _, u = _search(tmp_path / "r.sqlite", X, y, {"clf__C": [1.0, 10.0]})
+    assert (u["fits_reused"], u["fits_computed"]) == (3, 3)
+
+    X2, y2 = _data(seed=1)  # 行ラベルは同じでも中身が違えば別の文脈
+    _, u = _search(tmp_path / "r.sqlite", X2, y2, {"clf__C": [1.0]})
+    assert (u["fits_reused"], u["fits_computed"]) == (0, 3)
@@ -0,0 +1,102 @@
+# tests/test_search.py
+"""Pretransform search mode: per-fold preprocessing cache keyed by row indices, shared on disk."""
+from __future__ import annotations
+
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+for p in (REPO_ROOT, REPO_ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+from search import FoldFeatureStore, PretransformedClassifier, row_index  # noqa: E402
+
+
+def _data(n=400, seed=0):
+    rng = np.random.RandomState(seed)
+    X = pd.DataFrame({"age": rng.randint(17, 90, n).astype(float),
+                      "hours": rng.normal(40, 10, n),
+                      "sex": rng.choice(["Male", "Female"], n)})
+    X.loc[rng.rand(n) < 0.1, "hours"] = np.nan
+    y = pd.Series(((X["age"] > 40) ^ (rng.rand(n) < 0.1)).astype(int))
+    return X, y
+
+
+def test_matches_pipeline_and_reuses_fold_entries(tmp_path):
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import Pipeline
+    import train
+
+    X, y = _data()
+    store = FoldFeatureStore.create(X, parent=str(tmp_path))
+    try:
+        tr, te = np.arange(0, 300), np.arange(300, 400)
+        est = PretransformedClassifier(pre=train.build_preprocessor(X), clf=LogisticRegression(), store=store.root)
+        p1 = est.fit(row_index(400)[tr], y.iloc[tr]).predict_proba(row_index(400)[te])
+        ref = Pipeline([("pre", train.build_preprocessor(X)), ("clf", LogisticRegression())]).fit(X.iloc[tr], y.iloc[tr])
+        np.testing.assert_allclose(p1, ref.predict_proba(X.iloc[te]), atol=1e-4)
+
+        est2 = PretransformedClassifier(pre=train.build_preprocessor(X), clf=LogisticRegression(C=0.1),
+                                        store=store.root).fit(row_index(400)[tr], y.iloc[tr])
+        assert est2.key_ == est.key_ and store.entries() == 1  # 同じ学習行なら前処理は使い回す
+        est.fit(row_index(400)[te], y.iloc[te])
+        assert store.entries() == 2
+        assert np.load(os.path.join(store.root, f"{est.key_}.npy")).dtype == np.float32
+    finally:
+        store.close()
+    assert not os.path.exists(store.root)
+
+
+def test_halving_search_fits_preprocessing_once_per_level_and_fold(tmp_path):
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+    from sklearn.model_selection import HalvingGridSearchCV, StratifiedKFold
+    import train
+
+    X, y = _data(600, seed=1)
+    store = FoldFeatureStore.create(X, parent=str(tmp_path))
+    try:
+        search = HalvingGridSearchCV(
+            PretransformedClassifier(pre=train.build_preprocessor(X),
+                                     clf=HistGradientBoostingClassifier(max_iter=20, random_state=0),
+                                     store=store.root),
+            {"clf__max_depth": [2, 3, None], "clf__learning_rate": [0.1, 0.3]},
+            cv=StratifiedKFold(3, shuffle=True, random_state=0), factor=2, scoring="roc_auc", refit=False, n_jobs=2,
+        ).fit(row_index(len(X)), y)
+        assert store.entries() == search.n_iterations_ * 3
+        st = store.stats()  # loky worker の分も集まる
+        # fit + 評価側 + 学習側のスコア（return_train_score の既定は True）で 1 fit あたり 3 回
+        assert st["pre_fits"] == store.entries() and st["hash_calls"] == 3 * sum(search.n_candidates_) * 3
+        assert st["hash_sec"] > 0
+        assert set(search.best_params_) == {"clf__max_depth", "clf__learning_rate"}
+        assert search.best_score_ > 0.8
+    finally:
+        store.close()
+
+
+def test_lock_of_a_dead_worker_is_broken(tmp_path):
+    import subprocess
+    from sklearn.linear_model import LogisticRegression
+    import search
+    import train
+
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    X, y = _data()
+    store = FoldFeatureStore.create(X, parent=str(tmp_path))
+    try:
+        tr = np.arange(0, 300)
+        key, _ = search._key(row_index(400)[tr][:, 0])
+        with open(os.path.join(store.root, f"{key}.lock"), "w") as f:  # fit の途中で落ちた worker の lock
+            f.write(str(dead.pid))
+        est = PretransformedClassifier(pre=train.build_preprocessor(X), clf=LogisticRegression(), store=store.root)
+        est.fit(row_index(400)[tr], y.iloc[tr])
+        assert est.key_ == key and store.entries() == 1 and store.stats()["pre_fits"] == 1
+        assert not os.path.exists(os.path.join(store.root, f"{key}.lock"))
+    finally:
+        store.close()
@@ -0,0 +1,108 @@
+# tests/test_serve.py
+"""Memory-mapped model loading and the prefork launcher sharing one preloaded model across workers."""
+from __future__ import annotations
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from joblib import dump
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+for p in (REPO_ROOT, REPO_ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+HAS_SMAPS = os.path.exists("/proc/self/smaps_rollup")
+
+
+def _hgb_model(path: Path) -> str:
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    from sklearn.pipeline import Pipeline
+    import train
+
+    rng = np.random.RandomState(0)
+    X = pd.DataFrame({"age": rng.randint(17, 90, 300).astype(float),
+                      "sex": rng.choice(["Male", "Female"], 300)})
+    pipe = Pipeline([("pre", train.build_preprocessor(X)),
+                     ("clf", HistGradientBoostingClassifier(max_iter=10))]).fit(X, (X["age"] > 40).astype(int))
+    dump(pipe, path)
+    return str(path)
+
+
+def test_mmap_load_maps_model_and_flat_arrays(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from api import app as A
+
+    path = _hgb_model(tmp_path / "m.joblib")
+    rows = [{"age": 30, "sex": "Male"}, {"age": 70, "sex": "Female"}, {}]
+    A.load_model(path)
+    expected = A._infer(rows)[1]
+
+    monkeypatch.setattr(A, "MODEL_MMAP", True)
+    A.load_model(path)
+    flat_cache = tmp_path / "m.joblib.flat"
+    assert flat_cache.exists()
+    assert isinstance(A._snap.flat.value, np.memmap)
+    np.testing.assert_allclose(A._infer(rows)[1], expected)
+
+    mtime = flat_cache.stat().st_mtime_ns
+    A.load_model(path)  # 2 回目は書き出し済みの .flat を写像するだけ
+    assert flat_cache.stat().st_mtime_ns == mtime
+    np.testing.assert_allclose(A._infer(rows)[1], expected)
+
+
+@pytest.mark.skipif(not HAS_SMAPS, reason="needs /proc/<pid>/smaps_rollup")
+def test_memory_report_has_rss_and_pss():
+    from api.serve import memory_report
+
+    rep = memory_report([os.getpid()])
+    w = rep["workers"][0]
+    assert w["pid"] == os.getpid() and w["rss"] >= w["pss"] > 0
+    assert rep["total_pss"] >= w["pss"] + rep["parent"]["pss"] - 1
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="prefork needs fork()")
+def test_prefork_workers_share_preloaded_model(tmp_path):
+    path = _hgb_model(tmp_path / "m.joblib")
+    port = _free_port()
+    env = {**os.environ, "MODEL_PATH": path, "PYTHONPATH": str(REPO_ROOT), "MEMORY_REPORT_SEC": "0"}
+    proc = subprocess.Popen([sys.executable, "-m", "api.serve", "--workers", "2", "--host", "127.0.0.1",
+                             "--port", str(port), "--log-level", "warning"],
+                            cwd=tmp_path, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        seen = {}
+        deadline = time.time() + 60
+        while time.time() < deadline and len(seen) < 2:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=2) as r:
+                    h = json.load(r)
+                seen[h["pid"]] = h["model_id"]
+            except OSError:
+                time.sleep(0.2)
+        assert len(seen) >= 1 and proc.pid not in seen
+        # 親で 1 回ロードしたスナップショットを継承しているので、どの worker も同じ model_id（読み直していない）
+        assert set(seen.values()) == {"m.joblib#1"}
+        # /reload は受けた worker だけ差し替わってしまうので断る
+        req = urllib.request.Request(f"http://127.0.0.1:{port}/reload", method="POST")
+        with pytest.raises(urllib.error.HTTPError) as ei:
+            urllib.request.urlopen(req, timeout=5)
+        assert ei.value.code == 409
+    finally:
+        proc.terminate()
+        assert proc.wait(timeout=20) == 0
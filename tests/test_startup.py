@@ -0,0 +1,70 @@
+# tests/test_startup.py
+"""Fast start: heavy imports deferred, background warm load, /readyz vs /healthz, time-to-first-prediction."""
+from __future__ import annotations
+
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from joblib import dump
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+for p in (REPO_ROOT, REPO_ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+
+def test_app_import_defers_heavy_modules():
+    code = ("import sys, api.app; "
+            "print(','.join(m for m in ('sklearn', 'pandas', 'joblib', 'boto3', 'botocore', 'pyarrow') "
+            "if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ""
+
+
+def test_fast_start_readyz_turns_ready_after_warm_load(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from fastapi.testclient import TestClient
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import Pipeline
+    import train
+    from api import app as A
+
+    rng = np.random.RandomState(0)
+    X = pd.DataFrame({"age": rng.randint(17, 90, 200).astype(float),
+                      "sex": rng.choice(["Male", "Female"], 200)})
+    pipe = Pipeline([("pre", train.build_preprocessor(X)),
+                     ("clf", LogisticRegression())]).fit(X, (X["age"] > 40).astype(int))
+    dump(pipe, tmp_path / "m.joblib")
+
+    monkeypatch.setattr(A, "_snap", None)
+    monkeypatch.setattr(A, "MODEL_PATH", str(tmp_path / "m.joblib"))
+    monkeypatch.setattr(A, "FAST_START", True)
+    monkeypatch.setattr(A, "_first_pred_pending", True)
+    monkeypatch.setattr(A, "_autoload", None)
+    gate = threading.Event()
+    real_load = A.load_model
+    monkeypatch.setattr(A, "load_model", lambda path: (gate.wait(10), real_load(path))[1])
+
+    with TestClient(A.app) as client:  # startup はロードを待たずに返る
+        assert client.get("/healthz").status_code == 200
+        r = client.get("/readyz")
+        assert r.status_code == 503 and r.json()["ready"] is False
+        assert client.post("/predict", json={"features": {"age": 30}}).status_code == 503
+        assert A._autoload is not None and not A._autoload.done()  # 起動時の 1 本だけ
+        gate.set()
+        deadline = time.time() + 10
+        while client.get("/readyz").status_code != 200 and time.time() < deadline:
+            time.sleep(0.02)
+        assert client.get("/readyz").json()["ready"] is True
+        assert client.post("/predict", json={"features": {"age": 30, "sex": "Male"}}).status_code == 200
+        text = client.get("/metrics").text
+    assert not A._first_pred_pending
+    assert "app_time_to_first_prediction_seconds" in text and "process_start_time_seconds" in text
+    value = next(float(line.split()[1]) for line in text.splitlines()
+                 if line.startswith("app_time_to_first_prediction_seconds "))
+    assert value > 0
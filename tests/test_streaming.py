@@ -0,0 +1,88 @@
+# tests/test_streaming.py
+"""/predict_stream: NDJSON and Arrow IPC input are processed in bounded chunks, in order."""
+from __future__ import annotations
+
+import io
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from joblib import dump
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+for p in (REPO_ROOT, REPO_ROOT / "src"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
+
+
+@pytest.fixture()
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from fastapi.testclient import TestClient
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import Pipeline
+    import train
+    from api import app as A
+
+    rng = np.random.RandomState(0)
+    X = pd.DataFrame({"age": rng.randint(17, 90, 200).astype(float),
+                      "sex": rng.choice(["Male", "Female"], 200)})
+    pipe = Pipeline([("pre", train.build_preprocessor(X)), ("clf", LogisticRegression())])
+    pipe.fit(X, (X["age"] > 40).astype(int))
+    dump(pipe, tmp_path / "m.joblib")
+    A.load_model(str(tmp_path / "m.joblib"))
+
+    sizes = []
+    real_infer = A._infer
+
+    def counting_infer(rows, snap=None):
+        sizes.append(len(rows))
+        return real_infer(rows, snap)
+
+    monkeypatch.setattr(A, "_infer", counting_infer)
+    monkeypatch.setattr(A, "STREAM_CHUNK_ROWS", 100)
+    return TestClient(A.app), sizes, A
+
+
+def test_ndjson_stream_in_chunks(client):
+    c, sizes, A = client
+    rows = [{"age": float(a), "sex": "Male"} for a in range(20, 90)] * 5  # 350 行
+    lines = [json.dumps(r) for r in rows]
+    lines[7] = "{not json"
+    lines[8] = "[1, 2]"
+    body = "\n".join(lines).encode()
+
+    r = c.post("/predict_stream", content=body, headers={"content-type": "application/x-ndjson"})
+    assert r.status_code == 200 and r.headers["content-type"].startswith("application/x-ndjson")
+    out = [json.loads(line) for line in r.text.splitlines()]
+    summary = out.pop()["summary"]
+    assert len(out) == 350 and summary["rows"] == 350 and summary["errors"] == 2
+    assert summary["rows_per_sec"] > 0
+    assert "error" in out[7] and "error" in out[8]
+    expected = A._infer(rows[:7])[1]
+    np.testing.assert_allclose([o["pred_proba"] for o in out[:7]], expected)
+    assert max(sizes) <= 100
+
+
+def test_arrow_stream_roundtrip(client):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.ipc  # noqa: F401
+    c, sizes, A = client
+    df = pd.DataFrame({"age": np.arange(250, dtype=float) % 70 + 20, "sex": ["Female"] * 250})
+    sink = io.BytesIO()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.ipc.new_stream(sink, table.schema) as w:
+        for batch in table.to_batches(max_chunksize=120):
+            w.write_batch(batch)
+
+    r = c.post("/predict_stream", content=sink.getvalue(),
+               headers={"content-type": "application/vnd.apache.arrow.stream"})
+    assert r.status_code == 200
+    got = pa.ipc.open_stream(r.content).read_all()
+    assert got.column_names == ["pred_proba"] and got.num_rows == 250
+    rows = df.to_dict(orient="records")
+    np.testing.assert_allclose(got.column(0).to_numpy(), A._infer(rows)[1])
+    assert max(sizes[:-1]) <= 100
@@ -109,6 +109,43 @@ def test_train_builtin_fast(tmp_path: Path, capsys):
     assert summary["auc"] >= 0.95
 
 
+def test_native_encoding_and_compare(tmp_path: Path):
+    """
+    native: categorical_features are the leading (ordinal) columns of the preprocessor,
+    and categorical.compare reports both encodings without refitting the native model.
+    """
+    import numpy as np
+    import pandas as pd
+    from sklearn.pipeline import Pipeline
+
+    train = _import_train_module()
+    rng = np.random.RandomState(0)
+    n = 400
+    X = pd.DataFrame({"age": rng.randint(17, 90, n).astype(float),
+                      "sex": rng.choice(["Male", "Female"], n),
+                      "hours": rng.normal(40, 10, n),
+                      "country": rng.choice(["US", "Mexico", "Japan"], n)})
+    y = ((X["age"] > 45) ^ (rng.rand(n) < 0.2)).astype(int)
+
+    pre = train.build_preprocessor(X, "native").fit(X)
+    clf = train.build_classifier(X, "native")
+    names = list(pre.get_feature_names_out())
+    assert clf.categorical_features == [0, 1]
+    assert [c.split("__", 1)[1] for c in names[:2]] == ["sex", "country"]
+    assert all(c.startswith("cat__") for c in names[:2]) and not any(c.startswith("cat__") for c in names[2:])
+
+    Xtr, ytr, Xte, yte = X.iloc[:300], y.iloc[:300], X.iloc[300:], y.iloc[300:]
+    params = {"clf__max_iter": 20}
+    model = Pipeline([("pre", pre), ("clf", clf)]).set_params(**params).fit(Xtr, ytr)
+    out = train.compare_encodings(X, model, 1.234, Xtr, ytr, Xte, yte, params, seed=42)
+    assert set(out) == {"native", "onehot"}
+    keys = {"fit_sec", "fit_threads", "model_bytes", "n_features", "predict_ms_1", "predict_ms_1024", "auc"}
+    assert set(out["native"]) == keys and set(out["onehot"]) == keys
+    assert out["native"]["fit_sec"] == 1.23  # the native model is reused as-is, not refit
+    assert out["native"]["fit_threads"] == out["onehot"]["fit_threads"] == 1  # both fits under the same limit
+    assert out["native"]["n_features"] == 4 and out["onehot"]["n_features"] > 4
+
+
 @pytest.mark.slow
 @pytest.mark.skipif(os.environ.get("RUN_SLOW") != "1", reason="set RUN_SLOW=1 to enable slow test")
 def test_train_adult_full(tmp_path: Path):